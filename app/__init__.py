@@ -1,6 +1,9 @@
+import os
+import threading
 from flask import Flask
 from .routes import main
 from .client import get_weaviate_client 
+from .handlers import warm_caches
 from flask_cors import CORS
 
 def create_app():
@@ -19,4 +22,8 @@ def create_app():
     app.register_blueprint(main)
     app.weaviate_client = get_weaviate_client()
 
+    # Fill the recommendation cache without delaying startup
+    if os.getenv("WARM_CACHES", "1") == "1":
+        threading.Thread(target=warm_caches, name="cache-warmup", daemon=True).start()
+
     return app
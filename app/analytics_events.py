@@ -0,0 +1,353 @@
+import os
+import time
+import queue
+import secrets
+import atexit
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+import psycopg2.extras
+from app.db_pool import get_cursor, with_reconnect
+from app.concurrency import CONCURRENT_IO
+from app.analytics_spool import AnalyticsSpool, open_spool
+
+# Events held in memory waiting to be written; publishers wait briefly, then drop
+ANALYTICS_QUEUE_SIZE = int(os.getenv("ANALYTICS_QUEUE_SIZE", "10000"))
+# Write as soon as this many events are queued ...
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "500"))
+# ... or this many seconds after the first one arrived
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "2"))
+# Seconds a publisher blocks on a full queue before the event is dropped
+ANALYTICS_ENQUEUE_TIMEOUT = float(os.getenv("ANALYTICS_ENQUEUE_TIMEOUT", "0.05"))
+# The writer fsyncs the spool at most this often (one fsync covers every event since the last)
+ANALYTICS_SPOOL_SYNC_INTERVAL = float(os.getenv("ANALYTICS_SPOOL_SYNC_INTERVAL", "0.2"))
+# Seconds allowed for writing what is left when the worker shuts down
+ANALYTICS_DRAIN_TIMEOUT = float(os.getenv("ANALYTICS_DRAIN_TIMEOUT", "5"))
+
+
+# Session ids: milliseconds since this epoch, shifted left by SESSION_ID_RANDOM_BITS
+SESSION_ID_EPOCH_MS = 1704067200000  # 2024-01-01
+SESSION_ID_RANDOM_BITS = 12
+
+
+def new_session_id() -> int:
+    """
+    A time-ordered session id made in process, without a database round trip.
+    41 bits of milliseconds plus 12 random bits: 53 bits in total, so ids
+    stay exact in JavaScript and Google Sheets, sort by creation time, and
+    never collide with the old serial ids.
+    """
+    millis = int(time.time() * 1000) - SESSION_ID_EPOCH_MS
+    return (millis << SESSION_ID_RANDOM_BITS) | secrets.randbits(SESSION_ID_RANDOM_BITS)
+
+
+class SessionStart(NamedTuple):
+    session_id: int
+    user_id: str
+    created_at: Optional[datetime] = None
+
+
+class ProductInteraction(NamedTuple):
+    user_id: str
+    session_id: Optional[int]
+    product_name: str
+    product_category: str
+    stage: str
+    user_goal: Optional[str] = None
+    user_preference: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+class UserGoals(NamedTuple):
+    user_id: str
+    session_id: Optional[int]
+    health_goal: str
+    medical_condition: Optional[str] = None
+    supplement_preference: Optional[str] = None
+    pueblo: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+
+class LocationSearch(NamedTuple):
+    pueblo: str
+    pharmacy_name: Optional[str] = None
+    successful: bool = True
+    created_at: Optional[datetime] = None
+
+
+class SessionEnd(NamedTuple):
+    session_id: Optional[int]
+    created_at: Optional[datetime] = None
+
+
+# (statement, template, row builder) per event type, in the order a batch is written.
+# Sessions are opened first and closed last, around the rows that reference them.
+EVENT_WRITERS = {
+    SessionStart: ("""
+        INSERT INTO user_sessions (id, user_id, session_start)
+        VALUES %s
+        ON CONFLICT (id) DO NOTHING
+    """, None, lambda e: tuple(e)),
+    ProductInteraction: ("""
+        INSERT INTO product_interactions (
+            user_id, session_id, product_name, product_category, stage, user_goal, user_preference, created_at
+        ) VALUES %s
+    """, None, lambda e: tuple(e)),
+    UserGoals: ("""
+        INSERT INTO user_goals (
+            user_id, session_id, health_goal, medical_condition, supplement_preference, pueblo, created_at
+        ) VALUES %s
+    """, None, lambda e: tuple(e)),
+    LocationSearch: ("""
+        INSERT INTO location_analytics (pueblo, pharmacy_name, last_searched, interaction_time)
+        VALUES %s
+    """, None, lambda e: (e.pueblo, e.pharmacy_name, e.created_at, e.created_at)),
+    SessionEnd: ("""
+        UPDATE user_sessions AS s
+        SET session_end = v.session_end, completed_journey = TRUE
+        FROM (VALUES %s) AS v(id, session_end)
+        WHERE s.id = v.id
+    """, "(%s::bigint, %s::timestamp)", lambda e: (e.session_id, e.created_at)),
+}
+
+
+def product_recommendation_events(user_id: str, session_id, products: List[Dict], stage: str, context: Dict = None) -> List[ProductInteraction]:
+    """One ProductInteraction per recommended product"""
+    return [
+        ProductInteraction(
+            user_id=user_id,
+            session_id=session_id,
+            product_name=product.get("name", "Unknown"),
+            product_category=product.get("category", "Unknown"),
+            stage=stage,
+            user_goal=context.get("health_goal") if context else None,
+            user_preference=context.get("preference") if context else None
+        )
+        for product in products
+    ]
+
+
+@with_reconnect
+def write_events(events: List[NamedTuple]):
+    """Write a batch in one transaction: one multi-row statement per event type"""
+    by_type: Dict[type, List[tuple]] = {}
+    for event in events:
+        by_type.setdefault(type(event), []).append(event)
+
+    with get_cursor() as cursor:
+        for event_type, (statement, template, to_row) in EVENT_WRITERS.items():
+            rows = by_type.get(event_type)
+            if rows:
+                psycopg2.extras.execute_values(
+                    cursor, statement, [to_row(e) for e in rows], template=template, page_size=1000
+                )
+            if event_type is SessionStart:
+                _ensure_sessions(cursor, by_type)
+
+
+def _ensure_sessions(cursor, by_type: Dict[type, List[tuple]]):
+    """
+    session_id references user_sessions (see app.migrations). If a session's
+    SessionStart was lost (dropped on a full queue), open the session from
+    the events that reference it so the batch still satisfies the foreign key.
+    """
+    sessions = {}
+    for event in by_type.get(ProductInteraction, []) + by_type.get(UserGoals, []):
+        if event.session_id is not None:
+            sessions.setdefault(event.session_id, (event.session_id, event.user_id, event.created_at))
+    if sessions:
+        psycopg2.extras.execute_values(cursor, """
+            INSERT INTO user_sessions (id, user_id, session_start)
+            VALUES %s
+            ON CONFLICT (id) DO NOTHING
+        """, list(sessions.values()), template="(%s, %s, COALESCE(%s, NOW()))", page_size=1000)
+
+
+class EventBus:
+    """
+    Bounded in-process queue of analytics events with one background writer.
+    Publishing never touches the database or the disk. The writer appends
+    what it picks up to the spool (see app.analytics_spool) and replays
+    sealed segments into Postgres once ANALYTICS_BATCH_SIZE events or
+    ANALYTICS_FLUSH_INTERVAL seconds have accumulated, backing off while
+    Postgres is failing. A full queue makes publishers wait up to
+    ANALYTICS_ENQUEUE_TIMEOUT (backpressure) and then drops the event.
+    Without a usable spool directory batches are kept in memory instead.
+    """
+
+    def __init__(self, spool: Optional[AnalyticsSpool] = None):
+        self._queue: queue.Queue = queue.Queue(maxsize=ANALYTICS_QUEUE_SIZE)
+        self._spool = spool
+        # Events not yet written when there is no spool (guarded by _write_lock)
+        self._pending: List[NamedTuple] = []
+        self._deadline = 0.0
+        self._retry_at = 0.0
+        self._next_scan = 0.0
+        self._failures = 0
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.stats = {
+            "published": 0, "spooled": 0, "written": 0, "batches": 0, "overflow": 0, "dropped": 0,
+            "spool_errors": 0, "write_errors": 0, "last_batch_size": 0, "last_batch_ms": 0.0
+        }
+
+    def publish(self, *events: NamedTuple):
+        if not events:
+            return
+        now = datetime.utcnow()
+        events = [e if e.created_at else e._replace(created_at=now) for e in events]
+
+        if not CONCURRENT_IO or self._stopping.is_set():
+            self.stats["published"] += len(events)
+            with self._write_lock:
+                self._accept(events)
+                self._write_due(force=True)
+            return
+
+        self._ensure_started()
+        for event in events:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self.stats["overflow"] += 1
+                try:
+                    self._queue.put(event, timeout=ANALYTICS_ENQUEUE_TIMEOUT)
+                except queue.Full:
+                    self.stats["dropped"] += 1
+                    continue
+            self.stats["published"] += 1
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+                self._thread.start()
+
+    def _take(self, first_timeout: float) -> List[NamedTuple]:
+        """Wait for one event (up to first_timeout), then grab whatever else is queued"""
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=first_timeout) if first_timeout else self._queue.get_nowait())
+        except queue.Empty:
+            return batch
+        while len(batch) < ANALYTICS_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            events = self._take(ANALYTICS_SPOOL_SYNC_INTERVAL)
+            with self._write_lock:
+                if events:
+                    self._accept(events)
+                self._write_due()
+
+    def _accept(self, events: List[NamedTuple]):
+        """Make events durable in the spool, or hold them in memory; caller holds _write_lock"""
+        if self._spool is not None:
+            try:
+                self._spool.append(events)
+                self.stats["spooled"] += len(events)
+                return
+            except Exception as e:
+                self.stats["spool_errors"] += 1
+                print(f"❌ Could not spool {len(events)} analytics events, keeping them in memory: {str(e)}")
+        if not self._pending:
+            self._deadline = time.monotonic() + ANALYTICS_FLUSH_INTERVAL
+        self._pending.extend(events)
+        overflow = max(0, len(self._pending) - ANALYTICS_QUEUE_SIZE)
+        if overflow:
+            self.stats["dropped"] += overflow
+            del self._pending[:overflow]
+
+    def _write_due(self, force: bool = False):
+        """Seal and replay the spool and write in-memory events when a threshold is reached"""
+        now = time.monotonic()
+        sealed = False
+        if self._spool is not None and self._spool.open_events and (
+            force or self._spool.open_events >= ANALYTICS_BATCH_SIZE or self._spool.open_age >= ANALYTICS_FLUSH_INTERVAL
+        ):
+            try:
+                self._spool.seal()
+                sealed = True
+            except OSError as e:
+                self.stats["spool_errors"] += 1
+                print(f"❌ Could not seal analytics spool segment: {str(e)}")
+        if not force and now < self._retry_at:
+            return
+
+        started = time.perf_counter()
+        try:
+            # Also look for segments left by other workers or an earlier run now and then
+            if self._spool is not None and (force or sealed or now >= self._next_scan):
+                self._next_scan = now + ANALYTICS_FLUSH_INTERVAL
+                segments, events = self._spool.replay(write_events)
+                if segments:
+                    self._record_batch(events, started)
+            if self._pending and (force or len(self._pending) >= ANALYTICS_BATCH_SIZE or now >= self._deadline):
+                batch = self._pending
+                write_events(batch)
+                self._pending = []
+                self._record_batch(len(batch), started)
+            self._failures = 0
+        except Exception as e:
+            self.stats["write_errors"] += 1
+            self._failures += 1
+            # Back off while Postgres is down; events wait in the spool (or memory)
+            self._retry_at = now + ANALYTICS_FLUSH_INTERVAL * min(2 ** self._failures, 60)
+            print(f"❌ Analytics write failed, retrying in {round(self._retry_at - now, 1)}s: {str(e)}")
+
+    def _record_batch(self, size: int, started: float):
+        self.stats["written"] += size
+        self.stats["batches"] += 1
+        self.stats["last_batch_size"] = size
+        self.stats["last_batch_ms"] = round(1000 * (time.perf_counter() - started), 1)
+
+    def flush(self) -> bool:
+        """Write everything published so far from the calling thread"""
+        with self._write_lock:
+            while True:
+                events = self._take(0)
+                if not events:
+                    break
+                self._accept(events)
+            self._write_due(force=True)
+            return not self._pending and not (self._spool and self._spool.sealed_segments())
+
+    def shutdown(self, timeout: float = ANALYTICS_DRAIN_TIMEOUT):
+        """Stop the writer and drain the queue; called when the worker exits"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if not self.flush():
+            where = "spooled for the next start" if not self._pending else "lost"
+            print(f"⚠️ Analytics shutdown could not reach Postgres; unwritten events {where}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "queued": self._queue.qsize(),
+            "pending": len(self._pending),
+            "spool_segments": len(self._spool.sealed_segments()) if self._spool else None,
+            "spool_quarantined": self._spool.stats["quarantined"] if self._spool else None
+        }
+
+
+analytics_bus = EventBus(open_spool({t.__name__: t for t in EVENT_WRITERS}))
+atexit.register(analytics_bus.shutdown)
+
+
+def publish(*events: NamedTuple):
+    """Queue analytics events for the background writer"""
+    analytics_bus.publish(*events)
+
+
+def get_analytics_stats() -> Dict[str, Any]:
+    return analytics_bus.get_stats()
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import fcntl
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import psycopg2
+
+# Analytics events are appended here before they reach Postgres
+ANALYTICS_SPOOL_DIR = os.getenv("ANALYTICS_SPOOL_DIR", ".spool")
+
+OPEN_SUFFIX = ".open"
+SEALED_SUFFIX = ".seg"
+# Segments Postgres rejects for their content; kept for inspection, never replayed
+QUARANTINE_SUFFIX = ".bad"
+# Errors that replaying the same events again won't fix
+PERMANENT_ERRORS = (psycopg2.IntegrityError, psycopg2.DataError)
+
+
+def encode_event(event: NamedTuple) -> str:
+    fields = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in event._asdict().items()}
+    return json.dumps({"type": type(event).__name__, "fields": fields}, ensure_ascii=False)
+
+
+def decode_event(line: str, event_types: Dict[str, type]) -> NamedTuple:
+    record = json.loads(line)
+    fields = record["fields"]
+    if fields.get("created_at"):
+        fields["created_at"] = datetime.fromisoformat(fields["created_at"])
+    return event_types[record["type"]](**fields)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class AnalyticsSpool:
+    """
+    Append-only segment files for analytics events.
+
+    Events are appended as JSON lines to this process's open segment and
+    fsynced once per append call, so one fsync covers everything the writer
+    picked up since the last one. Full or old segments are sealed (renamed
+    to .seg) and replayed into Postgres oldest first; a segment is deleted
+    only after its transaction committed. Delivery is at-least-once: a crash
+    between the commit and the delete replays that segment again.
+    Several workers can share the directory; each segment is replayed under
+    an exclusive flock by one of them. A segment Postgres rejects outright
+    (constraint or data errors) is renamed to .bad so it doesn't block the
+    ones after it.
+    """
+
+    def __init__(self, directory: str, event_types: Dict[str, type]):
+        self.directory = directory
+        self.event_types = event_types
+        os.makedirs(directory, exist_ok=True)
+        self._file = None
+        self._path: Optional[str] = None
+        self._opened_at = 0.0
+        self._count = 0
+        self._sequence = 0
+        self.stats = {"quarantined": 0, "quarantined_events": 0}
+        self._adopt_orphans()
+
+    def _adopt_orphans(self):
+        """Seal open segments left behind by processes that are no longer running"""
+        for name in os.listdir(self.directory):
+            if not name.endswith(OPEN_SUFFIX):
+                continue
+            try:
+                pid = int(name.split("-")[1])
+            except (IndexError, ValueError):
+                continue
+            if pid != os.getpid() and not _pid_alive(pid):
+                path = os.path.join(self.directory, name)
+                os.replace(path, path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+                print(f"📥 Recovered analytics spool segment {name}")
+
+    @property
+    def open_events(self) -> int:
+        return self._count
+
+    @property
+    def open_age(self) -> float:
+        return time.monotonic() - self._opened_at if self._file else 0.0
+
+    def append(self, events: List[NamedTuple]):
+        """Durably append events to the open segment (one write + one fsync)"""
+        if self._file is None:
+            self._sequence += 1
+            # Names sort by creation time, so replay keeps the publish order
+            name = f"{time.time_ns():020d}-{os.getpid()}-{self._sequence:06d}{OPEN_SUFFIX}"
+            self._path = os.path.join(self.directory, name)
+            self._file = open(self._path, "a", encoding="utf-8")
+            self._opened_at = time.monotonic()
+        self._file.write("".join(encode_event(e) + "\n" for e in events))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._count += len(events)
+
+    def seal(self):
+        """Close the open segment and make it available for replay"""
+        if self._file is None:
+            return
+        self._file.close()
+        os.replace(self._path, self._path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+        self._file, self._path, self._count = None, None, 0
+
+    def sealed_segments(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(SEALED_SUFFIX))
+
+    def _read(self, path: str) -> List[NamedTuple]:
+        events = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(decode_event(line, self.event_types))
+                except (ValueError, KeyError, TypeError) as e:
+                    # A torn last line from a crash mid-write
+                    print(f"⚠️ Skipping unreadable analytics event in {os.path.basename(path)}: {str(e)}")
+        return events
+
+    def replay(self, write: Callable[[List[NamedTuple]], None], max_segments: int = 50) -> Tuple[int, int]:
+        """
+        Write sealed segments with `write`, oldest first, deleting each one
+        after it succeeds. A segment failing with one of PERMANENT_ERRORS is
+        quarantined and replay moves on; any other failure (Postgres down)
+        stops replay and is raised, so order is kept. Returns (segments,
+        events) replayed.
+        """
+        segments = replayed = 0
+        for name in self.sealed_segments()[:max_segments]:
+            path = os.path.join(self.directory, name)
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # another worker is replaying it
+                if os.fstat(fd).st_nlink == 0:
+                    continue  # replayed and deleted while we waited
+                events = self._read(path)
+                if events:
+                    try:
+                        write(events)
+                    except PERMANENT_ERRORS as e:
+                        os.replace(path, path[:-len(SEALED_SUFFIX)] + QUARANTINE_SUFFIX)
+                        self.stats["quarantined"] += 1
+                        self.stats["quarantined_events"] += len(events)
+                        print(f"❌ Quarantined analytics spool segment {name} ({len(events)} events): "
+                              f"{str(e).splitlines()[0]}")
+                        continue
+                os.unlink(path)
+            finally:
+                os.close(fd)
+            segments += 1
+            replayed += len(events)
+        return segments, replayed
+
+    def close(self):
+        self.seal()
+
+
+def open_spool(event_types: Dict[str, type]) -> Optional[AnalyticsSpool]:
+    """The spool, or None (events stay in memory) if the directory is unusable"""
+    if not ANALYTICS_SPOOL_DIR:
+        return None
+    try:
+        return AnalyticsSpool(ANALYTICS_SPOOL_DIR, event_types)
+    except OSError as e:
+        print(f"⚠️ Analytics spool unavailable, buffering in memory only: {str(e)}")
+        return None
@@ -0,0 +1,110 @@
+import os
+import time
+import threading
+from typing import Callable, Iterable, List, Optional
+from app.db_pool import get_cursor, with_reconnect
+
+COLLECTION_NAME = "Supplements"
+# Properties every product must have when it is added
+REQUIRED_PRODUCT_FIELDS = [
+    "nombre", "precio", "inventario", "categoria", "descripcion", "ingredientes",
+    "allergens", "usage", "recommended_for", "link", "image"
+]
+# How often (seconds) a worker polls the shared version for changes made elsewhere
+CATALOGUE_VERSION_CHECK_INTERVAL = float(os.getenv("CATALOGUE_VERSION_CHECK_INTERVAL", "30"))
+
+# Callbacks run when the Supplements collection changes. They receive the
+# uuids that changed, or None when anything may have changed (e.g. a sheet sync).
+_listeners: List[Callable[[Optional[List[str]]], None]] = []
+_version_lock = threading.Lock()
+_seen_version: Optional[int] = None
+_last_check = 0.0
+
+
+def create_data_versions_table(cursor=None):
+    """Create the table holding change counters for shared reference data"""
+    with get_cursor(cursor) as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS data_versions (
+                name TEXT PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """)
+    print("data_versions table ready!")
+
+
+@with_reconnect
+def get_data_version(name: str) -> int:
+    with get_cursor() as cursor:
+        cursor.execute("SELECT version FROM data_versions WHERE name = %s", (name,))
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+@with_reconnect
+def bump_data_version(name: str, cursor=None) -> int:
+    """Increment a shared version so every worker notices the change"""
+    with get_cursor(cursor) as cursor:
+        cursor.execute("""
+            INSERT INTO data_versions (name, version, updated_at)
+            VALUES (%s, 1, NOW())
+            ON CONFLICT (name) DO UPDATE
+            SET version = data_versions.version + 1, updated_at = NOW()
+            RETURNING version
+        """, (name,))
+        return cursor.fetchone()[0]
+
+
+def on_catalogue_change(callback: Callable[[Optional[List[str]]], None]):
+    """Register a cache to be refreshed or invalidated when the catalogue changes"""
+    _listeners.append(callback)
+    return callback
+
+
+def _notify_listeners(uuids: Optional[List[str]]):
+    for callback in _listeners:
+        try:
+            callback(uuids)
+        except Exception as e:
+            print(f"❌ Catalogue listener {callback.__name__} failed: {str(e)}")
+
+
+def notify_catalogue_change(uuids: Optional[Iterable[str]] = None):
+    """
+    Call after writing to the Supplements collection. Local caches are told
+    right away; other workers and processes see the version bump on their
+    next check_catalogue_version().
+    """
+    global _seen_version
+    uuids = [str(uuid) for uuid in uuids] if uuids is not None else None
+    _notify_listeners(uuids)
+    try:
+        version = bump_data_version("catalogue")
+        with _version_lock:
+            _seen_version = version
+    except Exception as e:
+        print(f"⚠️ Could not bump catalogue version: {str(e)}")
+
+
+def check_catalogue_version(force: bool = False):
+    """Invalidate local caches if another process changed the catalogue (rate limited)"""
+    global _seen_version, _last_check
+    now = time.monotonic()
+    with _version_lock:
+        if not force and now - _last_check < CATALOGUE_VERSION_CHECK_INTERVAL:
+            return
+        _last_check = now
+
+    try:
+        version = get_data_version("catalogue")
+    except Exception as e:
+        print(f"⚠️ Could not read catalogue version: {str(e)}")
+        return
+
+    with _version_lock:
+        changed = _seen_version is not None and version != _seen_version
+        _seen_version = version
+    if changed:
+        print(f"🔄 Catalogue changed elsewhere (version {version}), invalidating caches")
+        _notify_listeners(None)
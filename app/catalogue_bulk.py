@@ -0,0 +1,217 @@
+import os
+import json
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+from weaviate.classes.query import Filter
+from app.catalogue import COLLECTION_NAME, REQUIRED_PRODUCT_FIELDS, notify_catalogue_change
+from app.catalogue_identity import catalogue_uuid, legacy_names
+from app.catalogue_sync import (
+    FINGERPRINT_PROPERTY, delete_objects, ensure_fingerprint_property, plain_vector,
+    stored_fingerprint, upsert_objects, vector_fingerprint, vectorized_fields,
+)
+
+# Operations resolved, written and reported together; results stream back per chunk
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+# Most objects one `where` operation may touch
+BULK_WHERE_LIMIT = 10000
+
+OPS = ("insert", "update", "delete")
+
+
+class BulkOp(NamedTuple):
+    line: int
+    op: str
+    nombre: Optional[str] = None
+    where: Optional[Dict[str, Any]] = None
+    item: Optional[Dict[str, Any]] = None
+    changes: Optional[Dict[str, Any]] = None
+
+
+def parse_op(line: int, entry: Any, default_op: Optional[str] = None) -> BulkOp:
+    """
+    One operation, in full form:
+        {"op": "insert", "item": {...}}
+        {"op": "update", "nombre": "...", "set": {...}}   or "where": {"categoria": "..."}
+        {"op": "delete", "nombre": "..."}                 or "where": {...}
+    Without "op", `default_op` applies and the line is the item itself
+    (insert), the nombre plus the fields to set (update), or {"nombre"} /
+    {"where"} (delete). Raises ValueError when the entry is invalid.
+    """
+    if not isinstance(entry, dict):
+        raise ValueError("each operation must be a JSON object")
+    op = entry.get("op", default_op)
+    if op not in OPS:
+        raise ValueError(f"op must be one of {OPS}")
+    explicit = "op" in entry
+
+    where = entry.get("where")
+    if where is not None and (not isinstance(where, dict) or not where or not all(k.isidentifier() for k in where)):
+        raise ValueError("where must map property names to values")
+
+    if op == "insert":
+        item = entry.get("item") if explicit else entry
+        if not isinstance(item, dict):
+            raise ValueError("insert needs an item")
+        missing = [field for field in REQUIRED_PRODUCT_FIELDS if field not in item]
+        if missing:
+            raise ValueError(f"Missing fields: {', '.join(missing)}")
+        return BulkOp(line, op, nombre=item["nombre"], item=item)
+
+    nombre = entry.get("nombre")
+    if (nombre is None) == (where is None):
+        raise ValueError(f"{op} needs either nombre or where")
+    if op == "delete":
+        return BulkOp(line, op, nombre=nombre, where=where)
+
+    changes = entry.get("set") if explicit else {k: v for k, v in entry.items() if k not in ("nombre", "where")}
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError("update needs fields to set")
+    if "nombre" in changes or FINGERPRINT_PROPERTY in changes:
+        raise ValueError(f"nombre and {FINGERPRINT_PROPERTY} can't be updated (the id is derived from nombre)")
+    return BulkOp(line, op, nombre=nombre, where=where, changes=changes)
+
+
+def read_ndjson(lines: Iterable[bytes]) -> Iterator[tuple]:
+    """(line number, parsed value or the ValueError) for every non-empty line"""
+    for number, raw in enumerate(lines, start=1):
+        if not raw.strip():
+            continue
+        try:
+            yield number, json.loads(raw)
+        except ValueError as e:
+            yield number, ValueError(f"invalid JSON: {str(e)}")
+
+
+def _where_filter(where: Dict[str, Any]):
+    filters = [Filter.by_property(name).equal(value) for name, value in where.items()]
+    return Filter.all_of(filters) if len(filters) > 1 else filters[0]
+
+
+def _apply_chunk(collection: Any, ops: List[BulkOp]) -> List[Dict[str, Any]]:
+    """
+    Apply a chunk of operations in order. Every object touched is read in
+    one query per chunk (by id, ids computed from nombre; a second one for
+    legacy ids) plus one per `where`; the final state of each object is
+    written with one batch and the deletes with delete_many.
+    """
+    stored: Dict[str, Dict[str, Any]] = {}
+    vectors: Dict[str, Any] = {}
+
+    def remember(objects):
+        for obj in objects:
+            stored[str(obj.uuid)] = dict(obj.properties)
+            vectors[str(obj.uuid)] = plain_vector(obj.vector)
+
+    def fetch_ids(ids):
+        if ids:
+            remember(collection.query.fetch_objects(
+                filters=Filter.by_id().contains_any(sorted(ids)), include_vector=True, limit=len(ids)
+            ).objects)
+
+    ids_by_name = {op.nombre: catalogue_uuid(op.nombre) for op in ops if op.nombre is not None}
+    fetch_ids(set(ids_by_name.values()))
+    # Products still stored under a legacy id: one more read for all of them
+    legacy = {}
+    for nombre, uuid in ids_by_name.items():
+        if uuid not in stored:
+            legacy[nombre] = legacy_names.lookup(collection, nombre)
+    ids_by_name.update({nombre: uuid for nombre, uuid in legacy.items() if uuid})
+    fetch_ids({uuid for uuid in legacy.values() if uuid})
+    targets: Dict[int, List[str]] = {}
+    for op in ops:
+        if op.where is not None:
+            response = collection.query.fetch_objects(
+                filters=_where_filter(op.where), include_vector=True, limit=BULK_WHERE_LIMIT
+            )
+            remember(response.objects)
+            targets[op.line] = [str(obj.uuid) for obj in response.objects]
+
+    fields = vectorized_fields(collection)
+    working: Dict[str, Optional[Dict[str, Any]]] = dict(stored)
+    results: List[Dict[str, Any]] = []
+    for op in ops:
+        uuids = targets.get(op.line, [ids_by_name[op.nombre]] if op.nombre is not None else [])
+        if op.where is not None and not uuids:
+            results.append({"line": op.line, "op": op.op, "status": "not_found", "error": "No item matches where"})
+        for uuid in uuids:
+            current = working.get(uuid)
+            result = {"line": op.line, "op": op.op, "uuid": uuid, "nombre": (current or op.item or {}).get("nombre", op.nombre)}
+            if op.op == "insert":
+                if current is not None:
+                    result.update(status="error", error="Item already exists")
+                else:
+                    uuid = result["uuid"] = ids_by_name[op.nombre] = catalogue_uuid(op.nombre)
+                    working[uuid] = dict(op.item)
+                    result["status"] = "inserted"
+            elif current is None:
+                result.update(status="not_found", error="Item not found")
+            elif op.op == "update":
+                working[uuid] = {**current, **op.changes}
+                result["status"] = "updated"
+            else:
+                working[uuid] = None
+                result["status"] = "deleted"
+            results.append(result)
+
+    upserts, keep_vectors, deletes = {}, {}, []
+    for uuid, props in working.items():
+        before = stored.get(uuid)
+        if props is None:
+            if before is not None:
+                deletes.append(uuid)
+                legacy_names.forget(before.get("nombre"))
+        elif props is not before:
+            props = {**props, FINGERPRINT_PROPERTY: vector_fingerprint(props, fields)}
+            upserts[uuid] = props
+            # Only non-vectorized fields changed: write the stored vector back
+            if before is not None and vectors.get(uuid) and stored_fingerprint(before, fields) == props[FINGERPRINT_PROPERTY]:
+                keep_vectors[uuid] = vectors[uuid]
+
+    failed: Dict[str, str] = {}
+    if upserts:
+        ensure_fingerprint_property(collection)
+        failed = upsert_objects(collection, upserts, keep_vectors)
+    if deletes:
+        failed.update(delete_objects(collection, deletes))
+
+    for result in results:
+        uuid = result.get("uuid")
+        if uuid in failed and result["status"] in ("inserted", "updated", "deleted"):
+            result.update(status="error", error=failed[uuid])
+        elif result["status"] == "updated":
+            result["revectorized"] = uuid not in keep_vectors
+
+    changed = [uuid for uuid in list(upserts) + deletes if uuid not in failed]
+    if changed:
+        notify_catalogue_change(changed)
+    return results
+
+
+def apply_bulk(client_instance: Any, entries: Iterable[tuple], default_op: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Run (line number, entry) operations in chunks of BULK_CHUNK_SIZE and
+    yield one result per object touched (or per invalid line), in order.
+    """
+    collection = client_instance.collections.get(COLLECTION_NAME)
+    chunk: List[BulkOp] = []
+
+    def flush():
+        try:
+            yield from _apply_chunk(collection, chunk)
+        except Exception as e:
+            for op in chunk:
+                yield {"line": op.line, "op": op.op, "nombre": op.nombre, "status": "error", "error": str(e)}
+        chunk.clear()
+
+    for line, entry in entries:
+        try:
+            if isinstance(entry, ValueError):
+                raise entry
+            chunk.append(parse_op(line, entry, default_op))
+        except ValueError as e:
+            # Keep results in line order: apply what came before first
+            yield from flush()
+            yield {"line": line, "status": "error", "error": str(e)}
+            continue
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            yield from flush()
+    yield from flush()
@@ -0,0 +1,104 @@
+import threading
+from typing import Any, Dict, List, Optional
+from weaviate.util import generate_uuid5
+from app.catalogue import on_catalogue_change, check_catalogue_version
+
+
+def catalogue_uuid(nombre: str) -> str:
+    """The id of a product, derived from its nombre. Every writer must use it."""
+    return str(generate_uuid5({"nombre": nombre}))
+
+
+class LegacyNameIndex:
+    """
+    {nombre: uuid} for objects stored under some other id (random uuids
+    from older imports), so a mutation that misses the derived id can still
+    find them without a filter query. Built with one pass over the
+    collection on the first miss. Writers here never create legacy ids, so
+    the index only has to be rebuilt when a change of unknown scope comes
+    in; an entry left behind by a delete just reads as not found. The sheet
+    sync re-inserts legacy objects under their derived id, after which the
+    index is empty.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._uuids: Optional[Dict[str, str]] = None
+        self.stats = {"derived_hits": 0, "legacy_hits": 0, "misses": 0, "loads": 0}
+
+    def load(self, collection: Any) -> Dict[str, str]:
+        legacy = {}
+        for obj in collection.iterator(return_properties=["nombre"]):
+            nombre = obj.properties.get("nombre")
+            if nombre is not None and str(obj.uuid) != catalogue_uuid(nombre):
+                legacy[nombre] = str(obj.uuid)
+        with self._lock:
+            self._uuids = legacy
+        self.stats["loads"] += 1
+        if legacy:
+            print(f"🪪 {len(legacy)} catalogue objects still use legacy ids (re-run the sheet sync to migrate them)")
+        return legacy
+
+    def lookup(self, collection: Any, nombre: str) -> Optional[str]:
+        check_catalogue_version()
+        uuids = self._uuids
+        if uuids is None:
+            uuids = self.load(collection)
+        uuid = uuids.get(nombre)
+        self.stats["legacy_hits" if uuid else "misses"] += 1
+        return uuid
+
+    def forget(self, nombre: str):
+        uuids = self._uuids
+        if uuids is not None:
+            uuids.pop(nombre, None)
+
+    def clear(self):
+        with self._lock:
+            self._uuids = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "legacy_objects": len(self._uuids) if self._uuids is not None else None}
+
+
+legacy_names = LegacyNameIndex()
+
+
+@on_catalogue_change
+def clear_legacy_names(uuids: Optional[List[str]] = None):
+    if uuids is None:
+        legacy_names.clear()
+
+
+def fetch_product(collection: Any, nombre: str, include_vector: bool = False) -> Optional[Any]:
+    """A product by nombre: read by its derived id, else by its legacy id"""
+    obj = collection.query.fetch_object_by_id(catalogue_uuid(nombre), include_vector=include_vector)
+    if obj is not None:
+        legacy_names.stats["derived_hits"] += 1
+        return obj
+    uuid = legacy_names.lookup(collection, nombre)
+    return collection.query.fetch_object_by_id(uuid, include_vector=include_vector) if uuid else None
+
+
+def delete_product(collection: Any, nombre: str) -> Optional[str]:
+    """Delete a product by nombre without looking it up first; returns its uuid, None if not found"""
+    uuid = catalogue_uuid(nombre)
+    if collection.data.delete_by_id(uuid):
+        legacy_names.stats["derived_hits"] += 1
+        return uuid
+    uuid = legacy_names.lookup(collection, nombre)
+    if uuid and collection.data.delete_by_id(uuid):
+        legacy_names.forget(nombre)
+        return uuid
+    return None
+
+
+def product_exists(collection: Any, nombre: str) -> bool:
+    if collection.data.exists(catalogue_uuid(nombre)):
+        return True
+    uuid = legacy_names.lookup(collection, nombre)
+    return uuid is not None and collection.data.exists(uuid)
+
+
+def get_identity_stats() -> Dict[str, Any]:
+    return legacy_names.get_stats()
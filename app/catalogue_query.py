@@ -0,0 +1,234 @@
+import os
+import json
+import base64
+import hashlib
+import threading
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+from cachetools import TTLCache
+from weaviate.classes.query import Filter
+from app.catalogue import COLLECTION_NAME, on_catalogue_change, check_catalogue_version
+from app.catalogue_replica import catalogue_replica
+from app.catalogue_sync import FINGERPRINT_PROPERTY
+
+ITEMS_PAGE_SIZE = int(os.getenv("ITEMS_PAGE_SIZE", "20"))
+ITEMS_MAX_PAGE_SIZE = int(os.getenv("ITEMS_MAX_PAGE_SIZE", "100"))
+ITEMS_CACHE_SIZE = int(os.getenv("ITEMS_CACHE_SIZE", "256"))
+ITEMS_CACHE_TTL = float(os.getenv("ITEMS_CACHE_TTL", "300"))
+# Most objects read from Weaviate for one query when the replica isn't loaded
+ITEMS_FETCH_LIMIT = 10000
+
+SORTS = ("nombre", "precio", "-precio")
+# Properties the filters and sorts read, fetched even when not projected
+QUERY_PROPERTIES = ["nombre", "categoria", "precio", "inventario"]
+
+_cache = TTLCache(maxsize=ITEMS_CACHE_SIZE, ttl=ITEMS_CACHE_TTL)
+_cache_lock = threading.Lock()
+cache_stats = {"hits": 0, "misses": 0, "not_modified": 0, "replica": 0, "weaviate": 0, "invalidations": 0}
+
+
+class ItemQuery(NamedTuple):
+    name: Optional[str] = None
+    category: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    in_stock: bool = False
+    fields: Tuple[str, ...] = ()
+    sort: str = "nombre"
+    limit: int = ITEMS_PAGE_SIZE
+    cursor: Optional[str] = None
+
+
+class ItemPage(NamedTuple):
+    body: str
+    etag: str  # unquoted
+    next_cursor: Optional[str]
+
+
+def _float_arg(args: Mapping[str, str], name: str) -> Optional[float]:
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+def parse_item_query(args: Mapping[str, str]) -> ItemQuery:
+    """
+    Read GET /items arguments. Filters combine with AND. `price` is the old
+    single filter and means min_price. Raises ValueError on bad input.
+    """
+    min_price = _float_arg(args, "min_price")
+    if min_price is None:
+        min_price = _float_arg(args, "price")
+    sort = args.get("sort", "nombre")
+    if sort not in SORTS:
+        raise ValueError(f"sort must be one of {SORTS}")
+    try:
+        limit = int(args.get("limit", ITEMS_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= ITEMS_MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {ITEMS_MAX_PAGE_SIZE}")
+    fields = tuple(sorted({f.strip() for f in args.get("fields", "").split(",") if f.strip()}))
+    if any(not f.isidentifier() for f in fields):
+        raise ValueError("fields must be a comma separated list of property names")
+
+    cursor = args.get("cursor") or None
+    if cursor:
+        decode_cursor(cursor, sort)
+
+    return ItemQuery(
+        name=args.get("name") or None,
+        category=args.get("category") or None,
+        min_price=min_price,
+        max_price=_float_arg(args, "max_price"),
+        in_stock=args.get("in_stock", "").lower() in ("1", "true", "yes"),
+        fields=fields,
+        sort=sort,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
+def _same_text(a: Any, b: str) -> bool:
+    return isinstance(a, str) and a.strip().lower() == b.strip().lower()
+
+
+def _matches(props: Dict[str, Any], query: ItemQuery) -> bool:
+    price = props.get("precio")
+    if query.name is not None and not _same_text(props.get("nombre"), query.name):
+        return False
+    if query.category is not None and not _same_text(props.get("categoria"), query.category):
+        return False
+    if query.min_price is not None and (price is None or price < query.min_price):
+        return False
+    if query.max_price is not None and (price is None or price > query.max_price):
+        return False
+    if query.in_stock and not (props.get("inventario") or 0) > 0:
+        return False
+    return True
+
+
+def _weaviate_filters(query: ItemQuery):
+    filters = []
+    if query.name is not None:
+        filters.append(Filter.by_property("nombre").equal(query.name))
+    if query.category is not None:
+        filters.append(Filter.by_property("categoria").equal(query.category))
+    if query.min_price is not None:
+        filters.append(Filter.by_property("precio").greater_or_equal(query.min_price))
+    if query.max_price is not None:
+        filters.append(Filter.by_property("precio").less_or_equal(query.max_price))
+    if query.in_stock:
+        filters.append(Filter.by_property("inventario").greater_than(0))
+    return Filter.all_of(filters) if len(filters) > 1 else (filters[0] if filters else None)
+
+
+def _candidates(client_instance: Any, query: ItemQuery) -> List[Tuple[str, Dict[str, Any]]]:
+    """(uuid, properties) of every matching product, from the replica when it is fresh"""
+    if catalogue_replica.is_fresh():
+        cache_stats["replica"] += 1
+        objects = [(obj["uuid"], obj["properties"]) for obj in catalogue_replica.objects()]
+    else:
+        catalogue_replica.ensure_fresh(client_instance)
+        cache_stats["weaviate"] += 1
+        collection = client_instance.collections.get(COLLECTION_NAME)
+        return_properties = sorted(set(query.fields) | set(QUERY_PROPERTIES)) if query.fields else None
+        response = collection.query.fetch_objects(
+            filters=_weaviate_filters(query),
+            return_properties=return_properties,
+            limit=ITEMS_FETCH_LIMIT
+        )
+        objects = [(str(obj.uuid), dict(obj.properties)) for obj in response.objects]
+    return [(uuid, props) for uuid, props in objects if _matches(props, query)]
+
+
+def _sort_key(uuid: str, props: Dict[str, Any], sort: str) -> list:
+    """Total order for a sort; also what a cursor holds (products without the value go last)"""
+    if sort == "nombre":
+        value = props.get("nombre")
+        value = value.lower() if isinstance(value, str) else None
+    else:
+        value = props.get("precio")
+        value = None if value is None else (-value if sort == "-precio" else value)
+    return [value is None, value if value is not None else 0, uuid]
+
+
+def encode_cursor(sort: str, key: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort, key]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort: str) -> list:
+    """The sort key of the last product of the previous page"""
+    try:
+        cursor_sort, key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        valid = (
+            cursor_sort == sort and isinstance(key, list) and len(key) == 3
+            and isinstance(key[0], bool) and isinstance(key[2], str)
+            and isinstance(key[1], str if sort == "nombre" and not key[0] else (int, float))
+        )
+    except Exception:
+        valid = False
+    if not valid:
+        raise ValueError("invalid cursor (cursors only work with the sort they came from)")
+    return key
+
+
+def _project(props: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    if fields:
+        return {field: props[field] for field in fields if field in props}
+    return {k: v for k, v in props.items() if k != FINGERPRINT_PROPERTY}
+
+
+def _run_query(client_instance: Any, query: ItemQuery) -> ItemPage:
+    after = decode_cursor(query.cursor, query.sort) if query.cursor else None
+    keyed = [(_sort_key(uuid, props, query.sort), props) for uuid, props in _candidates(client_instance, query)]
+    keyed.sort(key=lambda row: row[0])
+    if after is not None:
+        keyed = [row for row in keyed if row[0] > after]
+
+    page = keyed[:query.limit]
+    next_cursor = encode_cursor(query.sort, page[-1][0]) if len(keyed) > query.limit else None
+    body = json.dumps([_project(props, query.fields) for _, props in page], ensure_ascii=False, default=str)
+    etag = hashlib.sha1(body.encode("utf-8")).hexdigest()
+    return ItemPage(body, etag, next_cursor)
+
+
+def get_items_page(client_instance: Any, query: ItemQuery) -> ItemPage:
+    """
+    One page of products for a query, cached on the normalized query until
+    the catalogue changes (any worker's change, via the shared version).
+    """
+    check_catalogue_version()
+    with _cache_lock:
+        cached = _cache.get(query)
+    if cached is not None:
+        cache_stats["hits"] += 1
+        return cached
+
+    cache_stats["misses"] += 1
+    page = _run_query(client_instance, query)
+    with _cache_lock:
+        _cache[query] = page
+    return page
+
+
+def is_not_modified(page: ItemPage, if_none_match: Any) -> bool:
+    """True when the client already holds this page (If-None-Match matches its ETag)"""
+    if if_none_match.contains(page.etag):
+        cache_stats["not_modified"] += 1
+        return True
+    return False
+
+
+@on_catalogue_change
+def invalidate_items_cache(uuids: Optional[List[str]] = None):
+    with _cache_lock:
+        _cache.clear()
+    cache_stats["invalidations"] += 1
+
+
+def get_items_cache_stats() -> Dict[str, Any]:
+    return {**cache_stats, "size": len(_cache)}
@@ -0,0 +1,224 @@
+import os
+import time
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+import numpy as np
+from app.catalogue import COLLECTION_NAME, on_catalogue_change
+from app.concurrency import submit_background
+
+# Serve searches from memory only if the replica was fully (re)loaded this recently
+CATALOGUE_REPLICA_MAX_AGE = float(os.getenv("CATALOGUE_REPLICA_MAX_AGE", "3600"))
+# Set CATALOGUE_REPLICA=0 to always search Weaviate
+CATALOGUE_REPLICA_ENABLED = os.getenv("CATALOGUE_REPLICA", "1") == "1"
+
+
+def _object_vector(obj: Any) -> Optional[np.ndarray]:
+    vector = obj.vector
+    if isinstance(vector, dict):
+        vector = vector.get("default") or next(iter(vector.values()), None)
+    return np.asarray(vector, dtype=np.float32) if vector else None
+
+
+def _unit_rows(vectors: Sequence[np.ndarray]) -> np.ndarray:
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    matrix = np.ascontiguousarray(np.vstack(vectors), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class ReplicaSnapshot(NamedTuple):
+    uuids: List[str]
+    properties: List[Dict[str, Any]]
+    vectors: List[np.ndarray]
+    # Unit-normalized vectors, one row per uuid
+    matrix: np.ndarray
+    # uuid -> row
+    positions: Dict[str, int]
+
+
+def _snapshot(rows: Dict[str, tuple]) -> ReplicaSnapshot:
+    """Build a snapshot from {uuid: (properties, vector)}"""
+    uuids = list(rows)
+    vectors = [vector for _, vector in rows.values()]
+    return ReplicaSnapshot(
+        uuids=uuids,
+        properties=[props for props, _ in rows.values()],
+        vectors=vectors,
+        matrix=_unit_rows(vectors),
+        positions={uuid: i for i, uuid in enumerate(uuids)},
+    )
+
+
+class CatalogueReplica:
+    """
+    A copy of the Supplements collection (properties + vectors) held in memory.
+    Rows are unit-normalized in one float32 matrix, so a cosine search is a
+    single matrix-vector product. Each load or refresh builds a new
+    ReplicaSnapshot and publishes it with one assignment; readers take a
+    single reference to it, so they never see rows from two snapshots and
+    don't need the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = _snapshot({})
+        self._loaded_at: Optional[float] = None
+        self._pending: set = set()
+        self._full_reload = True
+        self._refreshing = False
+        self.stats = {"searches": 0, "fallbacks": 0, "loads": 0, "load_errors": 0, "rows_refreshed": 0, "last_load_ms": 0.0}
+
+    def load(self, client_instance: Any):
+        """Read every object with its vector and replace the snapshot"""
+        started = time.perf_counter()
+        with self._lock:
+            # Changes announced while loading are re-applied afterwards
+            self._pending.clear()
+            self._full_reload = False
+        try:
+            collection = client_instance.collections.get(COLLECTION_NAME)
+            rows = {}
+            for obj in collection.iterator(include_vector=True):
+                vector = _object_vector(obj)
+                if vector is None:
+                    continue
+                rows[str(obj.uuid)] = (dict(obj.properties), vector)
+        except Exception:
+            with self._lock:
+                self._full_reload = True
+            self.stats["load_errors"] += 1
+            raise
+
+        snapshot = _snapshot(rows)
+        with self._lock:
+            self._snapshot = snapshot
+            self._loaded_at = time.monotonic()
+        self.stats["loads"] += 1
+        self.stats["last_load_ms"] = round(1000 * (time.perf_counter() - started), 1)
+        print(f"📦 Catalogue replica loaded: {len(rows)} products in {self.stats['last_load_ms']} ms")
+
+    def refresh_objects(self, client_instance: Any, uuids: Sequence[str]):
+        """Re-read only the given objects; ones that no longer exist are dropped"""
+        collection = client_instance.collections.get(COLLECTION_NAME)
+        fetched = {}
+        for uuid in uuids:
+            obj = collection.query.fetch_object_by_id(uuid, include_vector=True)
+            vector = _object_vector(obj) if obj else None
+            fetched[uuid] = (dict(obj.properties), vector) if vector is not None else None
+
+        with self._lock:
+            current = self._snapshot
+            rows = {uuid: (props, vector) for uuid, props, vector in zip(current.uuids, current.properties, current.vectors)}
+            for uuid, row in fetched.items():
+                if row is None:
+                    rows.pop(uuid, None)
+                else:
+                    rows[uuid] = row
+            self._snapshot = _snapshot(rows)
+        self.stats["rows_refreshed"] += len(fetched)
+
+    def mark_changed(self, uuids: Optional[List[str]] = None):
+        with self._lock:
+            if uuids is None:
+                self._full_reload = True
+            else:
+                self._pending.update(uuids)
+
+    def is_fresh(self) -> bool:
+        return (
+            self._loaded_at is not None
+            and not self._full_reload
+            and not self._pending
+            and time.monotonic() - self._loaded_at < CATALOGUE_REPLICA_MAX_AGE
+        )
+
+    def ensure_fresh(self, client_instance: Any):
+        """Start a background reload/refresh if the replica is behind; never blocks"""
+        if self.is_fresh() or client_instance is None:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        submit_background(self._refresh, client_instance)
+
+    def _refresh(self, client_instance: Any):
+        try:
+            with self._lock:
+                full = self._full_reload or self._loaded_at is None or time.monotonic() - self._loaded_at >= CATALOGUE_REPLICA_MAX_AGE
+                pending = list(self._pending)
+                self._pending.clear()
+            if full:
+                self.load(client_instance)
+            elif pending:
+                try:
+                    self.refresh_objects(client_instance, pending)
+                except Exception:
+                    self.mark_changed(pending)
+                    raise
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def search(self, query_vector: np.ndarray, limit: int = 2) -> Optional[List[Dict[str, Any]]]:
+        """
+        Top-k products by cosine similarity, or None when the replica can't
+        answer (not loaded, stale, or the vector comes from another model).
+        """
+        snapshot = self._snapshot
+        matrix, properties = snapshot.matrix, snapshot.properties
+        if not self.is_fresh() or matrix.shape[0] == 0 or matrix.shape[1] != query_vector.shape[0]:
+            self.stats["fallbacks"] += 1
+            return None
+
+        norm = np.linalg.norm(query_vector)
+        scores = matrix @ (query_vector / norm if norm else query_vector)
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        self.stats["searches"] += 1
+        return [properties[i] for i in top]
+
+    def objects(self) -> List[Dict[str, Any]]:
+        """Current snapshot as [{"uuid", "properties"}]"""
+        snapshot = self._snapshot
+        return [{"uuid": uuid, "properties": props} for uuid, props in zip(snapshot.uuids, snapshot.properties)]
+
+    def get_vector(self, uuid: str) -> Optional[np.ndarray]:
+        snapshot = self._snapshot
+        position = snapshot.positions.get(uuid)
+        return snapshot.vectors[position] if position is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        age = time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+        return {
+            **self.stats,
+            "size": len(snapshot.uuids),
+            "dimensions": int(snapshot.matrix.shape[1]) if snapshot.matrix.size else 0,
+            "fresh": self.is_fresh(),
+            "age_seconds": round(age, 1) if age is not None else None
+        }
+
+
+catalogue_replica = CatalogueReplica()
+
+
+@on_catalogue_change
+def mark_replica_changed(uuids: Optional[List[str]] = None):
+    """Changed rows are re-read on the next search; until then Weaviate answers"""
+    catalogue_replica.mark_changed(uuids)
+
+
+def search_replica(query_vector: np.ndarray, client_instance: Any, limit: int = 2) -> Optional[List[Dict[str, Any]]]:
+    """Search the in-memory catalogue, or return None so the caller asks Weaviate"""
+    if not CATALOGUE_REPLICA_ENABLED:
+        return None
+    catalogue_replica.ensure_fresh(client_instance)
+    return catalogue_replica.search(query_vector, limit)
+
+
+def get_replica_stats() -> Dict[str, Any]:
+    return catalogue_replica.get_stats()
@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import hashlib
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+from weaviate.classes.config import Property, DataType
+from weaviate.classes.query import Filter
+from app.catalogue import COLLECTION_NAME, notify_catalogue_change
+from app.catalogue_identity import catalogue_uuid
+
+# Objects per batch request, and attempts for objects Weaviate rejected
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "100"))
+SYNC_MAX_RETRIES = int(os.getenv("SYNC_MAX_RETRIES", "5"))
+# First backoff (seconds); doubled after every failed attempt, capped at SYNC_MAX_BACKOFF
+SYNC_BACKOFF = float(os.getenv("SYNC_BACKOFF", "2"))
+SYNC_MAX_BACKOFF = float(os.getenv("SYNC_MAX_BACKOFF", "60"))
+
+# Properties the vectorizer reads when the collection's config can't be checked
+# (see initiate_weaviate.py: everything else is created with skip=True)
+DEFAULT_VECTORIZED_FIELDS = ("categoria", "descripcion", "ingredientes")
+# Stored on every product: hash of its vectorized fields, not vectorized itself
+FINGERPRINT_PROPERTY = "fingerprint"
+# Seconds the collection's property config is reused before being read again
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "600"))
+_schema_cache: Dict[str, tuple] = {}
+
+# Errors worth retrying: the vectorizer warming up or rate limiting, timeouts
+RETRYABLE_ERRORS = ("model is currently loading", "rate limit", "429", "timeout", "timed out", "503", "502")
+
+
+def content_hash(properties: Dict[str, Any]) -> str:
+    """Stable hash of a product's properties (key order and int/float differences don't matter)"""
+    def canonical(value):
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, list):
+            return [canonical(v) for v in value]
+        return value
+    payload = json.dumps({k: canonical(v) for k, v in properties.items()}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _collection_properties(collection: Any, refresh: bool = False) -> List[Any]:
+    """The collection's property configs, read at most every SCHEMA_CACHE_TTL seconds"""
+    cached = _schema_cache.get(collection.name)
+    if refresh or cached is None or time.monotonic() - cached[0] > SCHEMA_CACHE_TTL:
+        cached = (time.monotonic(), collection.config.get().properties)
+        _schema_cache[collection.name] = cached
+    return cached[1]
+
+
+def vectorized_fields(collection: Any) -> Sequence[str]:
+    """Text properties the collection's vectorizer reads (skip=False)"""
+    try:
+        fields = [
+            prop.name for prop in _collection_properties(collection)
+            if prop.name != FINGERPRINT_PROPERTY
+            and prop.data_type in (DataType.TEXT, DataType.TEXT_ARRAY)
+            and not (prop.vectorizer_config and prop.vectorizer_config.skip)
+        ]
+        return sorted(fields)
+    except Exception as e:
+        print(f"⚠️ Could not read vectorizer config, assuming {DEFAULT_VECTORIZED_FIELDS}: {str(e)}")
+        return DEFAULT_VECTORIZED_FIELDS
+
+
+def vector_fingerprint(properties: Dict[str, Any], fields: Sequence[str]) -> str:
+    """Hash of what the vectorizer sees: equal fingerprints mean the same embedding"""
+    return content_hash({field: properties.get(field) for field in fields})
+
+
+def ensure_fingerprint_property(collection: Any):
+    """Add the fingerprint property with vectorization skipped (auto-schema would vectorize it)"""
+    if any(prop.name == FINGERPRINT_PROPERTY for prop in _collection_properties(collection)):
+        return
+    if any(prop.name == FINGERPRINT_PROPERTY for prop in _collection_properties(collection, refresh=True)):
+        return
+    print(f"Adding property: {FINGERPRINT_PROPERTY}")
+    collection.config.add_property(Property(name=FINGERPRINT_PROPERTY, data_type=DataType.TEXT, skip_vectorization=True))
+    _collection_properties(collection, refresh=True)
+
+
+def plain_vector(vector: Any) -> Optional[List[float]]:
+    """The default vector as a list (objects come back with {"default": [...]})"""
+    if isinstance(vector, dict):
+        vector = vector.get("default") or next(iter(vector.values()), None)
+    return [float(v) for v in vector] if vector is not None and len(vector) else None
+
+
+def stored_fingerprint(properties: Dict[str, Any], fields: Sequence[str]) -> str:
+    """An object's fingerprint; objects written before fingerprints existed get theirs computed"""
+    return properties.get(FINGERPRINT_PROPERTY) or vector_fingerprint(properties, fields)
+
+
+class SyncPlan(NamedTuple):
+    inserts: Dict[str, Dict[str, Any]]
+    updates: Dict[str, Dict[str, Any]]
+    deletes: List[str]
+    unchanged: int
+    # Existing vectors for updates that only touch non-vectorized fields
+    vectors: Dict[str, Any]
+
+
+def plan_sync(collection: Any, items: List[Dict[str, Any]], delete_missing: bool = True) -> SyncPlan:
+    """
+    Diff the sheet against the collection. Products are identified by the
+    uuid derived from their nombre; an existing object counts as changed
+    when the hash of the sheet's fields differs. The sheet's fields are
+    merged over the stored object, since writes replace it whole and the
+    sheet doesn't carry everything (image). A change that leaves the
+    vector fingerprint alone (price, stock, link...) keeps the stored
+    vector. Objects whose nombre left the sheet are deleted, as are legacy
+    objects stored under a random uuid (their product is re-inserted under
+    the derived one, keeping its other fields and vector).
+    """
+    fields = vectorized_fields(collection)
+    existing: Dict[str, Dict[str, Any]] = {}
+    existing_vectors: Dict[str, Any] = {}
+    legacy: Dict[str, str] = {}
+    for obj in collection.iterator(include_vector=True):
+        uuid, props = str(obj.uuid), dict(obj.properties)
+        existing[uuid] = props
+        existing_vectors[uuid] = plain_vector(obj.vector)
+        if props.get("nombre") is not None and uuid != catalogue_uuid(props["nombre"]):
+            legacy[props["nombre"]] = uuid
+
+    inserts, updates, vectors, keep = {}, {}, {}, set()
+    unchanged = 0
+    for item in items:
+        uuid = catalogue_uuid(item["nombre"])
+        keep.add(uuid)
+        current = existing.get(uuid)
+        stored_uuid = uuid if current is not None else legacy.get(item["nombre"])
+        if current is None and stored_uuid is None:
+            inserts[uuid] = {**item, FINGERPRINT_PROPERTY: vector_fingerprint(item, fields)}
+            continue
+        if current is not None and content_hash({k: current.get(k) for k in item}) == content_hash(item):
+            unchanged += 1
+            continue
+
+        stored = existing[stored_uuid]
+        merged = {k: v for k, v in stored.items() if k != FINGERPRINT_PROPERTY}
+        merged.update(item)
+        merged[FINGERPRINT_PROPERTY] = vector_fingerprint(merged, fields)
+        (updates if current is not None else inserts)[uuid] = merged
+        if stored_fingerprint(stored, fields) == merged[FINGERPRINT_PROPERTY] and existing_vectors.get(stored_uuid):
+            vectors[uuid] = existing_vectors[stored_uuid]
+
+    deletes = [uuid for uuid in existing if uuid not in keep] if delete_missing else []
+    return SyncPlan(inserts, updates, deletes, unchanged, vectors)
+
+
+def _is_retryable(message: str) -> bool:
+    message = message.lower()
+    return any(marker in message for marker in RETRYABLE_ERRORS)
+
+
+def upsert_objects(collection: Any, objects: Dict[str, Dict[str, Any]], vectors: Optional[Dict[str, Any]] = None,
+                   batch_size: int = SYNC_BATCH_SIZE, max_retries: int = SYNC_MAX_RETRIES) -> Dict[str, str]:
+    """
+    Write objects through the fixed-size batch API (an existing uuid is
+    replaced). Objects with an entry in `vectors` are stored with that
+    vector instead of being vectorized again. Objects that fail with a
+    retryable error are resent with exponential backoff. Returns
+    {uuid: error} for objects that never made it.
+    """
+    vectors = vectors or {}
+    pending = dict(objects)
+    failed: Dict[str, str] = {}
+    delay = SYNC_BACKOFF
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        with collection.batch.fixed_size(batch_size=batch_size) as batch:
+            for uuid, properties in pending.items():
+                batch.add_object(properties=properties, uuid=uuid, vector=vectors.get(uuid))
+        errors = {str(error.object_.uuid): error.message for error in collection.batch.failed_objects}
+
+        retry = {uuid: pending[uuid] for uuid, message in errors.items() if uuid in pending and _is_retryable(message)}
+        failed.update({uuid: message for uuid, message in errors.items() if uuid not in retry})
+        pending = retry
+        if pending and attempt < max_retries:
+            print(f"⚠️ {len(pending)} objects failed ({next(iter(errors.values()))}), retrying in {delay:.0f}s "
+                  f"(attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+            delay = min(delay * 2, SYNC_MAX_BACKOFF)
+
+    failed.update({uuid: "retries exhausted" for uuid in pending})
+    return failed
+
+
+def delete_objects(collection: Any, uuids: List[str], batch_size: int = SYNC_BATCH_SIZE) -> Dict[str, str]:
+    """
+    Delete by id with delete_many, batch_size ids per request. Returns
+    {uuid: error} for objects Weaviate failed to delete (ids that no longer
+    exist aren't failures).
+    """
+    failed: Dict[str, str] = {}
+    for start in range(0, len(uuids), batch_size):
+        chunk = uuids[start:start + batch_size]
+        result = collection.data.delete_many(where=Filter.by_id().contains_any(chunk), verbose=True)
+        for obj in result.objects or []:
+            if not obj.successful:
+                failed[str(obj.uuid)] = obj.error or "delete failed"
+    return failed
+
+
+def sync_catalogue(client_instance: Any, items: List[Dict[str, Any]], delete_missing: bool = True,
+                   dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Make the Supplements collection match `items` (the sheet): insert new
+    products, replace changed ones, delete removed ones, leave the rest
+    alone so they aren't vectorized again. Returns the sync stats.
+    """
+    started = time.perf_counter()
+    collection = client_instance.collections.get(COLLECTION_NAME)
+    plan = plan_sync(collection, items, delete_missing)
+    print(f"Sync plan: {len(plan.inserts)} new, {len(plan.updates)} changed "
+          f"({len(plan.vectors)} keep their vector), {len(plan.deletes)} removed, {plan.unchanged} unchanged")
+
+    stats = {
+        "inserted": len(plan.inserts),
+        "updated": len(plan.updates),
+        "deleted": 0,
+        "unchanged": plan.unchanged,
+        "failed": {},
+        # Updates that kept their vector (only non-vectorized fields changed)
+        "properties_only": len(plan.vectors),
+        # Objects not sent to the vectorizer, compared with re-uploading the whole sheet
+        "vectorizations_saved": plan.unchanged + len(plan.vectors),
+    }
+    if dry_run:
+        return stats
+
+    if plan.inserts or plan.updates:
+        ensure_fingerprint_property(collection)
+    failed = upsert_objects(collection, {**plan.inserts, **plan.updates}, plan.vectors)
+    stats["failed"] = failed
+    stats["inserted"] -= sum(1 for uuid in failed if uuid in plan.inserts)
+    stats["updated"] -= sum(1 for uuid in failed if uuid in plan.updates)
+    delete_failed = delete_objects(collection, plan.deletes) if plan.deletes else {}
+    failed.update(delete_failed)
+    stats["deleted"] = len(plan.deletes) - len(delete_failed)
+
+    changed = [uuid for uuid in list(plan.inserts) + list(plan.updates) + plan.deletes if uuid not in failed]
+    if changed:
+        # Let the running app drop its cached recommendations
+        notify_catalogue_change(changed)
+
+    elapsed = time.perf_counter() - started
+    written = stats["inserted"] + stats["updated"] + stats["deleted"]
+    stats["seconds"] = round(elapsed, 2)
+    stats["objects_per_second"] = round(written / elapsed, 1) if elapsed > 0 else 0.0
+    print(f"✅ Sync done in {stats['seconds']}s: {stats['inserted']} inserted, {stats['updated']} updated, "
+          f"{stats['deleted']} deleted, {len(failed)} failed ({stats['objects_per_second']} objects/s, "
+          f"{stats['vectorizations_saved']} vectorizations saved)")
+    for uuid, message in failed.items():
+        print(f"❌ {uuid}: {message}")
+    return stats
+
+
+def prepare_update(collection: Any, current: Dict[str, Any], changes: Dict[str, Any]) -> tuple:
+    """
+    Merge `changes` into a product's current properties and stamp the new
+    fingerprint. Returns (properties, keeps_vector): keeps_vector is True
+    when no vectorized field changed, so the caller can write the existing
+    vector back instead of having the object embedded again.
+    """
+    fields = vectorized_fields(collection)
+    merged = {**current, **changes}
+    merged[FINGERPRINT_PROPERTY] = vector_fingerprint(merged, fields)
+    return merged, merged[FINGERPRINT_PROPERTY] == stored_fingerprint(current, fields)
+
+
+def with_fingerprint(collection: Any, properties: Dict[str, Any]) -> Dict[str, Any]:
+    """A new product's properties with its fingerprint"""
+    return {**properties, FINGERPRINT_PROPERTY: vector_fingerprint(properties, vectorized_fields(collection))}
@@ -0,0 +1,203 @@
+import os
+import argparse
+from datetime import date, datetime
+from typing import Dict, List, Tuple
+from app.db_pool import get_cursor
+
+# Months of chat_state history kept row by row; older months are compacted
+# into chat_session_summaries and their partitions dropped
+CHAT_STATE_RETENTION_MONTHS = int(os.getenv("CHAT_STATE_RETENTION_MONTHS", "6"))
+# Monthly partitions created in advance
+CHAT_STATE_PARTITIONS_AHEAD = int(os.getenv("CHAT_STATE_PARTITIONS_AHEAD", "2"))
+# Key for pg_try_advisory_xact_lock so two maintenance runs never overlap
+MAINTENANCE_LOCK_ID = 716001
+
+
+def month_start(day: date, offset: int = 0) -> date:
+    """First day of the month `offset` months after `day`'s month"""
+    index = day.year * 12 + day.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(start: date) -> str:
+    return f"chat_state_p{start.year}_{start.month:02d}"
+
+
+def is_partitioned(cursor) -> bool:
+    cursor.execute("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = 'chat_state' AND c.relnamespace = 'public'::regnamespace
+    """)
+    return cursor.fetchone() is not None
+
+
+def list_partitions(cursor) -> List[Tuple[str, date]]:
+    """(name, month) of every monthly partition, oldest first"""
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'chat_state'::regclass AND c.relname LIKE 'chat_state\\_p%'
+        ORDER BY c.relname
+    """)
+    partitions = []
+    for (name,) in cursor.fetchall():
+        year, month = name[len("chat_state_p"):].split("_")
+        partitions.append((name, date(int(year), int(month), 1)))
+    return partitions
+
+
+def create_chat_session_summaries_table(cursor=None):
+    """Per-session digest of chat_state rows that have been compacted away"""
+    with get_cursor(cursor) as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_session_summaries (
+                user_id TEXT NOT NULL,
+                session_key TEXT NOT NULL,
+                first_state_at TIMESTAMPTZ,
+                last_state_at TIMESTAMPTZ,
+                state_count INTEGER NOT NULL,
+                stages TEXT[],
+                final_stage TEXT,
+                final_context JSONB,
+                PRIMARY KEY (user_id, session_key)
+            )
+        """)
+    print("chat_session_summaries table ready!")
+
+
+def create_partition(cursor, start: date):
+    """
+    Create the partition for one month. Rows for that month that landed in
+    the default partition are moved into it first, otherwise ATTACH fails.
+    """
+    name, end = partition_name(start), month_start(start, 1)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {name} (LIKE chat_state INCLUDING DEFAULTS)")
+    cursor.execute(f"""
+        WITH moved AS (
+            DELETE FROM chat_state_default
+            WHERE created_at >= %s AND created_at < %s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, (start, end))
+    cursor.execute(f"ALTER TABLE chat_state ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+    print(f"Created partition {name}")
+
+
+def convert_to_partitioned(cursor):
+    """
+    One-time switch of chat_state to monthly range partitions on created_at.
+    Rows are copied into the new table in the same transaction; the id
+    sequence is kept, so ids continue where they left off.
+    """
+    cursor.execute("LOCK TABLE chat_state IN ACCESS EXCLUSIVE MODE")
+    cursor.execute("ALTER TABLE chat_state RENAME TO chat_state_unpartitioned")
+    # Index names are schema-wide: move the old table's out of the way so the
+    # new table's indexes (and primary key) get their usual names
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = 'chat_state_unpartitioned'")
+    for (index,) in cursor.fetchall():
+        cursor.execute(f'ALTER INDEX "{index}" RENAME TO "{index}_unpartitioned"')
+    cursor.execute("UPDATE chat_state_unpartitioned SET created_at = NOW() WHERE created_at IS NULL")
+    cursor.execute("""
+        CREATE TABLE chat_state (LIKE chat_state_unpartitioned INCLUDING DEFAULTS)
+        PARTITION BY RANGE (created_at)
+    """)
+    cursor.execute("ALTER TABLE chat_state ADD PRIMARY KEY (id, created_at)")
+    cursor.execute("CREATE INDEX idx_chat_state_user ON chat_state (user_id, id DESC)")
+    cursor.execute("CREATE TABLE chat_state_default PARTITION OF chat_state DEFAULT")
+
+    cursor.execute("SELECT MIN(created_at) FROM chat_state_unpartitioned")
+    oldest = cursor.fetchone()[0] or datetime.utcnow()
+    month, last = month_start(oldest.date()), month_start(date.today(), CHAT_STATE_PARTITIONS_AHEAD)
+    while month <= last:
+        create_partition(cursor, month)
+        month = month_start(month, 1)
+
+    cursor.execute("INSERT INTO chat_state SELECT * FROM chat_state_unpartitioned")
+    copied = cursor.rowcount
+    # The serial sequence belongs to the old table; keep it when that table is dropped
+    cursor.execute("ALTER SEQUENCE IF EXISTS chat_state_id_seq OWNED BY chat_state.id")
+    cursor.execute("DROP TABLE chat_state_unpartitioned")
+    print(f"chat_state partitioned by month ({copied} rows moved)")
+
+
+def compact_partition(cursor, name: str) -> int:
+    """Fold a partition into chat_session_summaries, then detach and drop it"""
+    cursor.execute(f"""
+        INSERT INTO chat_session_summaries (
+            user_id, session_key, first_state_at, last_state_at, state_count, stages, final_stage, final_context
+        )
+        SELECT
+            user_id,
+            COALESCE(context->>'session_id', ''),
+            MIN(created_at),
+            MAX(created_at),
+            COUNT(*),
+            ARRAY_AGG(DISTINCT stage),
+            (ARRAY_AGG(stage ORDER BY id DESC))[1],
+            (ARRAY_AGG(context ORDER BY id DESC))[1]
+        FROM {name}
+        WHERE user_id IS NOT NULL
+        GROUP BY 1, 2
+        ON CONFLICT (user_id, session_key) DO UPDATE SET
+            first_state_at = LEAST(chat_session_summaries.first_state_at, EXCLUDED.first_state_at),
+            last_state_at = GREATEST(chat_session_summaries.last_state_at, EXCLUDED.last_state_at),
+            state_count = chat_session_summaries.state_count + EXCLUDED.state_count,
+            stages = ARRAY(SELECT DISTINCT unnest(chat_session_summaries.stages || EXCLUDED.stages)),
+            final_stage = CASE WHEN EXCLUDED.last_state_at >= chat_session_summaries.last_state_at
+                THEN EXCLUDED.final_stage ELSE chat_session_summaries.final_stage END,
+            final_context = CASE WHEN EXCLUDED.last_state_at >= chat_session_summaries.last_state_at
+                THEN EXCLUDED.final_context ELSE chat_session_summaries.final_context END
+    """)
+    sessions = cursor.rowcount
+    cursor.execute(f"ALTER TABLE chat_state DETACH PARTITION {name}")
+    cursor.execute(f"DROP TABLE {name}")
+    print(f"Compacted {name} into {sessions} session summaries")
+    return sessions
+
+
+def maintain_chat_state(retention_months: int = CHAT_STATE_RETENTION_MONTHS, dry_run: bool = False) -> Dict[str, list]:
+    """
+    Partition chat_state if it isn't yet, create upcoming monthly partitions
+    and compact the ones older than the retention window. Safe to run from
+    a scheduler: concurrent runs skip instead of waiting.
+    """
+    report = {"created": [], "compacted": []}
+    create_chat_session_summaries_table()
+    with get_cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (MAINTENANCE_LOCK_ID,))
+        if not cursor.fetchone()[0]:
+            print("⚠️ chat_state maintenance already running elsewhere, skipping")
+            return report
+
+        if not is_partitioned(cursor):
+            if dry_run:
+                print("chat_state would be converted to monthly partitions")
+                return report
+            convert_to_partitioned(cursor)
+
+        existing = {month for _, month in list_partitions(cursor)}
+        today = date.today()
+        for offset in range(CHAT_STATE_PARTITIONS_AHEAD + 1):
+            month = month_start(today, offset)
+            if month not in existing:
+                report["created"].append(partition_name(month))
+                if not dry_run:
+                    create_partition(cursor, month)
+
+        cutoff = month_start(today, -retention_months)
+        for name, month in list_partitions(cursor):
+            if month < cutoff:
+                report["compacted"].append(name)
+                if not dry_run:
+                    compact_partition(cursor, name)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partition, retain and compact chat_state")
+    parser.add_argument("--retention-months", type=int, default=CHAT_STATE_RETENTION_MONTHS)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args()
+    print(maintain_chat_state(args.retention_months, args.dry_run))
@@ -0,0 +1,74 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict
+
+# Set CONCURRENT_IO=0 to run every call inline, in order (useful when debugging)
+CONCURRENT_IO = os.getenv("CONCURRENT_IO", "1") == "1"
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "8"))
+# Default per-call timeout, in seconds, for I/O on the /chat critical path
+IO_TIMEOUT = float(os.getenv("IO_TIMEOUT", "8"))
+# Background tasks allowed to be queued or running before callers run them inline
+BACKGROUND_MAX_PENDING = int(os.getenv("BACKGROUND_MAX_PENDING", "200"))
+
+_io_executor = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix="chat-io")
+_background_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-bg")
+_background_slots = threading.BoundedSemaphore(BACKGROUND_MAX_PENDING)
+
+io_stats = {"calls": 0, "timeouts": 0, "errors": 0, "background": 0, "background_inline": 0, "background_errors": 0}
+
+
+def run_with_timeout(func: Callable, *args, timeout: float = IO_TIMEOUT, default: Any = None, **kwargs) -> Any:
+    """
+    Run one blocking call on the I/O pool and wait at most `timeout` seconds.
+    Returns `default` if the call times out or raises; a timed-out call keeps
+    running in its worker thread but no longer holds up the response.
+    """
+    name = getattr(func, "__name__", str(func))
+    io_stats["calls"] += 1
+    try:
+        if not CONCURRENT_IO:
+            return func(*args, **kwargs)
+        return _io_executor.submit(func, *args, **kwargs).result(timeout=timeout)
+    except FutureTimeout:
+        io_stats["timeouts"] += 1
+        print(f"⏱️ {name} timed out after {timeout}s")
+    except Exception as e:
+        io_stats["errors"] += 1
+        print(f"❌ Error in {name}: {str(e)}")
+    return default
+
+
+def submit_background(func: Callable, *args, **kwargs):
+    """
+    Run work that the response does not wait for (e.g. analytics writes).
+    When too much background work is pending the call runs inline instead,
+    which slows the caller down rather than growing an unbounded queue.
+    """
+    if not CONCURRENT_IO or not _background_slots.acquire(blocking=False):
+        io_stats["background_inline"] += 1
+        _run_logged(func, *args, **kwargs)
+        return
+
+    io_stats["background"] += 1
+
+    def task():
+        try:
+            _run_logged(func, *args, **kwargs)
+        finally:
+            _background_slots.release()
+
+    _background_executor.submit(task)
+
+
+def _run_logged(func: Callable, *args, **kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception as e:
+        io_stats["background_errors"] += 1
+        print(f"❌ Background task {getattr(func, '__name__', func)} failed: {str(e)}")
+
+
+def get_io_stats() -> Dict[str, Any]:
+    return dict(io_stats)
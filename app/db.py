@@ -1,60 +1,144 @@
 import os
-import psycopg2
-import psycopg2.extras
-from dotenv import load_dotenv
+import io
 import json
+import copy
+import time
+import threading
 from datetime import datetime
 import csv
+from typing import Dict, Iterator, TextIO, Union
+from cachetools import LRUCache
+from app.db_pool import get_cursor, with_reconnect
+from app.catalogue import bump_data_version
+from app.pharmacy_directory import pueblo_key
 
-load_dotenv(".env.staging")
+# In-process copy of each user's current state and the chat_state id it came
+# from. chat_state_current is still read on every turn (another worker may have
+# served the previous one); the copy only saves shipping and decoding the
+# context when its state_id is still the current one.
+STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", "5000"))
+_state_cache = LRUCache(maxsize=STATE_CACHE_SIZE)
+_state_cache_lock = threading.Lock()
+# chat_state rows older than this are compacted away (see app.chat_state_partitions)
+CHAT_STATE_RETENTION_MONTHS = int(os.getenv("CHAT_STATE_RETENTION_MONTHS", "6"))
+# Pharmacy sheet exported as CSV (Customer Name, Address, Pueblo, optional Lat / Lng)
+PHARMACY_CSV = os.getenv("PHARMACY_CSV", "Farmacias - Sheet1.csv")
 
-# Database Connection
-print("Connecting to Database...")
-DATABASE_URL = os.getenv("DATABASE_URL")
-conn = psycopg2.connect(DATABASE_URL, sslmode="require")
-conn.autocommit = True
-cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-print("Succesfully Connected to PostgresDB")
+def cache_user_state(user_id, state, state_id):
+    with _state_cache_lock:
+        _state_cache[user_id] = (state_id, copy.deepcopy(state))
+
+def peek_user_state(user_id):
+    """The cached copy of the user's state (as last read or written here), without touching the database"""
+    with _state_cache_lock:
+        cached = _state_cache.get(user_id)
+    return copy.deepcopy(cached[1]) if cached is not None else None
+
+def invalidate_user_state(user_id):
+    with _state_cache_lock:
+        _state_cache.pop(user_id, None)
 
 # Functions 
+@with_reconnect
 def get_user_state(user_id):
-    # Get the most recent state for the user using id for ordering
-    cursor.execute("""
-        SELECT stage, context 
-        FROM chat_state 
-        WHERE user_id = %s 
-        ORDER BY id DESC 
-        LIMIT 1
-    """, (user_id,))
-    row = cursor.fetchone()
+    """
+    Get the current state for the user from the snapshot table (one primary
+    key read). The context is only sent when it differs from the cached copy.
+    """
+    with _state_cache_lock:
+        cached = _state_cache.get(user_id)
+    cached_id = cached[0] if cached is not None else None
+
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT state_id,
+                   state_id IS NOT DISTINCT FROM %s AS cached,
+                   CASE WHEN state_id IS NOT DISTINCT FROM %s THEN NULL ELSE stage END AS stage,
+                   CASE WHEN state_id IS NOT DISTINCT FROM %s THEN NULL ELSE context END AS context
+            FROM chat_state_current 
+            WHERE user_id = %s
+        """, (cached_id, cached_id, cached_id, user_id))
+        row = cursor.fetchone()
+
+        if row is not None and row["cached"] and cached is not None:
+            return copy.deepcopy(cached[1])
+
+        if row is None:
+            # Users from before the snapshot table existed only have history rows
+            # The created_at bound lets Postgres skip all but the retained partitions
+            cursor.execute("""
+                SELECT id AS state_id, stage, context 
+                FROM chat_state 
+                WHERE user_id = %s AND created_at >= NOW() - make_interval(months => %s)
+                ORDER BY id DESC 
+                LIMIT 1
+            """, (user_id, CHAT_STATE_RETENTION_MONTHS))
+            row = cursor.fetchone()
+            if row:
+                cursor.execute("""
+                    INSERT INTO chat_state_current (user_id, stage, context, state_id)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (user_id) DO NOTHING
+                """, (user_id, row["stage"], json.dumps(row["context"]), row["state_id"]))
+
     if row:
-        return {
+        state = {
             "stage": row["stage"],
             "context": row["context"]
         }
+        cache_user_state(user_id, state, row["state_id"])
+        return state
+    invalidate_user_state(user_id)
     return None
 
-def set_user_state(user_id, state):
-    # Insert new state - created_at will be set automatically by the default value
-    cursor.execute("""
-        INSERT INTO chat_state (user_id, stage, context)
-        VALUES (%s, %s, %s)
-    """, (
-        user_id, 
-        state["stage"], 
-        json.dumps(state["context"])
-    ))
+@with_reconnect
+def set_user_state(user_id, state, cursor=None):
+    """
+    Append the state to chat_state and upsert it as the user's current state.
+    With a cursor the writes join the caller's transaction and caching is left
+    to the caller, which knows when the transaction has committed. Returns
+    the new chat_state id.
+    """
+    context = json.dumps(state["context"])
+    owns_transaction = cursor is None
+    with get_cursor(cursor) as cursor:
+        # Insert new state - created_at will be set automatically by the default value
+        cursor.execute("""
+            INSERT INTO chat_state (user_id, stage, context)
+            VALUES (%s, %s, %s)
+            RETURNING id
+        """, (
+            user_id, 
+            state["stage"], 
+            context
+        ))
+        state_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO chat_state_current (user_id, stage, context, state_id, updated_at)
+            VALUES (%s, %s, %s, %s, NOW())
+            ON CONFLICT (user_id) DO UPDATE
+            SET stage = EXCLUDED.stage,
+                context = EXCLUDED.context,
+                state_id = EXCLUDED.state_id,
+                updated_at = EXCLUDED.updated_at
+        """, (user_id, state["stage"], context, state_id))
+
+    if owns_transaction:
+        cache_user_state(user_id, {"stage": state["stage"], "context": state["context"]}, state_id)
+    return state_id
 
+@with_reconnect
 def get_user_state_history(user_id, limit=50):
     """Get the state history for a user"""
-    cursor.execute("""
-        SELECT id, stage, context, created_at 
-        FROM chat_state 
-        WHERE user_id = %s 
-        ORDER BY id DESC 
-        LIMIT %s
-    """, (user_id, limit))
-    rows = cursor.fetchall()
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT id, stage, context, created_at 
+            FROM chat_state 
+            WHERE user_id = %s AND created_at >= NOW() - make_interval(months => %s)
+            ORDER BY id DESC 
+            LIMIT %s
+        """, (user_id, CHAT_STATE_RETENTION_MONTHS, limit))
+        rows = cursor.fetchall()
     return [{
         "id": row["id"],
         "stage": row["stage"],
@@ -69,60 +153,166 @@ def reset_user_state(user_id):
     """
     pass  # No need to delete anything since we're keeping history
 
+def create_chat_state_current_table(cursor=None):
+    """Create the latest-state snapshot table and seed it from chat_state"""
+    with get_cursor(cursor) as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_state_current (
+                user_id TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                context JSONB,
+                state_id INTEGER,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO chat_state_current (user_id, stage, context, state_id, updated_at)
+            SELECT DISTINCT ON (user_id) user_id, stage, context, id, created_at
+            FROM chat_state
+            ORDER BY user_id, id DESC
+            ON CONFLICT (user_id) DO NOTHING
+        """)
+    print("chat_state_current table ready!")
+
 def create_pueblos_table():
     """Create the pueblos table if it doesn't exist"""
-    # Drop the table if it exists
-    cursor.execute("DROP TABLE IF EXISTS pueblos")
-    
-    # Create the table with correct column names
-    cursor.execute("""
-        CREATE TABLE pueblos (
-            "Customer Name" TEXT,
-            Address TEXT,
-            Pueblo TEXT
-        )
-    """)
-    conn.commit()
+    with get_cursor() as cursor:
+        # pueblo_key (see app.pharmacy_directory.pueblo_key) is filled in by load_pharmacies_from_csv
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pueblos (
+                "Customer Name" TEXT,
+                Address TEXT,
+                Pueblo TEXT,
+                pueblo_key TEXT,
+                lat DOUBLE PRECISION,
+                lng DOUBLE PRECISION
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_pueblos_key ON pueblos (pueblo_key)")
     print("Table created successfully!")
 
-def load_pharmacies_from_csv():
-    """Load pharmacy data from CSV file into the database"""
-    # First clear existing data
-    cursor.execute("TRUNCATE TABLE pueblos")
-    
-    # Use direct file path
-    csv_path = r"C:\Users\Felix\Desktop\Freelance_Projects\GoShopPR\Farmacias - Sheet1.csv"
-    print(f"Loading data from: {csv_path}")
-    
-    # Read and insert CSV data
-    with open(csv_path, 'r', encoding='utf-8') as file:
-        csv_reader = csv.DictReader(file)
-        for row in csv_reader:
-            pueblo_clean = row['Pueblo'].strip()
-            cursor.execute("""
-                INSERT INTO pueblos ("Customer Name", Address, Pueblo)
-                VALUES (%s, %s, %s)
-            """, (row['Customer Name'], row['Address'], pueblo_clean))
-    
-    conn.commit()
-    print("Data loaded successfully!")
 
+class _CopyStream(io.TextIOBase):
+    """File-like view of an iterator of text chunks, read by cursor.copy_expert"""
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = chunks
+        self._buffer = ""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _pharmacy_copy_rows(file: TextIO, counter: Dict[str, int]) -> Iterator[str]:
+    """Normalize CSV rows (trim, pueblo key with accents folded) into COPY csv lines"""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for row in csv.DictReader(file):
+        pueblo = " ".join((row.get('Pueblo') or "").split())
+        if not pueblo:
+            continue
+        writer.writerow([
+            (row.get('Customer Name') or "").strip(),
+            (row.get('Address') or "").strip(),
+            pueblo,
+            pueblo_key(pueblo),
+            # Lat / Lng are filled in by pharmacy_location_scraping.py; older sheets lack them.
+            # An empty unquoted field is NULL to COPY
+            (row.get('Lat') or "").strip(),
+            (row.get('Lng') or "").strip(),
+        ])
+        counter["rows"] += 1
+        if counter["rows"] % 1000 == 0:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
+
+
+def load_pharmacies_from_csv(source: Union[str, TextIO] = PHARMACY_CSV) -> int:
+    """
+    Replace the pueblos table with a pharmacy CSV (a path or an open text
+    stream). Rows are normalized while they stream through COPY into a
+    staging table, the table's indexes are built there, and the two tables
+    are swapped by rename in the same transaction: readers see the old data
+    until the commit and the new data after it, never an empty table.
+    Returns the number of rows loaded.
+    """
+    started = time.perf_counter()
+    print(f"Loading data from: {source if isinstance(source, str) else getattr(source, 'name', 'stream')}")
+    counter = {"rows": 0}
+    file = open(source, 'r', encoding='utf-8', newline='') if isinstance(source, str) else source
+    try:
+        with get_cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS pueblos_staging")
+            cursor.execute("CREATE TABLE pueblos_staging (LIKE pueblos INCLUDING DEFAULTS)")
+            cursor.copy_expert(
+                'COPY pueblos_staging ("Customer Name", address, pueblo, pueblo_key, lat, lng) FROM STDIN WITH (FORMAT csv)',
+                _CopyStream(_pharmacy_copy_rows(file, counter))
+            )
+
+            # Same indexes as the live table, built once after the load
+            cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = 'public' AND tablename = 'pueblos'")
+            indexes = cursor.fetchall()
+            for name, definition in indexes:
+                cursor.execute(definition.replace(f"INDEX {name} ON public.pueblos ", f"INDEX {name}_staging ON public.pueblos_staging ", 1))
+
+            cursor.execute("ALTER TABLE pueblos RENAME TO pueblos_old")
+            cursor.execute("ALTER TABLE pueblos_staging RENAME TO pueblos")
+            cursor.execute("DROP TABLE pueblos_old")
+            for name, _ in indexes:
+                cursor.execute(f"ALTER INDEX {name}_staging RENAME TO {name}")
+
+            # Workers reload their pharmacy directory (app.pharmacy_directory) on the new version
+            bump_data_version("pharmacies", cursor=cursor)
+    finally:
+        if isinstance(source, str):
+            file.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Data loaded successfully! {counter['rows']} rows in {elapsed:.2f}s ({counter['rows'] / max(elapsed, 1e-6):.0f} rows/s)")
+    return counter["rows"]
+
+@with_reconnect
 def get_pueblos():
     """Get all unique pueblo names from the table"""
-    cursor.execute('SELECT DISTINCT TRIM(Pueblo) FROM pueblos ORDER BY TRIM(Pueblo)')
-    pueblos = cursor.fetchall()
+    with get_cursor() as cursor:
+        cursor.execute('SELECT DISTINCT TRIM(Pueblo) FROM pueblos ORDER BY TRIM(Pueblo)')
+        pueblos = cursor.fetchall()
     return [row[0] for row in pueblos]
 
+@with_reconnect
 def get_pharmacy_address(user_message, limit=2):
     user_message = user_message.strip()  # Remove leading/trailing spaces
     print(f"Searching for pueblo: '{user_message}'")  # Debug print
-    cursor.execute("""
-        SELECT "Customer Name", address FROM pueblos
-        WHERE pueblo ILIKE %s
-        LIMIT %s
-    """, (f"%{user_message}%", limit))
-    rows = cursor.fetchall()
+    with get_cursor() as cursor:
+        # Exact pueblo first (indexed, see app.migrations), then a substring match
+        cursor.execute("""
+            SELECT "Customer Name", address FROM pueblos
+            WHERE pueblo_key = %s
+            LIMIT %s
+        """, (pueblo_key(user_message), limit))
+        rows = cursor.fetchall()
+        if not rows:
+            cursor.execute("""
+                SELECT "Customer Name", address FROM pueblos
+                WHERE pueblo ILIKE %s
+                LIMIT %s
+            """, (f"%{user_message}%", limit))
+            rows = cursor.fetchall()
     return [{
         "Pharmacy": row[0],
         "Location": row[1]
-    } for row in rows]
\ No newline at end of file
+    } for row in rows]
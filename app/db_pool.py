@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, Optional
+
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+from dotenv import load_dotenv
+
+load_dotenv(".env.staging")
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_SSLMODE = os.getenv("DB_SSLMODE", "require")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Seconds a request waits for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+# Idle connections older than this are pinged before being handed out
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "30"))
+
+# Errors raised by psycopg2 when the server side of the connection is gone
+# (e.g. "SSL connection has been closed unexpectedly")
+DISCONNECT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the pool timeout"""
+
+
+class ConnectionPool:
+    """
+    Thread-safe PostgreSQL connection pool.
+    Wraps psycopg2's ThreadedConnectionPool so that callers block (up to a
+    timeout) instead of failing when every connection is checked out, pings
+    idle connections before reuse and keeps saturation counters.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        minconn: int = DB_POOL_MIN,
+        maxconn: int = DB_POOL_MAX,
+        timeout: float = DB_POOL_TIMEOUT,
+        health_check_interval: float = DB_HEALTH_CHECK_INTERVAL,
+        sslmode: str = DB_SSLMODE
+    ):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, dsn, sslmode=sslmode)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used: Dict[int, float] = {}
+        self._stats = {
+            "checkouts": 0,
+            "in_use": 0,
+            "peak_in_use": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "timeouts": 0,
+            "reconnects": 0,
+            "health_check_failures": 0
+        }
+
+    def getconn(self):
+        """Check out a healthy connection, waiting for a free slot if needed"""
+        started = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["waits"] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                print(f"⚠️ DB pool saturated: no connection free after {self.timeout}s")
+                raise PoolTimeoutError(f"No database connection available after {self.timeout}s")
+
+        try:
+            conn = self._checkout_healthy()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += time.monotonic() - started
+            self._stats["in_use"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self._stats["in_use"])
+        return conn
+
+    def _checkout_healthy(self):
+        conn = self._pool.getconn()
+        idle_for = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if conn.closed or idle_for > self.health_check_interval:
+            if not self._is_alive(conn):
+                with self._lock:
+                    self._stats["health_check_failures"] += 1
+                    self._stats["reconnects"] += 1
+                print("🔄 Replacing dead database connection...")
+                self._discard(conn)
+                conn = self._pool.getconn()
+        return conn
+
+    @staticmethod
+    def _is_alive(conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except DISCONNECT_ERRORS:
+            return False
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    def putconn(self, conn, close: bool = False):
+        """Return a connection to the pool, closing it if it is broken"""
+        try:
+            if close or conn.closed:
+                with self._lock:
+                    self._stats["reconnects"] += 1
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            with self._lock:
+                self._stats["in_use"] -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of the block.
+        Commits on success, rolls back on error and drops the connection
+        if the server closed it.
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except DISCONNECT_ERRORS:
+            broken = True
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn, close=broken or bool(conn.closed))
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool usage for monitoring"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["max_size"] = self.maxconn
+        stats["saturation"] = round(stats["in_use"] / self.maxconn, 3) if self.maxconn else 0.0
+        stats["avg_wait_ms"] = round(1000 * stats["wait_time_total"] / stats["checkouts"], 3) if stats["checkouts"] else 0.0
+        stats["wait_time_total"] = round(stats["wait_time_total"], 3)
+        return stats
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+# Shared pool, created lazily on first use so importing the app never blocks on the DB
+_pool_instance: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Returns the process-wide connection pool"""
+    global _pool_instance
+
+    if _pool_instance is None:
+        with _pool_lock:
+            if _pool_instance is None:
+                print("Connecting to Database...")
+                _pool_instance = ConnectionPool(DATABASE_URL)
+                print("Succesfully Connected to PostgresDB")
+    return _pool_instance
+
+
+def close_pool():
+    global _pool_instance
+    if _pool_instance is not None:
+        _pool_instance.closeall()
+        _pool_instance = None
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Pool saturation metrics, or an empty dict before the first query"""
+    if _pool_instance is None:
+        return {}
+    return _pool_instance.stats()
+
+
+@contextmanager
+def get_cursor(cursor=None, cursor_factory=psycopg2.extras.DictCursor):
+    """
+    Check out a pooled connection and yield a cursor inside one transaction.
+    When a cursor is passed in (e.g. by a unit of work) it is yielded as is,
+    so the caller's transaction is joined instead of starting a new one.
+    """
+    if cursor is not None:
+        yield cursor
+        return
+
+    with get_pool().connection() as conn:
+        with conn.cursor(cursor_factory=cursor_factory) as new_cursor:
+            yield new_cursor
+
+
+def with_reconnect(func):
+    """
+    Retry a database function once when the connection was dropped under it.
+    The broken connection has already been discarded by the pool, so the
+    retry runs on a fresh one. Calls that joined a caller's cursor are not
+    retried here; the owner of the transaction retries it as a whole.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except DISCONNECT_ERRORS as e:
+            if kwargs.get("cursor") is not None:
+                raise
+            print(f"🔄 Database connection lost ({str(e).strip()}), retrying...")
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from openai import OpenAI
+from app.persistent_cache import PersistentCache
+from app.catalogue import COLLECTION_NAME
+
+# Must match the Supplements vectorizer; read from the collection config when unset
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "10"))
+
+# Phrase -> float32 vector, in memory and on disk. A phrase is embedded once.
+embedding_cache = PersistentCache(
+    "embeddings",
+    maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("EMBEDDING_CACHE_TTL", str(90 * 24 * 3600))),
+    dumps=lambda vector: np.asarray(vector, dtype=np.float32).tobytes(),
+    loads=lambda blob: np.frombuffer(blob, dtype=np.float32)
+)
+embedding_stats = {"lookups": 0, "computed": 0, "api_calls": 0, "api_errors": 0, "api_ms_total": 0.0, "lookup_ms_total": 0.0}
+
+_openai_client = None
+_model_settings: Optional[Dict[str, Any]] = None
+_settings_lock = threading.Lock()
+
+
+def _get_openai_client() -> OpenAI:
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = OpenAI(api_key=os.getenv("OPENAI_APIKEY"), timeout=EMBEDDING_TIMEOUT)
+    return _openai_client
+
+
+def embedding_settings(client_instance: Any) -> Dict[str, Any]:
+    """
+    The OpenAI model (and dimensions) the collection was vectorized with, so
+    query vectors land in the same space as the stored product vectors.
+    """
+    global _model_settings
+    if _model_settings is not None:
+        return _model_settings
+
+    with _settings_lock:
+        if _model_settings is None:
+            settings = {"model": EMBEDDING_MODEL or DEFAULT_EMBEDDING_MODEL, "dimensions": None}
+            if not EMBEDDING_MODEL and client_instance is not None:
+                try:
+                    config = client_instance.collections.get(COLLECTION_NAME).config.get().vectorizer_config
+                    model = (config.model if config else {}) or {}
+                    if model.get("model") == "ada":
+                        # Legacy text2vec-openai settings: model "ada" + modelVersion "002"
+                        settings["model"] = f"text-embedding-ada-{model.get('modelVersion', '002')}"
+                    elif model.get("model"):
+                        settings["model"] = model["model"]
+                    settings["dimensions"] = model.get("dimensions")
+                except Exception as e:
+                    print(f"⚠️ Could not read vectorizer config, using {settings['model']}: {str(e)}")
+            _model_settings = settings
+    return _model_settings
+
+
+def cache_key(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def embed_texts(texts: Sequence[str], client_instance: Any = None) -> List[np.ndarray]:
+    """Vectors for each text: cached ones from memory/disk, the rest in one API call"""
+    started = time.perf_counter()
+    keys = [cache_key(text) for text in texts]
+    vectors: Dict[str, np.ndarray] = {}
+    missing = []
+    for key in keys:
+        if key in vectors or key in missing:
+            continue
+        cached = embedding_cache.get(key)
+        if cached is not None:
+            vectors[key] = cached
+        else:
+            missing.append(key)
+
+    if missing:
+        settings = embedding_settings(client_instance)
+        request = {"model": settings["model"], "input": missing}
+        if settings["dimensions"]:
+            request["dimensions"] = settings["dimensions"]
+
+        api_started = time.perf_counter()
+        embedding_stats["api_calls"] += 1
+        try:
+            response = _get_openai_client().embeddings.create(**request)
+        except Exception:
+            embedding_stats["api_errors"] += 1
+            raise
+        finally:
+            embedding_stats["api_ms_total"] += 1000 * (time.perf_counter() - api_started)
+
+        for key, item in zip(missing, response.data):
+            vector = np.asarray(item.embedding, dtype=np.float32)
+            embedding_cache.set(key, vector)
+            vectors[key] = vector
+        embedding_stats["computed"] += len(missing)
+
+    embedding_stats["lookups"] += len(keys)
+    embedding_stats["lookup_ms_total"] += 1000 * (time.perf_counter() - started)
+    return [vectors[key] for key in keys]
+
+
+def embed_concepts(concepts: Sequence[str], client_instance: Any = None) -> np.ndarray:
+    """
+    One query vector for a list of concepts: the mean of their embeddings,
+    which is how Weaviate's near_text combines several concepts.
+    """
+    return np.mean(np.stack(embed_texts(concepts, client_instance)), axis=0)
+
+
+def get_embedding_stats() -> Dict[str, Any]:
+    stats = dict(embedding_stats)
+    lookups = stats["lookups"]
+    stats["hit_rate"] = round(1 - stats["computed"] / lookups, 3) if lookups else 0.0
+    stats["avg_lookup_ms"] = round(stats.pop("lookup_ms_total") / lookups, 3) if lookups else 0.0
+    stats["avg_api_ms"] = round(stats.pop("api_ms_total") / stats["api_calls"], 1) if stats["api_calls"] else 0.0
+    stats["model"] = _model_settings["model"] if _model_settings else None
+    stats["cache"] = embedding_cache.stats()
+    return stats
@@ -0,0 +1,87 @@
+import heapq
+import math
+from typing import Any, List, Optional, Sequence, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_xyz(lat: float, lng: float) -> Tuple[float, float, float]:
+    """Point on the unit sphere. Straight-line distance between these grows with great-circle distance."""
+    phi, lam = math.radians(lat), math.radians(lng)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+
+def chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    a = to_xyz(lat1, lng1)
+    b = to_xyz(lat2, lng2)
+    return chord_to_km(math.dist(a, b))
+
+
+def valid_coordinates(lat: Any, lng: Any) -> bool:
+    try:
+        return -90 <= float(lat) <= 90 and -180 <= float(lng) <= 180
+    except (TypeError, ValueError):
+        return False
+
+
+class _Node:
+    __slots__ = ("point", "item", "axis", "left", "right")
+
+    def __init__(self, point, item, axis, left, right):
+        self.point, self.item, self.axis, self.left, self.right = point, item, axis, left, right
+
+
+class KDTree:
+    """
+    Static 3-d tree over (lat, lng) points mapped onto the unit sphere, so
+    nearest neighbours are exact great-circle neighbours (no projection
+    error, no special case at the antimeridian). Built once per snapshot.
+    """
+
+    def __init__(self, points: Sequence[Tuple[float, float, Any]]):
+        entries = [(to_xyz(lat, lng), item) for lat, lng, item in points]
+        self.size = len(entries)
+        self._root = self._build(entries, 0)
+
+    def _build(self, entries: List[tuple], depth: int) -> Optional[_Node]:
+        if not entries:
+            return None
+        axis = depth % 3
+        entries.sort(key=lambda entry: entry[0][axis])
+        middle = len(entries) // 2
+        point, item = entries[middle]
+        return _Node(point, item, axis,
+                     self._build(entries[:middle], depth + 1),
+                     self._build(entries[middle + 1:], depth + 1))
+
+    def nearest(self, lat: float, lng: float, k: int = 1) -> List[Tuple[float, Any]]:
+        """The k closest items as (distance in km, item), closest first"""
+        if k <= 0 or self._root is None:
+            return []
+        target = to_xyz(lat, lng)
+        # Max-heap (negated distances) of the best k so far; the counter breaks ties
+        best: List[tuple] = []
+        counter = 0
+        # (node, distance from the target to the node's region along the split that led to it)
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if node is None or (len(best) == k and bound >= -best[0][0]):
+                continue
+            distance = math.dist(target, node.point)
+            if len(best) < k:
+                heapq.heappush(best, (-distance, counter, node.item))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, counter, node.item))
+            counter += 1
+
+            offset = target[node.axis] - node.point[node.axis]
+            near, far = (node.left, node.right) if offset < 0 else (node.right, node.left)
+            # Visited last: by then the near side has usually ruled it out
+            stack.append((far, abs(offset)))
+            stack.append((near, bound))
+        return [(chord_to_km(-d), item) for d, _, item in sorted(best, reverse=True)]
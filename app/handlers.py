@@ -1,9 +1,14 @@
 from enum import Enum
-from app.db import get_user_state, set_user_state, get_pueblos, get_pharmacy_address
-from utils import query_weaviate, match_category, normalize_text, append_history, get_weaviate_client, query_classifier as classifier
+from app.db import get_user_state
+from utils import match_category, normalize_text, append_history, get_weaviate_client, query_classifier as classifier
 from difflib import get_close_matches
 from datetime import datetime
-from app.analytics_db import AnalyticsDB, track_product_recommendation
+from app.analytics_events import UserGoals, LocationSearch, SessionEnd, product_recommendation_events
+from app.unit_of_work import TurnUnitOfWork
+from app.concurrency import run_with_timeout
+from app.recommendation_cache import get_recommendations, warm_recommendation_cache
+from app.catalogue_replica import catalogue_replica
+from app.pharmacy_directory import pharmacy_directory
 
 # MAIN_OPTIONS = [
 #     "Catálogo de Productos 💊",
@@ -50,58 +55,85 @@ class ChatStage(Enum):
     LOCATION = "localizacion"
     PRE_LOCATION = "pre-localizacion"
 
-def process_user_input(user_id, user_message):
-    state = get_user_state(user_id) or {"stage": ChatStage.MAIN_MENU.value, "context":{}}
+def warm_caches():
+    """Load the catalogue replica and pharmacy directory, and pre-run the fixed searches (REC_OPTIONS and cat_subcat) at startup"""
+    try:
+        catalogue_replica.load(get_weaviate_client())
+    except Exception as e:
+        print(f"⚠️ Catalogue replica load failed, searching Weaviate: {str(e)}")
+    try:
+        pharmacy_directory.load()
+    except Exception as e:
+        print(f"⚠️ Pharmacy directory load failed, loading on first use: {str(e)}")
+    try:
+        fixed_searches = [opt for opt in REC_OPTIONS if "otro" not in opt.lower()] + list(cat_subcat.values())
+        warm_recommendation_cache(get_weaviate_client(), fixed_searches)
+    except Exception as e:
+        print(f"⚠️ Cache warm-up failed: {str(e)}")
+
+def process_user_input(user_id, user_message, state=None, coords=None):
+    if state is None:
+        state = get_user_state(user_id)
+    state = state or {"stage": ChatStage.MAIN_MENU.value, "context":{}}
+
+    # (lat, lng) sent by the widget; used by the location step
+    if coords is not None:
+        state["context"]["coords"] = list(coords)
 
     if "session_start" not in state.get("context", {}):
         state["context"]["session_start"] = datetime.utcnow().isoformat() + "Z"
 
-    # Only create a new session if not already present
-    if "session_id" not in state["context"]:
-        session_id = AnalyticsDB.create_user_session(user_id)
-        state["context"]["session_id"] = session_id
-    else:
-        session_id = state["context"]["session_id"]
+    # All writes of this turn are collected here and committed together
+    uow = TurnUnitOfWork(user_id)
+
+    # Only create a new session if not already present; __init__ discards
+    # the context, so its session would never be used
+    if user_message != "__init__" and "session_id" not in state["context"]:
+        state["context"]["session_id"] = uow.start_session()
 
     append_history(state, "user", user_message)
     print(f"State at start {state}")
-    stage = state["stage"]
 
     if user_message == "__init__":
-        return handle_init(user_id, state)
-    return route_message(user_id, user_message, state)
+        response = handle_init(user_id, state, uow)
+    else:
+        response = route_message(user_id, user_message, state, uow)
+
+    uow.add_history(state.pop("history", []), session_id=state["context"].get("session_id"))
+    uow.flush()
+    return response
 
-def route_message(user_id, user_message, state):
+def route_message(user_id, user_message, state, uow):
   stage = state["stage"]
 
   match stage:
     case ChatStage.MAIN_MENU.value:
-        return handle_main_menu(user_id, user_message, state)
+        return handle_main_menu(user_id, user_message, state, uow)
     case ChatStage.PEDIDO.value:
-        return handle_pedido(user_id, user_message, state)
+        return handle_pedido(user_id, user_message, state, uow)
     case ChatStage.RECOMMENDATION.value:
-        return handle_recommendation(user_id, user_message, state)
+        return handle_recommendation(user_id, user_message, state, uow)
     case ChatStage.PERSONAL_ADVICE.value:
-        return handle_personal_advice(user_id, user_message, state)
+        return handle_personal_advice(user_id, user_message, state, uow)
     case ChatStage.ASK_MEDICAL.value:
-        return handle_medical(user_id, user_message, state)
+        return handle_medical(user_id, user_message, state, uow)
     case ChatStage.ASK_PREFERENCE.value:
-        return handle_preference(user_id, user_message, state)
+        return handle_preference(user_id, user_message, state, uow)
     case ChatStage.CUSTOM_QUERY.value:
-        return handle_custom_query(user_id, user_message, state)
+        return handle_custom_query(user_id, user_message, state, uow)
     case ChatStage.PRE_LOCATION.value:
-        return handle_pre_location(user_id, user_message, state)
+        return handle_pre_location(user_id, user_message, state, uow)
     case ChatStage.LOCATION.value:
-        return handle_location(user_id, user_message, state)
+        return handle_location(user_id, user_message, state, uow)
     case ChatStage.DONE.value:
-        return handle_done(user_id, user_message, state)
+        return handle_done(user_id, user_message, state, uow)
     case _:
         return fallback_response()
 
-def handle_init(user_id, state):
+def handle_init(user_id, state, uow):
   state["stage"] = ChatStage.MAIN_MENU.value
   state["context"] = {}
-  set_user_state(user_id, state)
+  uow.set_state(state)
   
 #   response = {
 #       "text": "👋 ¡Hola! Soy tu asistente de salud de Xtravit. ¿Qué deseas hacer hoy?",
@@ -121,7 +153,7 @@ def handle_init(user_id, state):
   append_history(state, "bot", response["text"])
   return response
 
-def handle_main_menu(user_id, user_message, state):
+def handle_main_menu(user_id, user_message, state, uow):
   clean_message = normalize_text(user_message)
 
   classification = classifier(clean_message, MAIN_OPTIONS)
@@ -131,7 +163,7 @@ def handle_main_menu(user_id, user_message, state):
   if selected:
     if "catálogo" in selected.lower():
         state["stage"] = ChatStage.RECOMMENDATION.value
-        set_user_state(user_id, state)
+        uow.set_state(state)
         
         response = {
             "text": "¿Qué estás buscando mejorar?",
@@ -142,7 +174,7 @@ def handle_main_menu(user_id, user_message, state):
 
     elif "personalizada" in selected.lower():
         state["stage"] = ChatStage.PERSONAL_ADVICE.value
-        set_user_state(user_id, state)
+        uow.set_state(state)
         
         response = {
             "text": "¿Cuál es tu objetivo principal de salud?"
@@ -152,7 +184,7 @@ def handle_main_menu(user_id, user_message, state):
 
     elif "pedidos" in selected.lower():
         state["stage"] = ChatStage.PEDIDO.value
-        set_user_state(user_id, state)
+        uow.set_state(state)
         
         response = {
             "text": "¿En qué puedo ayudarte con tu pedido?",
@@ -164,7 +196,7 @@ def handle_main_menu(user_id, user_message, state):
     # FOR ADDING OTHER OPTIONS!
     # elif "promociones" in selected.lower():
     #     state["stage"] = ChatStage.DONE.value
-    #     set_user_state(user_id, state)
+    #     uow.set_state(state)
         
     #     response = {
     #         "text": "¡Excelente! ¿Te gustaría recibir un cupón o ver productos en oferta?",
@@ -178,11 +210,11 @@ def handle_main_menu(user_id, user_message, state):
       "options": MAIN_OPTIONS
   }
 
-def handle_pedido(user_id, user_message, state):
+def handle_pedido(user_id, user_message, state, uow):
     clean_message = normalize_text(user_message)
     # You can use a classifier or just check for keywords
     if "cambio" in clean_message or "devolucion" in clean_message or "devolución" in clean_message:
-        return handle_pedidos(user_id, user_message, state)
+        return handle_pedidos(user_id, user_message, state, uow)
     elif "estado" in clean_message:
         # Implement a handler for order status if you want
         return {
@@ -194,11 +226,11 @@ def handle_pedido(user_id, user_message, state):
             "options": ["Estado del pedido", "Cambios y devoluciones"]
         }
     
-def handle_pedidos(user_id, user_message, state):
+def handle_pedidos(user_id, user_message, state, uow):
     ctx = state.setdefault("context", {})
     state["stage"] = ChatStage.DONE.value
     state["context"] = ctx
-    set_user_state(user_id, state)
+    uow.set_state(state)
     print(f"🧠 New stage set to: {state['stage']}")
     response = {
         "messages": [
@@ -210,7 +242,7 @@ def handle_pedidos(user_id, user_message, state):
     append_history(state, "bot", "Información sobre Pedidos, Devoluciones y Cambios enviada.")
     return response
         
-def handle_personal_advice(user_id, user_message, state):
+def handle_personal_advice(user_id, user_message, state, uow):
   # Store initial message
   ctx = state.setdefault("context", {})
   health_goal = normalize_text(user_message)
@@ -219,7 +251,7 @@ def handle_personal_advice(user_id, user_message, state):
       
   state["stage"] = ChatStage.ASK_MEDICAL.value
   state["context"] = ctx
-  set_user_state(user_id, state)
+  uow.set_state(state)
   print(f"🧠 New stage set to: {state['stage']}")
   
   response = {
@@ -228,12 +260,12 @@ def handle_personal_advice(user_id, user_message, state):
   append_history(state, "bot", response["text"])
   return response
 
-def handle_medical(user_id, user_message, state):
+def handle_medical(user_id, user_message, state, uow):
   ctx = state.setdefault("context", {})
   ctx["medical"] = normalize_text(user_message)
   state["stage"] = ChatStage.ASK_PREFERENCE.value
   state["context"] = ctx
-  set_user_state(user_id, state)
+  uow.set_state(state)
   print(f"🧠 New stage set to: {state['stage']}")
   
   response = {
@@ -242,7 +274,7 @@ def handle_medical(user_id, user_message, state):
   append_history(state, "bot", response["text"])
   return response
 
-def handle_preference(user_id, user_message, state):
+def handle_preference(user_id, user_message, state, uow):
     ctx = state.setdefault("context", {})
     ctx["preference"] = normalize_text(user_message)
     state["context"] = ctx
@@ -251,27 +283,27 @@ def handle_preference(user_id, user_message, state):
     query_terms = [ctx["health_goal"], ctx["preference"]]
     # Get Weaviate client and query
     client = get_weaviate_client()
-    results = query_weaviate(query_terms, client)
+    results = run_with_timeout(get_recommendations, query_terms, client, default=[])
     state["stage"] = ChatStage.PRE_LOCATION.value
 
-    AnalyticsDB.save_user_goals(
+    uow.track(UserGoals(
       user_id=user_id,
       session_id=session_id,
       health_goal=ctx.get("health_goal"),
       medical_condition=ctx.get("medical"),
       supplement_preference=ctx.get("preference"),
       pueblo=ctx.get("pueblo")
-      )
+      ))
 
-    track_product_recommendation(
+    uow.track(*product_recommendation_events(
       user_id=user_id,
       session_id=session_id,
       products=results,
       stage=state["stage"],
       context=state.get("context")
-      )
+      ))
     
-    set_user_state(user_id, state)
+    uow.set_state(state)
     print(f"🧠 New stage set to: {state['stage']}")
     response = {
         "text": f"Aquí tienes algunas recomendaciones:",
@@ -282,7 +314,7 @@ def handle_preference(user_id, user_message, state):
     append_history(state, "bot", response["text"])
     return response
 
-def handle_recommendation(user_id, user_message, state):
+def handle_recommendation(user_id, user_message, state, uow):
     recomendations = [
         "Energía y Vitalidad", 
         "Sueño y Relajación", 
@@ -297,7 +329,7 @@ def handle_recommendation(user_id, user_message, state):
     # Handle Other option
     if any(term in clean_message for term in ["otro", "especificar"]):
         state["stage"] = ChatStage.CUSTOM_QUERY.value
-        set_user_state(user_id, state)
+        uow.set_state(state)
         
         response = {
             "text": "Por favor, describe específicamente lo que estás buscando mejorar:"
@@ -311,21 +343,21 @@ def handle_recommendation(user_id, user_message, state):
     
     # Get Weaviate client and query
     client = get_weaviate_client()
-    results = query_weaviate(selected, client)
+    results = run_with_timeout(get_recommendations, selected, client, default=[])
     print("DEBUG PRODUCTS:", results)
 
     session_id = state["context"].get("session_id")
 
-    track_product_recommendation(
+    uow.track(*product_recommendation_events(
       user_id=user_id,
       session_id=session_id,
       products=results,
       stage=state["stage"],
       context=state.get("context")
-      )
+      ))
     
     state["stage"] = ChatStage.PRE_LOCATION.value
-    set_user_state(user_id, state)
+    uow.set_state(state)
     print(f"🧠 New stage set to: {state['stage']}")
     
     response = {
@@ -337,25 +369,25 @@ def handle_recommendation(user_id, user_message, state):
     append_history(state, "bot", response["text"])
     return response
 
-def handle_custom_query(user_id, user_message, state):
+def handle_custom_query(user_id, user_message, state, uow):
     clean_message = normalize_text(user_message)
     classification = classifier(clean_message, list(cat_subcat.keys()))
     match = classification["labels"][0]
 
     # Get Weaviate client and query
     client = get_weaviate_client()
-    results = query_weaviate(cat_subcat[match], client)
+    results = run_with_timeout(get_recommendations, cat_subcat[match], client, default=[])
     session_id = state["context"].get("session_id")
-    track_product_recommendation(
+    uow.track(*product_recommendation_events(
       user_id=user_id,
       session_id=session_id,
       products=results,
       stage=state["stage"],
       context=state.get("context")
-      )
+      ))
 
     state["stage"] = ChatStage.PRE_LOCATION.value
-    set_user_state(user_id, state)
+    uow.set_state(state)
     print(f"🧠 New stage set to: {state['stage']}")
 
     response = {
@@ -367,13 +399,13 @@ def handle_custom_query(user_id, user_message, state):
     append_history(state, "bot", response["text"])
     return response
 
-def handle_pre_location(user_id, user_message, state):
+def handle_pre_location(user_id, user_message, state, uow):
     ctx = state.setdefault("context", {})
     ctx["pueblo"] = normalize_text(user_message)
     state["context"] = ctx
     if "Si" in user_message:
         state["stage"] = ChatStage.LOCATION.value
-        set_user_state(user_id, state)
+        uow.set_state(state)
         response = {
            "text":"¿En que pueblo resides?"
         }
@@ -381,56 +413,64 @@ def handle_pre_location(user_id, user_message, state):
         return response
     
     state["stage"] = ChatStage.DONE.value
-    set_user_state(user_id, state)
+    uow.set_state(state)
     response = {
         "text": "¡De acuerdo!"
     }
     append_history(state, "bot", response["text"])
     return response
    
-def handle_location(user_id, user_message, state):
+def handle_location(user_id, user_message, state, uow):
    # Get the response as to if the want the pharmacies or not. 
 
-   # Query the latest pueblo table
-   pueblos = get_pueblos()
+   # Pueblos and their pharmacies come from memory (app.pharmacy_directory)
+   pueblos = pharmacy_directory.pueblos()
    state["stage"] = ChatStage.DONE.value
    clean_message = normalize_text(user_message).upper()
    # Save the Pueblo to the database inside the context.
    state["context"]["Pueblo"] = clean_message.upper()
-   set_user_state(user_id, state)
+   uow.set_state(state)
 
    # Find the closest matching pueblo
    results = classifier(clean_message, pueblos)
    matched_pueblo = results["labels"][0]
    
-   # Get pharmacy information for the matched pueblo
-   pharmacy_jsons = get_pharmacy_address(matched_pueblo)
+   # Nearest pharmacies to the user's position when the widget sent one,
+   # otherwise the matched pueblo's, most central first
+   coords = state["context"].get("coords")
+   if coords:
+      pharmacy_jsons = pharmacy_directory.nearest(coords[0], coords[1])
+   else:
+      pharmacy_jsons = pharmacy_directory.lookup(matched_pueblo)
 
    # Extract pharmacy names and their Google Maps links
    pharmacy_info = []
    for pharmacy in pharmacy_jsons:
-      pharmacy_info.append({
+      info = {
          "name": pharmacy["Pharmacy"],
          "maps_link": pharmacy["Location"]
-      })
+      }
+      if "distance_km" in pharmacy:
+         info["distance_km"] = pharmacy["distance_km"]
+      pharmacy_info.append(info)
 
-   AnalyticsDB.track_location_search(
+   uow.track(LocationSearch(
       pueblo=matched_pueblo,
       pharmacy_name=pharmacy_info[0]["name"] if pharmacy_info else None,
       successful=bool(pharmacy_info)
-  )
+  ))
    
    response = {
-      "text": f"Estas son las farmacias más cercanas en {matched_pueblo}:",
+      "text": "Estas son las farmacias más cercanas a tu ubicación:" if coords else f"Estas son las farmacias más cercanas en {matched_pueblo}:",
       "pharmacies": pharmacy_info
    }
    append_history(state, "bot", response["text"])
    return response
 
-def handle_done(user_id, user_message, state):
+def handle_done(user_id, user_message, state, uow):
   state["stage"] = ChatStage.MAIN_MENU.value
   state["context"]["session_end"] = datetime.utcnow().isoformat() + "Z"
-  set_user_state(user_id, state)
+  uow.set_state(state)
   print(f"🧠 New stage set to: {state['stage']}")
   session_id = state["context"].get("session_id")
 
@@ -439,7 +479,7 @@ def handle_done(user_id, user_message, state):
     "options": MAIN_OPTIONS
   }
   append_history(state, "bot", response["text"])
-  AnalyticsDB.update_session_end(session_id)
+  uow.track(SessionEnd(session_id=session_id))
   return response
 
 
@@ -0,0 +1,144 @@
+import os
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Set
+
+# Similarity (0..1) a fuzzy match needs before it is trusted over the NLI model
+MATCH_THRESHOLD = float(os.getenv("MATCH_THRESHOLD", "0.8"))
+# Trigram candidates that get the (slower) edit-distance check
+MAX_CANDIDATES = 5
+# Labels shorter than this are never matched as a phrase inside longer text
+# or accepted on the single-typo rule
+MIN_PHRASE_LENGTH = 4
+
+
+class Match(NamedTuple):
+    label: str
+    score: float
+    method: str  # "exact", "phrase" or "fuzzy"
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str) -> int:
+    """
+    Optimal string alignment distance: insertions, deletions, substitutions
+    and adjacent transpositions ("pnoce" -> "ponce") all cost one edit.
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            cost = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            )
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                cost = min(cost, before_previous[j - 2] + 1)
+            current.append(cost)
+        before_previous, previous = previous, current
+    return previous[-1]
+
+
+class OptionMatcher:
+    """
+    Resolves free text against a closed vocabulary (menu options, pueblos)
+    without a model call: an exact hash lookup on the normalized text, then
+    word n-gram lookups for a label inside a sentence ("vivo en juana diaz"),
+    then a trigram index that shortlists labels for an edit-distance check.
+    Anything scoring under the threshold is left for the NLI classifier.
+    """
+
+    def __init__(self, labels: Sequence[str], normalize: Callable[[str], str], threshold: float = MATCH_THRESHOLD):
+        self.labels = list(labels)
+        self.normalize = normalize
+        self.threshold = threshold
+        self.exact: Dict[str, str] = {}
+        self.index: Dict[str, List[int]] = {}
+        self.keys: List[str] = []
+
+        for label in self.labels:
+            key = normalize(label)
+            if not key or key in self.exact:
+                continue
+            self.exact[key] = label
+            position = len(self.keys)
+            self.keys.append(key)
+            for gram in trigrams(key):
+                self.index.setdefault(gram, []).append(position)
+
+        self.max_words = max((len(key.split()) for key in self.keys), default=0)
+
+    def match(self, text: str) -> Optional[Match]:
+        key = self.normalize(text)
+        if not key:
+            return None
+
+        label = self.exact.get(key)
+        if label is not None:
+            return Match(label, 1.0, "exact")
+
+        phrase = self._match_phrase(key)
+        if phrase is not None:
+            return Match(self.exact[phrase], 0.95, "phrase")
+
+        return self._match_fuzzy(key)
+
+    def _match_phrase(self, key: str) -> Optional[str]:
+        """Label appearing as whole words inside longer text, if unambiguous"""
+        words = key.split()
+        found = set()
+        for size in range(min(self.max_words, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                phrase = " ".join(words[start:start + size])
+                if len(phrase) >= MIN_PHRASE_LENGTH and phrase in self.exact:
+                    found.add(phrase)
+        if not found:
+            return None
+        # "san sebastian" may contain no other label, but two unrelated labels
+        # in one message ("ponce o yauco") are left to the model
+        longest = max(found, key=len)
+        if all(other in longest for other in found):
+            return longest
+        return None
+
+    def _match_fuzzy(self, key: str) -> Optional[Match]:
+        """Best edit-distance match among the labels sharing the most trigrams"""
+        shared = Counter(position for gram in trigrams(key) for position in self.index.get(gram, ()))
+        if not shared:
+            return None
+
+        scored = sorted(
+            ((edit_distance(key, self.keys[position]), self.keys[position]) for position, _ in shared.most_common(MAX_CANDIDATES)),
+            key=lambda item: item[0]
+        )
+        distance, candidate = scored[0]
+        score = 1.0 - distance / max(len(key), len(candidate))
+        runner_up = scored[1][0] if len(scored) > 1 else None
+
+        # Short names ("moca", "coamo") fall under the ratio with a single typo,
+        # so one edit is also accepted when no other label is nearly as close
+        single_typo = distance == 1 and len(candidate) >= MIN_PHRASE_LENGTH and (runner_up is None or runner_up >= 3)
+        if score >= self.threshold or single_typo:
+            return Match(self.exact[candidate], round(score, 3), "fuzzy")
+        return None
+
+
+@lru_cache(maxsize=32)
+def _cached_matcher(labels: tuple, normalize: Callable[[str], str], threshold: float) -> OptionMatcher:
+    return OptionMatcher(labels, normalize, threshold)
+
+
+def get_matcher(labels: Sequence[str], normalize: Callable[[str], str], threshold: float = MATCH_THRESHOLD) -> OptionMatcher:
+    """Matcher for a label set, built once and reused while the labels stay the same"""
+    return _cached_matcher(tuple(labels), normalize, threshold)
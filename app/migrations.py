@@ -0,0 +1,237 @@
+import sys
+import json
+import argparse
+from typing import Any, Callable, Dict, List, Tuple
+import psycopg2
+from app.db_pool import get_cursor
+from app.db import create_chat_state_current_table
+from app.transcript import create_chat_messages_table
+from app.catalogue import create_data_versions_table
+from app.analytics_db import widen_session_id_columns
+from app.rollups import create_rollup_tables
+from app.chat_state_partitions import create_chat_session_summaries_table
+from app.pharmacy_directory import pueblo_key
+
+# Key for pg_advisory_xact_lock: two workers starting at once apply each migration once
+MIGRATION_LOCK_ID = 716000
+
+
+def _base_tables(cursor):
+    """Tables the app has always used but nothing in the repo created"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_state (
+            id SERIAL PRIMARY KEY,
+            user_id TEXT,
+            stage TEXT,
+            context JSONB,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            id BIGSERIAL PRIMARY KEY,
+            user_id TEXT,
+            session_start TIMESTAMP,
+            session_end TIMESTAMP,
+            completed_journey BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS product_interactions (
+            id SERIAL PRIMARY KEY,
+            user_id TEXT,
+            session_id BIGINT,
+            product_name TEXT,
+            product_category TEXT,
+            stage TEXT,
+            user_goal TEXT,
+            user_preference TEXT,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_goals (
+            id SERIAL PRIMARY KEY,
+            user_id TEXT,
+            session_id BIGINT,
+            health_goal TEXT,
+            medical_condition TEXT,
+            supplement_preference TEXT,
+            pueblo TEXT,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS location_analytics (
+            id SERIAL PRIMARY KEY,
+            pueblo TEXT,
+            pharmacy_name TEXT,
+            last_searched TIMESTAMP,
+            interaction_time TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pueblos (
+            "Customer Name" TEXT,
+            Address TEXT,
+            Pueblo TEXT
+        )
+    """)
+
+
+def _app_tables(cursor):
+    create_chat_state_current_table(cursor)
+    create_chat_messages_table(cursor)
+    create_data_versions_table(cursor)
+
+
+def _analytics_tables(cursor):
+    create_rollup_tables(cursor)
+    create_chat_session_summaries_table(cursor)
+
+
+def _add_foreign_key(cursor, table: str, name: str):
+    cursor.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (name,))
+    if cursor.fetchone() is None:
+        # NOT VALID: enforced for new rows without scanning (or failing on) old ones
+        cursor.execute(f"""
+            ALTER TABLE {table} ADD CONSTRAINT {name}
+            FOREIGN KEY (session_id) REFERENCES user_sessions (id) NOT VALID
+        """)
+
+
+def _hot_path_indexes(cursor):
+    # Latest state per user (get_user_state fallback, history)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_state_user ON chat_state (user_id, id DESC)")
+
+    # Pharmacy lookup by pueblo: exact match on a normalized key ...
+    cursor.execute("ALTER TABLE pueblos ADD COLUMN IF NOT EXISTS pueblo_key TEXT GENERATED ALWAYS AS (lower(trim(pueblo))) STORED")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pueblos_key ON pueblos (pueblo_key)")
+    # ... and trigrams for the ILIKE '%...%' fallback, where the extension is available
+    cursor.execute("SAVEPOINT trgm")
+    try:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_pueblos_trgm ON pueblos USING gin (pueblo gin_trgm_ops)")
+        cursor.execute("RELEASE SAVEPOINT trgm")
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT trgm")
+        print(f"⚠️ pg_trgm unavailable, skipping trigram index: {str(e).splitlines()[0]}")
+
+    # Analytics rows by session, and sessions they must point to
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_interactions_session ON product_interactions (session_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_goals_session ON user_goals (session_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_sessions_user ON user_sessions (user_id)")
+    _add_foreign_key(cursor, "product_interactions", "fk_product_interactions_session")
+    _add_foreign_key(cursor, "user_goals", "fk_user_goals_session")
+
+
+def _pharmacy_coordinates(cursor):
+    # Filled from the Google Places geometry by pharmacy_location_scraping.py
+    cursor.execute("ALTER TABLE pueblos ADD COLUMN IF NOT EXISTS lat DOUBLE PRECISION")
+    cursor.execute("ALTER TABLE pueblos ADD COLUMN IF NOT EXISTS lng DOUBLE PRECISION")
+
+
+def _folded_pueblo_key(cursor):
+    # pueblo_key becomes a plain column so it can hold the accent-folded key
+    # the loader and the pharmacy directory use ("Mayagüez" -> "mayaguez")
+    cursor.execute("ALTER TABLE pueblos ALTER COLUMN pueblo_key DROP EXPRESSION IF EXISTS")
+    cursor.execute("SELECT DISTINCT pueblo FROM pueblos WHERE pueblo IS NOT NULL")
+    for (pueblo,) in cursor.fetchall():
+        cursor.execute("UPDATE pueblos SET pueblo_key = %s WHERE pueblo = %s", (pueblo_key(pueblo), pueblo))
+
+
+# (version, name, function(cursor)). Append only; every step must be idempotent
+# so databases set up by hand before this module existed migrate cleanly.
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "base_tables", _base_tables),
+    (2, "session_id_bigint", widen_session_id_columns),
+    (3, "app_tables", _app_tables),
+    (4, "analytics_tables", _analytics_tables),
+    (5, "hot_path_indexes", _hot_path_indexes),
+    (6, "pharmacy_coordinates", _pharmacy_coordinates),
+    (7, "folded_pueblo_key", _folded_pueblo_key),
+]
+
+
+def create_schema_migrations_table(cursor=None):
+    with get_cursor(cursor) as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT NOW()
+            )
+        """)
+
+
+def migrate() -> List[str]:
+    """Apply pending migrations in order, each in its own transaction"""
+    create_schema_migrations_table()
+    applied = []
+    for version, name, step in MIGRATIONS:
+        with get_cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cursor.fetchone():
+                continue
+            print(f"Applying migration {version}: {name}")
+            step(cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        applied.append(name)
+    print(f"Schema up to date ({len(applied)} migrations applied)")
+    return applied
+
+
+# Queries on the request path. Each must be answerable from an index.
+HOT_QUERIES: Dict[str, Tuple[str, tuple]] = {
+    "current_state": ("SELECT stage, context FROM chat_state_current WHERE user_id = %s", ("u",)),
+    "latest_state": ("SELECT id, stage, context FROM chat_state WHERE user_id = %s ORDER BY id DESC LIMIT 1", ("u",)),
+    "pharmacies_by_pueblo": ('SELECT "Customer Name", address FROM pueblos WHERE pueblo_key = %s LIMIT 2', ("ponce",)),
+    "recent_messages": ("SELECT message FROM chat_messages WHERE user_id = %s ORDER BY id DESC LIMIT 10", ("u",)),
+    "session_by_id": ("SELECT id FROM user_sessions WHERE id = %s", (1,)),
+    "interactions_by_session": ("SELECT id FROM product_interactions WHERE session_id = %s", (1,)),
+    "goals_by_session": ("SELECT id FROM user_goals WHERE session_id = %s", (1,)),
+    "data_version": ("SELECT version FROM data_versions WHERE name = %s", ("catalogue",)),
+    "rollup": ("SELECT key, count FROM analytics_rollups WHERE granularity = %s AND dimension = %s AND bucket_start >= NOW()", ("day", "product")),
+}
+
+
+def _seq_scans(plan: Dict[str, Any]) -> List[str]:
+    found = [plan.get("Relation Name", "?")] if plan.get("Node Type") == "Seq Scan" else []
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def check_query_plans() -> Dict[str, List[str]]:
+    """
+    EXPLAIN every hot query with sequential scans disabled. The planner then
+    only picks a Seq Scan when no index can serve the query, so this holds
+    even on near-empty development databases. Returns {query: [tables]} for
+    the queries that failed.
+    """
+    failures = {}
+    with get_cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        for name, (query, params) in HOT_QUERIES.items():
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            tables = _seq_scans(plan[0]["Plan"])
+            if tables:
+                failures[name] = tables
+                print(f"❌ {name}: sequential scan on {', '.join(tables)}")
+            else:
+                print(f"✅ {name}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema migrations and check hot query plans")
+    parser.add_argument("--check", action="store_true", help="Only run the query plan check")
+    args = parser.parse_args()
+    if not args.check:
+        migrate()
+    sys.exit(1 if check_query_plans() else 0)
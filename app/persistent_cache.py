@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Optional
+from cachetools import TTLCache
+
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+
+
+class PersistentCache:
+    """
+    Two-tier key/value cache: a bounded LRU+TTL dict in memory in front of a
+    SQLite file, so entries survive restarts. The disk tier applies the same
+    TTL and is trimmed to `disk_maxsize` entries, least recently used first.
+    If the cache file cannot be opened the cache keeps working in memory only.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = 1000,
+        ttl: float = 86400,
+        disk_maxsize: int = 50000,
+        dumps: Callable[[Any], Any] = json.dumps,
+        loads: Callable[[Any], Any] = json.loads,
+        path: Optional[str] = None
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.disk_maxsize = disk_maxsize
+        self.dumps = dumps
+        self.loads = loads
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._db = self._open(path or os.path.join(CACHE_DIR, f"{name}.sqlite3"))
+
+    def _open(self, path: str):
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    stored_at REAL NOT NULL,
+                    used_at REAL NOT NULL
+                )
+            """)
+            db.commit()
+            return db
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ Cache '{self.name}' running in memory only: {e}")
+            return None
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._stats["memory_hits"] += 1
+                return value
+
+            if self._db is not None:
+                now = time.time()
+                try:
+                    row = self._db.execute(
+                        "SELECT value FROM entries WHERE key = ? AND stored_at > ?",
+                        (key, now - self.ttl)
+                    ).fetchone()
+                    if row is not None:
+                        self._db.execute("UPDATE entries SET used_at = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        value = self.loads(row[0])
+                        self._memory[key] = value
+                        self._stats["disk_hits"] += 1
+                        return value
+                except sqlite3.Error as e:
+                    print(f"⚠️ Cache '{self.name}' read failed: {e}")
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._memory[key] = value
+            if self._db is None:
+                return
+            now = time.time()
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, stored_at, used_at) VALUES (?, ?, ?, ?)",
+                    (key, self.dumps(value), now, now)
+                )
+                self._writes += 1
+                if self._writes % 500 == 0:
+                    self._prune(now)
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Cache '{self.name}' write failed: {e}")
+
+    def _prune(self, now: float):
+        self._db.execute("DELETE FROM entries WHERE stored_at <= ?", (now - self.ttl,))
+        self._db.execute("""
+            DELETE FROM entries WHERE key IN (
+                SELECT key FROM entries ORDER BY used_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.disk_maxsize,))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM entries")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_size"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
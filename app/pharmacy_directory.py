@@ -0,0 +1,183 @@
+import os
+import csv
+import time
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.db_pool import get_cursor, with_reconnect
+from app.catalogue import get_data_version
+from app.concurrency import submit_background
+from app.geo import KDTree, haversine_km, valid_coordinates
+
+# How often (seconds) a worker checks the shared 'pharmacies' version for a reload
+PHARMACY_DIRECTORY_CHECK_INTERVAL = float(os.getenv("PHARMACY_DIRECTORY_CHECK_INTERVAL", "60"))
+DATA_VERSION_NAME = "pharmacies"
+# Pharmacy CSV (Customer Name, Address, Pueblo, Lat, Lng) used when Postgres can't be reached
+PHARMACY_LOCATIONS_FILE = os.getenv("PHARMACY_LOCATIONS_FILE", "pharmacy_locations.csv")
+
+
+def pueblo_key(name: str) -> str:
+    """Lookup key for a pueblo: trimmed, lower case, accents folded, single spaces"""
+    if not name:
+        return ""
+    folded = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return " ".join(folded.lower().split())
+
+
+class PharmacyDirectory:
+    """
+    The pueblos table held in memory as {pueblo key: [pharmacies]}, plus a
+    k-d tree over the pharmacies that have coordinates. Each pueblo's list is
+    ranked by distance from the pueblo's centroid (the mean of its
+    pharmacies), pharmacies without coordinates last in table order.
+    Snapshots are replaced whole, so lookups don't need the lock. Reloaded
+    when the shared 'pharmacies' data version changes (see
+    load_pharmacies_from_csv); the check runs in the background, so a lookup
+    never waits on the database once the directory is loaded.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pharmacies: Dict[str, List[Dict[str, Any]]] = {}
+        self._names: List[str] = []
+        self._centroids: Dict[str, Tuple[float, float]] = {}
+        self._tree = KDTree([])
+        self._version: Optional[int] = None
+        self._loaded = False
+        self._last_check = 0.0
+        self._checking = False
+        self.stats = {"lookups": 0, "misses": 0, "nearest": 0, "loads": 0, "load_errors": 0, "last_load_ms": 0.0}
+
+    @with_reconnect
+    def load(self):
+        """Read the pueblos table and replace the snapshot"""
+        started = time.perf_counter()
+        try:
+            with get_cursor() as cursor:
+                cursor.execute("SELECT version FROM data_versions WHERE name = %s", (DATA_VERSION_NAME,))
+                row = cursor.fetchone()
+                version = row[0] if row else 0
+                cursor.execute('SELECT "Customer Name", address, pueblo, lat, lng FROM pueblos')
+                rows = cursor.fetchall()
+        except Exception:
+            self.stats["load_errors"] += 1
+            raise
+        self._replace(rows, version, started)
+
+    def load_file(self, path: str = PHARMACY_LOCATIONS_FILE):
+        """Build the directory from a pharmacy CSV instead of Postgres (offline use)"""
+        started = time.perf_counter()
+        with open(path, newline="", encoding="utf-8") as file:
+            rows = [
+                (row["Customer Name"], row["Address"], row["Pueblo"], row.get("Lat") or None, row.get("Lng") or None)
+                for row in csv.DictReader(file)
+            ]
+        self._replace(rows, None, started)
+
+    def _replace(self, rows: Iterable[tuple], version: Optional[int], started: float):
+        pharmacies: Dict[str, List[Dict[str, Any]]] = {}
+        names: Dict[str, str] = {}
+        located = []
+        for name, address, pueblo, lat, lng in rows:
+            key = pueblo_key(pueblo)
+            if not key:
+                continue
+            names.setdefault(key, pueblo.strip())
+            pharmacy = {"Pharmacy": name, "Location": address, "Pueblo": pueblo.strip()}
+            if lat is not None and valid_coordinates(lat, lng):
+                pharmacy["lat"], pharmacy["lng"] = float(lat), float(lng)
+                located.append((pharmacy["lat"], pharmacy["lng"], pharmacy))
+            pharmacies.setdefault(key, []).append(pharmacy)
+
+        centroids = {}
+        for key, entries in pharmacies.items():
+            points = [(p["lat"], p["lng"]) for p in entries if "lat" in p]
+            if points:
+                centroid = (sum(lat for lat, _ in points) / len(points), sum(lng for _, lng in points) / len(points))
+                centroids[key] = centroid
+                # The sort is stable: pharmacies without coordinates keep their order at the end
+                entries.sort(key=lambda p: haversine_km(*centroid, p["lat"], p["lng"]) if "lat" in p else float("inf"))
+
+        tree = KDTree(located)
+        with self._lock:
+            self._pharmacies = pharmacies
+            self._names = sorted(names.values())
+            self._centroids = centroids
+            self._tree = tree
+            self._version = version
+            self._loaded = True
+            self._last_check = time.monotonic()
+        self.stats["loads"] += 1
+        self.stats["last_load_ms"] = round(1000 * (time.perf_counter() - started), 1)
+        print(f"🏥 Pharmacy directory loaded: {sum(len(p) for p in pharmacies.values())} pharmacies "
+              f"({tree.size} located) in {len(pharmacies)} pueblos ({self.stats['last_load_ms']} ms)")
+
+    def _check_version(self):
+        try:
+            version = get_data_version(DATA_VERSION_NAME)
+            if version != self._version:
+                print(f"🔄 Pharmacy data changed (version {version}), reloading directory")
+                self.load()
+        finally:
+            with self._lock:
+                self._checking = False
+
+    def ensure_fresh(self):
+        """Load on first use; afterwards check the shared version in the background (rate limited)"""
+        if not self._loaded:
+            try:
+                self.load()
+            except Exception as e:
+                if not os.path.exists(PHARMACY_LOCATIONS_FILE):
+                    raise
+                print(f"⚠️ Pharmacy directory load failed, using {PHARMACY_LOCATIONS_FILE}: {str(e)}")
+                self.load_file()
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._checking or now - self._last_check < PHARMACY_DIRECTORY_CHECK_INTERVAL:
+                return
+            self._checking = True
+            self._last_check = now
+        submit_background(self._check_version)
+
+    def pueblos(self) -> List[str]:
+        """Every pueblo name, sorted (replaces the SELECT DISTINCT of get_pueblos)"""
+        self.ensure_fresh()
+        return self._names
+
+    def lookup(self, pueblo: str, limit: Optional[int] = 2) -> List[Dict[str, Any]]:
+        """Pharmacies of exactly this pueblo (after normalization), first `limit` of them"""
+        self.ensure_fresh()
+        self.stats["lookups"] += 1
+        pharmacies = self._pharmacies.get(pueblo_key(pueblo), [])
+        if not pharmacies:
+            self.stats["misses"] += 1
+        return [dict(p) for p in pharmacies[:limit]]
+
+    def centroid(self, pueblo: str) -> Optional[Tuple[float, float]]:
+        """Mean position of a pueblo's located pharmacies"""
+        self.ensure_fresh()
+        return self._centroids.get(pueblo_key(pueblo))
+
+    def nearest(self, lat: float, lng: float, k: int = 2) -> List[Dict[str, Any]]:
+        """The k pharmacies closest to a point, closest first, with distance_km"""
+        self.ensure_fresh()
+        self.stats["nearest"] += 1
+        return [{**pharmacy, "distance_km": round(distance, 2)} for distance, pharmacy in self._tree.nearest(lat, lng, k)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "pueblos": len(self._pharmacies),
+            "pharmacies": sum(len(p) for p in self._pharmacies.values()),
+            "located": self._tree.size,
+            "version": self._version,
+        }
+
+
+pharmacy_directory = PharmacyDirectory()
+
+
+def get_pharmacy_directory_stats() -> Dict[str, Any]:
+    return pharmacy_directory.get_stats()
@@ -0,0 +1,63 @@
+import os
+import copy
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from cachetools import TTLCache
+from app.catalogue import on_catalogue_change, check_catalogue_version
+from utils import query_weaviate, normalize_text
+
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "512"))
+RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", "3600"))
+
+_cache = TTLCache(maxsize=RECOMMENDATION_CACHE_SIZE, ttl=RECOMMENDATION_CACHE_TTL)
+_cache_lock = threading.Lock()
+cache_stats = {"hits": 0, "misses": 0, "invalidations": 0, "warmed": 0}
+
+
+def recommendation_key(concepts: Union[str, List[str]]) -> Tuple[str, ...]:
+    """Same key for the same search, however the concepts were spelled"""
+    if isinstance(concepts, str):
+        concepts = [concepts]
+    return tuple(normalize_text(concept) for concept in concepts if concept)
+
+
+def get_recommendations(concepts: Union[str, List[str]], client_instance: Any) -> List[Dict[str, Any]]:
+    """query_weaviate with a cache in front, keyed on the normalized concepts"""
+    check_catalogue_version()
+    key = recommendation_key(concepts)
+
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None:
+        cache_stats["hits"] += 1
+        return copy.deepcopy(cached)
+
+    cache_stats["misses"] += 1
+    results = query_weaviate(concepts, client_instance)
+    # query_weaviate returns [] on errors, which should not be remembered
+    if results:
+        with _cache_lock:
+            _cache[key] = copy.deepcopy(results)
+    return results
+
+
+@on_catalogue_change
+def invalidate_recommendations(uuids: Optional[List[str]] = None):
+    """Drop every cached search; any product change can reorder results"""
+    with _cache_lock:
+        _cache.clear()
+    cache_stats["invalidations"] += 1
+
+
+def warm_recommendation_cache(client_instance: Any, concept_sets: Iterable[Union[str, List[str]]]):
+    """Run the fixed catalogue searches once so users never wait on them"""
+    for concepts in concept_sets:
+        if get_recommendations(concepts, client_instance):
+            cache_stats["warmed"] += 1
+    print(f"🔥 Recommendation cache warmed ({cache_stats['warmed']} searches)")
+
+
+def get_recommendation_stats() -> Dict[str, Any]:
+    with _cache_lock:
+        size = len(_cache)
+    return {**cache_stats, "size": size}
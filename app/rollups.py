@@ -0,0 +1,161 @@
+import os
+import time
+from typing import Any, Dict, List, Optional
+from app.db_pool import get_cursor, with_reconnect
+
+GRANULARITIES = ("hour", "day")
+# Sessions are updated after they are inserted (session_end), and their ids are
+# not in commit order, so their counts are recomputed for this many recent days
+ROLLUP_SESSION_WINDOW_DAYS = int(os.getenv("ROLLUP_SESSION_WINDOW_DAYS", "3"))
+
+# Append-only event tables rolled up incrementally by id:
+# table -> (timestamp column, {dimension: SQL expression for the key})
+ROLLUP_SOURCES = {
+    "product_interactions": ("created_at", {
+        "product": "product_name",
+        "category": "product_category",
+        "stage": "stage",
+    }),
+    "user_goals": ("created_at", {
+        "goal": "lower(trim(health_goal))",
+        "preference": "lower(trim(supplement_preference))",
+    }),
+    "location_analytics": ("interaction_time", {
+        "pueblo": "pueblo",
+    }),
+}
+
+
+def create_rollup_tables(cursor=None):
+    """Create the aggregate table and the per-source high-water marks"""
+    with get_cursor(cursor) as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS analytics_rollups (
+                granularity TEXT NOT NULL,
+                bucket_start TIMESTAMP NOT NULL,
+                dimension TEXT NOT NULL,
+                key TEXT NOT NULL,
+                count BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (granularity, dimension, bucket_start, key)
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS rollup_watermarks (
+                source TEXT PRIMARY KEY,
+                last_id BIGINT NOT NULL DEFAULT 0,
+                next_id BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """)
+    print("analytics_rollups tables ready!")
+
+
+def _rollup_source(cursor, table: str) -> int:
+    """
+    Add rows with last_id < id <= next_id to the rollups, then move the
+    window forward. next_id is the max id seen by the previous run, so rows
+    whose transactions were still in flight back then have committed by now.
+    Runs inside the caller's transaction: counts and mark move together.
+    """
+    time_column, dimensions = ROLLUP_SOURCES[table]
+    cursor.execute("""
+        INSERT INTO rollup_watermarks (source) VALUES (%s)
+        ON CONFLICT (source) DO NOTHING
+    """, (table,))
+    cursor.execute("SELECT last_id, next_id FROM rollup_watermarks WHERE source = %s FOR UPDATE", (table,))
+    last_id, next_id = cursor.fetchone()
+
+    rows = 0
+    if next_id > last_id:
+        keys = ", ".join(f"('{name}', COALESCE(({expr})::text, 'Unknown'))" for name, expr in dimensions.items())
+        cursor.execute(f"""
+            INSERT INTO analytics_rollups (granularity, bucket_start, dimension, key, count)
+            SELECT g.granularity, date_trunc(g.granularity, e.{time_column}), d.dimension, d.key, COUNT(*)
+            FROM {table} e
+            CROSS JOIN (VALUES ('hour'), ('day')) AS g(granularity)
+            CROSS JOIN LATERAL (VALUES {keys}) AS d(dimension, key)
+            WHERE e.id > %s AND e.id <= %s AND e.{time_column} IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+            ON CONFLICT (granularity, dimension, bucket_start, key)
+            DO UPDATE SET count = analytics_rollups.count + EXCLUDED.count
+        """, (last_id, next_id))
+        rows = cursor.rowcount
+
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    newest = cursor.fetchone()[0]
+    cursor.execute("""
+        UPDATE rollup_watermarks SET last_id = GREATEST(last_id, next_id), next_id = %s, updated_at = NOW()
+        WHERE source = %s
+    """, (newest, table))
+    return rows
+
+
+def _rollup_sessions(cursor) -> int:
+    """Recompute started / completed session counts for the recent window"""
+    cursor.execute("""
+        DELETE FROM analytics_rollups
+        WHERE dimension = 'sessions' AND bucket_start >= date_trunc('day', NOW() - make_interval(days => %s))
+    """, (ROLLUP_SESSION_WINDOW_DAYS,))
+    cursor.execute("""
+        INSERT INTO analytics_rollups (granularity, bucket_start, dimension, key, count)
+        SELECT g.granularity, date_trunc(g.granularity, s.session_start), 'sessions', d.key, COUNT(*)
+        FROM user_sessions s
+        CROSS JOIN (VALUES ('hour'), ('day')) AS g(granularity)
+        CROSS JOIN LATERAL (VALUES ('started', TRUE), ('completed', s.completed_journey)) AS d(key, counted)
+        WHERE d.counted AND s.session_start >= date_trunc('day', NOW() - make_interval(days => %s))
+        GROUP BY 1, 2, 4
+    """, (ROLLUP_SESSION_WINDOW_DAYS,))
+    return cursor.rowcount
+
+
+@with_reconnect
+def refresh_rollups() -> Dict[str, int]:
+    """Bring every rollup up to date; returns the number of buckets touched per source"""
+    started = time.perf_counter()
+    touched = {}
+    for table in ROLLUP_SOURCES:
+        with get_cursor() as cursor:
+            touched[table] = _rollup_source(cursor, table)
+    with get_cursor() as cursor:
+        touched["user_sessions"] = _rollup_sessions(cursor)
+    print(f"📊 Rollups refreshed in {round(1000 * (time.perf_counter() - started), 1)} ms: {touched}")
+    return touched
+
+
+@with_reconnect
+def get_rollup(dimension: str, granularity: str = "day", days: int = 30, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Totals per key for one dimension over the last `days` days, largest first"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {GRANULARITIES}")
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT key, SUM(count) AS count
+            FROM analytics_rollups
+            WHERE granularity = %s AND dimension = %s
+              AND bucket_start >= date_trunc(%s, NOW() - make_interval(days => %s))
+            GROUP BY key
+            ORDER BY count DESC, key
+            LIMIT %s
+        """, (granularity, dimension, granularity, days, limit))
+        return [{"key": row["key"], "count": int(row["count"])} for row in cursor.fetchall()]
+
+
+@with_reconnect
+def get_rollup_series(dimension: str, key: str, granularity: str = "day", days: int = 30) -> List[Dict[str, Any]]:
+    """Count per bucket for one key (e.g. daily recommendations of a product)"""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {GRANULARITIES}")
+    with get_cursor() as cursor:
+        cursor.execute("""
+            SELECT bucket_start, count
+            FROM analytics_rollups
+            WHERE granularity = %s AND dimension = %s AND key = %s
+              AND bucket_start >= date_trunc(%s, NOW() - make_interval(days => %s))
+            ORDER BY bucket_start
+        """, (granularity, dimension, key, granularity, days))
+        return [{"bucket_start": row["bucket_start"].isoformat(), "count": row["count"]} for row in cursor.fetchall()]
+
+
+if __name__ == "__main__":
+    create_rollup_tables()
+    refresh_rollups()
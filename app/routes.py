@@ -1,8 +1,22 @@
-from flask import Blueprint, request, jsonify, current_app
-from weaviate.classes.query import Filter
-from weaviate.util import generate_uuid5
-from utils import query_weaviate, match_category
-from app.db import get_user_state, set_user_state
+import json
+from urllib.parse import urlencode
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from utils import query_weaviate, match_category, get_classifier_stats
+from app.db import get_user_state, set_user_state, peek_user_state
+from app.db_pool import get_pool_stats
+from app.concurrency import get_io_stats
+from app.catalogue import REQUIRED_PRODUCT_FIELDS, notify_catalogue_change
+from app.catalogue_identity import catalogue_uuid, product_exists, fetch_product, delete_product, get_identity_stats
+from app.catalogue_bulk import BULK_CHUNK_SIZE, apply_bulk, read_ndjson
+from app.catalogue_query import parse_item_query, get_items_page, get_items_cache_stats, is_not_modified
+from app.catalogue_sync import ensure_fingerprint_property, with_fingerprint, prepare_update, plain_vector
+from app.recommendation_cache import get_recommendation_stats
+from app.embeddings import get_embedding_stats
+from app.catalogue_replica import get_replica_stats
+from app.analytics_events import get_analytics_stats
+from app.pharmacy_directory import get_pharmacy_directory_stats
+from app.geo import valid_coordinates
+from app.rollups import get_rollup
 from app.handlers import process_user_input
 
 main = Blueprint('main', __name__)
@@ -11,6 +25,21 @@ main = Blueprint('main', __name__)
 def index():
     return "Welcome to the Flask App!"
 
+@main.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        "db_pool": get_pool_stats(),
+        "classifier": get_classifier_stats(),
+        "io": get_io_stats(),
+        "recommendations": get_recommendation_stats(),
+        "embeddings": get_embedding_stats(),
+        "catalogue_replica": get_replica_stats(),
+        "analytics": get_analytics_stats(),
+        "pharmacy_directory": get_pharmacy_directory_stats(),
+        "items": get_items_cache_stats(),
+        "catalogue_identity": get_identity_stats()
+    }), 200
+
 @main.route('/chat', methods=['POST', 'OPTIONS'])
 def chat():
     if request.method == 'OPTIONS':
@@ -30,13 +59,23 @@ def chat():
 
         user_id = data.get("user_id", "anonymous")
 
-        print(f"⬆️STATE BEFORE {user_id}: {get_user_state(user_id)}")
+        # Optional position from the widget, for the nearest-pharmacy step
+        coords = None
+        if data.get("lat") is not None or data.get("lng") is not None:
+            if not valid_coordinates(data.get("lat"), data.get("lng")):
+                return jsonify({"error": "lat and lng must be valid coordinates"}), 400
+            coords = (float(data["lat"]), float(data["lng"]))
+
+        # Single state read per message; the handler works on this copy and the
+        # "after" state logged below is the cached copy the turn just wrote
+        state = get_user_state(user_id)
+        print(f"⬆️STATE BEFORE {user_id}: {state}")
 
-        logic_response = process_user_input(user_id, user_message)
+        logic_response = process_user_input(user_id, user_message, state, coords=coords)
 
         print("🤖 Final bot response:", logic_response)
 
-        print(f"⬇️STATE AFTER {user_id}: {get_user_state(user_id)}")
+        print(f"⬇️STATE AFTER {user_id}: {peek_user_state(user_id)}")
 
         return jsonify({
             "text": logic_response.get("text", None),
@@ -52,38 +91,55 @@ def chat():
         return jsonify({"error": str(e)}), 500
 
 
-@main.route('/items', methods=['GET'])
-def get_items():
-    name = request.args.get('name')
-    category = request.args.get('category')
-    price = request.args.get('price')
-
+@main.route('/analytics/rollups', methods=['GET'])
+def analytics_rollups():
+    dimension = request.args.get('dimension', 'product')
+    granularity = request.args.get('granularity', 'day')
     try:
-        client = current_app.weaviate_client
-        collection = client.collections.get("Supplements")
+        days = int(request.args.get('days', 30))
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+        return jsonify(get_rollup(dimension, granularity, days, limit)), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        if name:
-            filters = Filter.by_property("nombre").equal(name)
-        elif category:
-            filters = Filter.by_property("categoria").equal(category)
-        elif price:
-            filters = Filter.by_property("precio").greater_than(float(price))
-        else:
-            filters = None
 
-        query = collection.query.fetch_objects(filters=filters)
-        items = [obj.properties for obj in query.objects]
-        return jsonify(items), 200
+@main.route('/items', methods=['GET'])
+def get_items():
+    """
+    Catalogue query: name, category, min_price / max_price (or the old
+    price), in_stock combine with AND; fields=a,b projects; sort=nombre |
+    precio | -precio; limit and cursor page through the results (the next
+    cursor is in X-Next-Cursor / Link). Responses carry an ETag, and
+    If-None-Match answers 304 while the catalogue hasn't changed.
+    """
+    try:
+        query = parse_item_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
+    try:
+        page = get_items_page(current_app.weaviate_client, query)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    headers = {"ETag": f'"{page.etag}"', "Cache-Control": "no-cache"}
+    if page.next_cursor:
+        args = request.args.to_dict()
+        args["cursor"] = page.next_cursor
+        headers["X-Next-Cursor"] = page.next_cursor
+        headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+
+    if is_not_modified(page, request.if_none_match):
+        return Response(status=304, headers=headers)
+    return Response(page.body, status=200, mimetype="application/json", headers=headers)
+
 @main.route('/items', methods=['POST'])
 def add_item():
     data = request.get_json()
     try:
-        required_fields = ["nombre", "precio", "inventario", "categoria", "descripcion", "ingredientes", "allergens", "usage", "recommended_for", "link", "image"]
-        missing_fields = [item for item in required_fields if item not in data]
+        missing_fields = [item for item in REQUIRED_PRODUCT_FIELDS if item not in data]
 
         if missing_fields:
             return jsonify({"error": f"Missing fields: {', '.join(missing_fields)}"}), 400
@@ -91,38 +147,74 @@ def add_item():
         client = current_app.weaviate_client
         collection = client.collections.get("Supplements")
 
-        object_uuid = generate_uuid5({"nombre": data["nombre"]})
+        object_uuid = catalogue_uuid(data["nombre"])
 
-        if collection.data.exists(object_uuid):
+        if product_exists(collection, data["nombre"]):
             return jsonify({"error": "Item already exists"}), 201
 
-        collection.data.insert(data, uuid=object_uuid)
+        ensure_fingerprint_property(collection)
+        collection.data.insert(with_fingerprint(collection, data), uuid=object_uuid)
+        notify_catalogue_change([object_uuid])
         return jsonify({"message": "Item added successfully!"}), 201
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@main.route('/items/bulk', methods=['POST', 'PUT', 'DELETE'])
+def bulk_items():
+    """
+    Many inserts / updates / deletes in one request, as NDJSON
+    (Content-Type: application/x-ndjson) or a JSON array. Lines without
+    "op" default to insert (POST), update (PUT) or delete (DELETE).
+    Results stream back as NDJSON, one line per item, chunk by chunk.
+    """
+    default_op = {"POST": "insert", "PUT": "update", "DELETE": "delete"}[request.method]
+    if request.mimetype == "application/x-ndjson":
+        entries = read_ndjson(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            return jsonify({"error": "Send a JSON array or application/x-ndjson lines"}), 400
+        entries = enumerate(data, start=1)
+
+    client = current_app.weaviate_client
+
+    def generate():
+        counts = {}
+        for result in apply_bulk(client, entries, default_op):
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            yield json.dumps(result, ensure_ascii=False, default=str) + "\n"
+        print(f"📦 Bulk {request.method} /items/bulk: {counts} (chunks of {BULK_CHUNK_SIZE})")
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
 @main.route('/items/<string:name>', methods=['PUT'])
 def update_item(name):
     data = request.get_json()
     try:
+        # The id is derived from nombre: a rename would leave the product under its old id
+        if data.get("nombre", name) != name:
+            return jsonify({"error": "nombre can't be changed; delete the item and add it under the new name"}), 400
+
         client = current_app.weaviate_client
         collection = client.collections.get("Supplements")
 
-        query = collection.query.fetch_objects(
-            filters=Filter.by_property("nombre").equal(name)
-        )
-        items = query.objects
+        item = fetch_product(collection, name, include_vector=True)
 
-        if not items:
+        if item is None:
             return jsonify({"error": "Item not found"}), 404
 
-        uuid = items[0].uuid
+        uuid = item.uuid
         # Ensure 'image' is present in update
         if "image" not in data:
             return jsonify({"error": "Missing field: image"}), 400
-        collection.data.update(uuid=uuid, properties=data)
-        return jsonify({"message": "Item updated successfully!"}), 200
+        # Price / stock / link changes keep the stored vector: no new embedding
+        properties, keeps_vector = prepare_update(collection, dict(item.properties), data)
+        vector = plain_vector(item.vector) if keeps_vector else None
+        ensure_fingerprint_property(collection)
+        collection.data.update(uuid=uuid, properties=properties, vector=vector)
+        notify_catalogue_change([uuid])
+        return jsonify({"message": "Item updated successfully!", "revectorized": vector is None}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -133,16 +225,12 @@ def delete_item(name):
         client = current_app.weaviate_client
         collection = client.collections.get("Supplements")
 
-        query = collection.query.fetch_objects(
-            filters=Filter.by_property("nombre").equal(name)
-        )
-        items = query.objects
+        uuid = delete_product(collection, name)
 
-        if not items:
+        if uuid is None:
             return jsonify({"error": "Item not found"}), 404
 
-        uuid = items[0].uuid
-        collection.data.delete_by_id(uuid)
+        notify_catalogue_change([uuid])
         return jsonify({"message": "Item deleted successfully!"}), 200
 
     except Exception as e:
@@ -1,13 +1,18 @@
-from db import create_pueblos_table, load_pharmacies_from_csv
+import sys
+from app.db import load_pharmacies_from_csv, PHARMACY_CSV
+from app.migrations import migrate, check_query_plans
+
+def setup_database(csv_path=PHARMACY_CSV):
+    print("Applying schema migrations...")
+    migrate()
 
-def setup_database():
-    print("Creating pueblos table...")
-    create_pueblos_table()
-    
     print("Loading pharmacy data from CSV...")
-    load_pharmacies_from_csv()
-    
+    load_pharmacies_from_csv(csv_path)
+
+    print("Checking hot query plans...")
+    check_query_plans()
+
     print("Database setup complete!")
 
 if __name__ == "__main__":
-    setup_database() 
\ No newline at end of file
+    setup_database(*sys.argv[1:2])
@@ -0,0 +1,106 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import psycopg2.extras
+from app.db_pool import get_cursor, with_reconnect
+
+# Compact codes stored in chat_messages instead of the stage / sender strings.
+# Keys are the ChatStage values from app/handlers.py. Codes are persisted, so
+# only ever append new ones; never renumber.
+STAGE_CODES = {
+    "unknown": 0,
+    "welcome": 1,
+    "main_menu": 2,
+    "pedido": 3,
+    "recommendation_category": 4,
+    "personal_advice": 5,
+    "ask_medical": 6,
+    "ask_preference": 7,
+    "custom_query": 8,
+    "done": 9,
+    "localizacion": 10,
+    "pre-localizacion": 11
+}
+STAGE_NAMES = {code: stage for stage, code in STAGE_CODES.items()}
+
+SENDER_CODES = {"user": 0, "bot": 1}
+SENDER_NAMES = {code: sender for sender, code in SENDER_CODES.items()}
+
+# (epoch milliseconds, sender, message, stage) as buffered by utils.append_history
+HistoryEntry = Tuple[int, str, str, str]
+
+
+def create_chat_messages_table(cursor=None):
+    """Create the append-only conversation transcript table"""
+    with get_cursor(cursor) as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id BIGSERIAL PRIMARY KEY,
+                session_id BIGINT,
+                user_id TEXT NOT NULL,
+                sender SMALLINT NOT NULL,
+                stage SMALLINT NOT NULL,
+                sent_at BIGINT NOT NULL,
+                message TEXT
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_session ON chat_messages (session_id, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_user ON chat_messages (user_id, id DESC)")
+    print("chat_messages table ready!")
+
+
+def encode_entry(user_id: str, session_id: Optional[int], entry: HistoryEntry) -> tuple:
+    sent_at, sender, message, stage = entry
+    return (
+        session_id,
+        user_id,
+        SENDER_CODES.get(sender, SENDER_CODES["bot"]),
+        STAGE_CODES.get(stage, STAGE_CODES["unknown"]),
+        sent_at,
+        message
+    )
+
+
+def decode_row(row) -> Dict[str, Any]:
+    return {
+        "session_id": row["session_id"],
+        "sender": SENDER_NAMES.get(row["sender"], "bot"),
+        "stage": STAGE_NAMES.get(row["stage"], "unknown"),
+        "timestamp": datetime.utcfromtimestamp(row["sent_at"] / 1000).isoformat() + "Z",
+        "message": row["message"]
+    }
+
+
+@with_reconnect
+def save_messages(user_id: str, session_id: Optional[int], entries: Sequence[HistoryEntry], cursor=None):
+    """Append a batch of transcript entries with a single multi-row INSERT"""
+    if not entries:
+        return
+    with get_cursor(cursor) as cursor:
+        psycopg2.extras.execute_values(cursor, """
+            INSERT INTO chat_messages (session_id, user_id, sender, stage, sent_at, message)
+            VALUES %s
+        """, [encode_entry(user_id, session_id, entry) for entry in entries])
+
+
+@with_reconnect
+def get_recent_messages(user_id: str, limit: int = 10, session_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Last `limit` transcript messages for a user (or one session), oldest first"""
+    with get_cursor() as cursor:
+        if session_id is None:
+            cursor.execute("""
+                SELECT session_id, sender, stage, sent_at, message
+                FROM chat_messages
+                WHERE user_id = %s
+                ORDER BY id DESC
+                LIMIT %s
+            """, (user_id, limit))
+        else:
+            cursor.execute("""
+                SELECT session_id, sender, stage, sent_at, message
+                FROM chat_messages
+                WHERE session_id = %s
+                ORDER BY id DESC
+                LIMIT %s
+            """, (session_id, limit))
+        rows = cursor.fetchall()
+    return [decode_row(row) for row in reversed(rows)]
@@ -0,0 +1,71 @@
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+from app.db import set_user_state, cache_user_state
+from app.db_pool import get_cursor, with_reconnect
+from app.transcript import save_messages
+from app.analytics_events import publish, new_session_id, SessionStart
+
+
+class TurnUnitOfWork:
+    """
+    Collects every database write a chat turn wants to make (state change,
+    transcript messages, analytics events, a new session) and flushes them
+    once the handler has returned: one transaction on the response path,
+    analytics handed to the event bus.
+    """
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.state: Optional[Dict[str, Any]] = None
+        self.analytics: List[NamedTuple] = []
+        self.history: List[tuple] = []
+        self.history_session_id = None
+
+    def start_session(self) -> int:
+        """Allocate a session id; its user_sessions row is written with the analytics"""
+        session_id = new_session_id()
+        self.analytics.append(SessionStart(session_id=session_id, user_id=self.user_id, created_at=datetime.utcnow()))
+        return session_id
+
+    def set_state(self, state: Dict[str, Any]):
+        """Record the state to persist; the last call of the turn wins"""
+        self.state = state
+
+    def add_history(self, entries: List[tuple], session_id=None):
+        """Queue the turn's buffered transcript entries (see utils.append_history)"""
+        self.history.extend(entries)
+        self.history_session_id = session_id
+
+    def track(self, *events: NamedTuple):
+        """Queue analytics events (see app.analytics_events)"""
+        self.analytics.extend(events)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.state is None and not self.analytics and not self.history
+
+    def flush(self):
+        """
+        Write the turn's state and transcript in one transaction, then hand
+        the analytics events (including a new session's row) to the event
+        bus, which writes them in batches in the background.
+        """
+        if self.is_empty:
+            return
+
+        if self.state is not None or self.history:
+            self._flush_turn()
+
+        if self.analytics:
+            publish(*self.analytics)
+
+    @with_reconnect
+    def _flush_turn(self):
+        state_id = None
+        with get_cursor() as cursor:
+            save_messages(self.user_id, self.history_session_id, self.history, cursor=cursor)
+            if self.state is not None:
+                state_id = set_user_state(self.user_id, self.state, cursor=cursor)
+
+        if self.state is not None:
+            cache_user_state(self.user_id, {"stage": self.state["stage"], "context": self.state["context"]}, state_id)
@@ -0,0 +1,134 @@
+"""
+Benchmark for the local pre-classifier (app/matcher.py).
+
+Replays a synthetic mix of /chat turns shaped like the traffic chatbot-3.js
+sends (verbatim button labels, retyped options, pueblo answers with typos,
+free-text goals) and reports how many would skip the remote NLI call and
+how long the local match takes.
+
+    python benchmark_classifier.py            # built-in pueblo list
+    python benchmark_classifier.py --from-db  # pueblos from the pueblos table
+"""
+import argparse
+import random
+import time
+from collections import defaultdict
+
+from app.handlers import MAIN_OPTIONS, REC_OPTIONS, cat_subcat
+from app.matcher import get_matcher
+from utils import normalize_text
+
+PUEBLOS = [
+    "Adjuntas", "Aguada", "Aguadilla", "Aguas Buenas", "Aibonito", "Añasco", "Arecibo",
+    "Arroyo", "Barceloneta", "Barranquitas", "Bayamón", "Cabo Rojo", "Caguas", "Camuy",
+    "Canóvanas", "Carolina", "Cataño", "Cayey", "Ceiba", "Ciales", "Cidra", "Coamo",
+    "Comerío", "Corozal", "Culebra", "Dorado", "Fajardo", "Florida", "Guánica", "Guayama",
+    "Guayanilla", "Guaynabo", "Gurabo", "Hatillo", "Hormigueros", "Humacao", "Isabela",
+    "Jayuya", "Juana Díaz", "Juncos", "Lajas", "Lares", "Las Marías", "Las Piedras", "Loíza",
+    "Luquillo", "Manatí", "Maricao", "Maunabo", "Mayagüez", "Moca", "Morovis", "Naguabo",
+    "Naranjito", "Orocovis", "Patillas", "Peñuelas", "Ponce", "Quebradillas", "Rincón",
+    "Río Grande", "Sabana Grande", "Salinas", "San Germán", "San Juan", "San Lorenzo",
+    "San Sebastián", "Santa Isabel", "Toa Alta", "Toa Baja", "Trujillo Alto", "Utuado",
+    "Vega Alta", "Vega Baja", "Vieques", "Villalba", "Yabucoa", "Yauco"
+]
+
+FREE_TEXT = [
+    "quiero algo para el dolor de rodillas",
+    "me siento cansado todo el dia",
+    "tengo problemas para dormir por las noches",
+    "necesito mejorar mi sistema inmune",
+    "algo natural para la ansiedad",
+    "busco vitaminas para el cabello",
+    "tengo colesterol alto",
+    "me duele el estomago despues de comer"
+]
+
+
+def typo(text: str, rng: random.Random) -> str:
+    """Drop, swap or duplicate one letter, like a hurried phone keyboard"""
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    kind = rng.choice(["drop", "swap", "double"])
+    if kind == "drop":
+        return text[:i] + text[i + 1:]
+    if kind == "swap":
+        return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]
+    return text[:i] + text[i] + text[i:]
+
+
+def build_turns(pueblos, n, rng):
+    """(kind, text, labels, expected label or None) tuples"""
+    kinds = [
+        ("button", 0.55),
+        ("typed_option", 0.1),
+        ("pueblo", 0.15),
+        ("pueblo_typo", 0.1),
+        ("free_text", 0.1)
+    ]
+    turns = []
+    for _ in range(n):
+        kind = rng.choices([k for k, _ in kinds], weights=[w for _, w in kinds])[0]
+        if kind in ("button", "typed_option"):
+            labels = rng.choice([MAIN_OPTIONS, REC_OPTIONS])
+            label = rng.choice(labels)
+            text = label if kind == "button" else typo(normalize_text(label), rng)
+            turns.append((kind, text, labels, label))
+        elif kind in ("pueblo", "pueblo_typo"):
+            label = rng.choice(pueblos)
+            text = label.upper() if kind == "pueblo" else typo(label.lower(), rng)
+            turns.append((kind, text, pueblos, label))
+        else:
+            turns.append((kind, rng.choice(FREE_TEXT), list(cat_subcat.keys()), None))
+    return turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--from-db", action="store_true", help="read pueblos from the database")
+    args = parser.parse_args()
+
+    pueblos = PUEBLOS
+    if args.from_db:
+        from app.db import get_pueblos
+        pueblos = get_pueblos()
+
+    rng = random.Random(args.seed)
+    turns = build_turns(pueblos, args.turns, rng)
+
+    # Build the indexes up front; in the app this happens once per label set
+    for labels in (MAIN_OPTIONS, REC_OPTIONS, pueblos, list(cat_subcat.keys())):
+        get_matcher(labels, normalize_text)
+
+    totals = defaultdict(lambda: {"turns": 0, "local": 0, "correct": 0})
+    elapsed = 0.0
+    for kind, text, labels, expected in turns:
+        matcher = get_matcher(labels, normalize_text)
+        started = time.perf_counter()
+        match = matcher.match(text)
+        elapsed += time.perf_counter() - started
+
+        bucket = totals[kind]
+        bucket["turns"] += 1
+        if match is not None:
+            bucket["local"] += 1
+            bucket["correct"] += int(match.label == expected)
+
+    print(f"{'turn kind':<14}{'turns':>8}{'local':>8}{'skip %':>9}{'correct %':>11}")
+    for kind, bucket in sorted(totals.items()):
+        local = bucket["local"]
+        print(
+            f"{kind:<14}{bucket['turns']:>8}{local:>8}"
+            f"{100 * local / bucket['turns']:>8.1f}%"
+            f"{(100 * bucket['correct'] / local if local else 0):>10.1f}%"
+        )
+
+    local_total = sum(bucket["local"] for bucket in totals.values())
+    print(f"\nTurns skipping the remote classifier: {local_total}/{len(turns)} ({100 * local_total / len(turns):.1f}%)")
+    print(f"Mean local match time: {1e6 * elapsed / len(turns):.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ import os
 from weaviate.classes.init import AdditionalConfig, Timeout, Auth
 from weaviate.classes.config import Property, DataType, Configure
 import json
+from app.catalogue_sync import FINGERPRINT_PROPERTY, with_fingerprint
+from app.catalogue_identity import catalogue_uuid
 
 # Cloud connection. 
 load_dotenv(".env.staging")
@@ -48,6 +50,7 @@ try:
         Property(name="precio", data_type=DataType.NUMBER, vectorizer_config={"skip": True}),
         Property(name="inventario", data_type=DataType.NUMBER, vectorizer_config={"skip": True}),
         Property(name="link", data_type=DataType.TEXT, vectorizer_config={"skip": True}),
+        Property(name=FINGERPRINT_PROPERTY, data_type=DataType.TEXT, vectorizer_config={"skip": True}),
     ],
         )
         print("Collection created successfully!!!")
@@ -59,9 +62,9 @@ try:
     with open("vitaminas.json", "r", encoding="utf-8") as file:
         data = json.load(file)
 
-    # Insert each object into the collection
+    # Insert each object into the collection, under the id derived from its nombre
     for obj in data:
-        supplements_collection.data.insert(obj)
+        supplements_collection.data.insert(with_fingerprint(supplements_collection, obj), uuid=catalogue_uuid(obj["nombre"]))
     print("Data imported successfully!")
 
     # PRINT SCHEMA
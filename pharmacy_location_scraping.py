@@ -1,5 +1,7 @@
 # Imports
+import csv
 import gspread
+from gspread.utils import rowcol_to_a1
 from oauth2client.service_account import ServiceAccountCredentials
 import googlemaps
 import time
@@ -18,19 +20,59 @@ sheet = client.open("Farmacias").worksheet("Sheet1")
 # Google Maps API Setup
 gmaps = googlemaps.Client(key=MAPS_API_KEY)
 
+# Local copy of the sheet with coordinates; app.pharmacy_directory can load it offline
+PHARMACY_LOCATIONS_FILE = os.getenv("PHARMACY_LOCATIONS_FILE", "pharmacy_locations.csv")
+# Rows written per Sheets API call (the API allows 60 write requests a minute)
+SHEET_WRITE_BATCH = int(os.getenv("SHEET_WRITE_BATCH", "50"))
+
+# Lat / Lng columns, added after the existing ones the first time
+headers = sheet.row_values(1)
+for header in ("Lat", "Lng"):
+    if header not in headers:
+        headers.append(header)
+        sheet.update_cell(1, len(headers), header)
+lat_col, lng_col = headers.index("Lat") + 1, headers.index("Lng") + 1
+
 # Get pharmacy names from column A
 pharmacy_names = sheet.col_values(1)[1:]  # skip header
 
-# Loop and update column B with result
+# Cell updates waiting to be written, as batch_update ranges
+pending = []
+
+def flush_updates():
+    """Write the queued cells with one batch_update call"""
+    if pending:
+        sheet.batch_update(pending)
+        pending.clear()
+
+def queue_cell(row, col, value):
+    pending.append({"range": rowcol_to_a1(row, col), "values": [[value]]})
+
+# Loop and update column B with result, and the place's coordinates
 for i, name in enumerate(pharmacy_names):
     try:
         results = gmaps.places(query=name)
         if results['results']:
-            place_id = results['results'][0]['place_id']
+            place = results['results'][0]
+            place_id = place['place_id']
             maps_link = f"https://www.google.com/maps/place/?q=place_id:{place_id}"
-            sheet.update_cell(i+2, 2, maps_link)
+            location = place.get('geometry', {}).get('location') or {}
+            queue_cell(i+2, 2, maps_link)
+            queue_cell(i+2, lat_col, location.get('lat', ""))
+            queue_cell(i+2, lng_col, location.get('lng', ""))
         else:
-            sheet.update_cell(i+2, 2, "Not found")
+            queue_cell(i+2, 2, "Not found")
         time.sleep(1)
     except Exception as e:
-        sheet.update_cell(i+2, 2, f"Error: {e}")
+        queue_cell(i+2, 2, f"Error: {e}")
+    if len(pending) >= 3 * SHEET_WRITE_BATCH:
+        flush_updates()
+flush_updates()
+
+# Save the sheet (with coordinates) locally
+records = sheet.get_all_records()
+with open(PHARMACY_LOCATIONS_FILE, "w", newline="", encoding="utf-8") as file:
+    writer = csv.DictWriter(file, fieldnames=headers, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(records)
+print(f"Saved {len(records)} pharmacies to {PHARMACY_LOCATIONS_FILE}")
@@ -1,6 +1,6 @@
+import argparse
+import time
 import psycopg2
-import psycopg2.extras
-import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from dotenv import load_dotenv
@@ -8,42 +8,181 @@ import os
 
 load_dotenv(".env.google")
 
-# Database connection
-print("Connecting to Database...")
-DATABASE_URL = os.getenv("DATABASE_URL")
-conn = psycopg2.connect(DATABASE_URL, sslmode="require")
-cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-print("CONNECTED!")
-
-# Google Sheets connection
-print("Connecting to Google Sheets...")
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-SERVICE_KEY = os.getenv("SERVICE_KEY")
-creds = ServiceAccountCredentials.from_json_keyfile_name(SERVICE_KEY, scope)
-client = gspread.authorize(creds)
-print("CONNECTED!")
-
-def export_table_to_sheet(cursor, sheet_name, query):
-    print(f"Exporting to {sheet_name}")
-    cursor.execute(query)
-    data = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
-    df = pd.DataFrame(data, columns=columns)
-
-    # ✅ Convert all datetime columns to strings
-    for col in df.select_dtypes(include=['datetime64[ns]', 'datetime64[ns, UTC]', 'object']):
-        df[col] = df[col].astype(str)
-
-    sheet = client.open("GoShop_Database").worksheet(sheet_name)
-    sheet.clear()
-    sheet.update([df.columns.values.tolist()] + df.values.tolist())
-    print(f"Export Completed!")
-
-# Export each table
-export_table_to_sheet(cur, "chat_state", "SELECT * FROM chat_state")
-export_table_to_sheet(cur, "location_analytics", "SELECT * FROM location_analytics")
-export_table_to_sheet(cur, "product_interactions", "SELECT * FROM product_interactions")
-export_table_to_sheet(cur, "user_goals", "SELECT * FROM user_goals")
-export_table_to_sheet(cur, "user_sessions", "SELECT * FROM user_sessions")
-
-conn.close()
+# Imported after .env.google is loaded so the pool uses the same DATABASE_URL
+from app.rollups import create_rollup_tables, refresh_rollups
+from app.db_pool import get_cursor
+
+# Rows fetched from Postgres and sent to Sheets per request
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+SPREADSHEET_NAME = "GoShop_Database"
+
+# sheet -> table exported by id (new rows appended), or a query rewritten every run
+# (rows that are updated in place can't be appended)
+EXPORTS = {
+    "daily_rollups": """
+        SELECT bucket_start::date AS day, dimension, key, count
+        FROM analytics_rollups
+        WHERE granularity = 'day'
+        ORDER BY bucket_start DESC, dimension, count DESC
+    """,
+    "chat_state": "chat_state",
+    "location_analytics": "location_analytics",
+    "product_interactions": "product_interactions",
+    "user_goals": "user_goals",
+    "user_sessions": "SELECT * FROM user_sessions ORDER BY session_start",
+}
+
+
+def create_export_watermarks_table():
+    with get_cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sheet_export_watermarks (
+                sheet_name TEXT PRIMARY KEY,
+                last_id BIGINT NOT NULL DEFAULT 0,
+                next_id BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        """)
+
+
+def get_watermark(sheet_name):
+    with get_cursor() as cursor:
+        cursor.execute("SELECT last_id, next_id FROM sheet_export_watermarks WHERE sheet_name = %s", (sheet_name,))
+        row = cursor.fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def set_watermark(sheet_name, last_id, next_id):
+    with get_cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO sheet_export_watermarks (sheet_name, last_id, next_id, updated_at)
+            VALUES (%s, %s, %s, NOW())
+            ON CONFLICT (sheet_name) DO UPDATE
+            SET last_id = EXCLUDED.last_id, next_id = EXCLUDED.next_id, updated_at = NOW()
+        """, (sheet_name, last_id, next_id))
+
+
+def clear_watermark(sheet_name):
+    with get_cursor() as cursor:
+        cursor.execute("DELETE FROM sheet_export_watermarks WHERE sheet_name = %s", (sheet_name,))
+
+
+def to_cell(value):
+    """Numbers and booleans are sent as they are; everything else as text (as before)"""
+    return value if isinstance(value, (bool, int, float)) else str(value)
+
+
+def get_worksheet(spreadsheet, sheet_name):
+    try:
+        return spreadsheet.worksheet(sheet_name)
+    except gspread.exceptions.WorksheetNotFound:
+        return spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=26)
+
+
+def stream_rows(conn, sheet_name, query, params=()):
+    """
+    Run `query` on a server-side (named) cursor and yield (columns, rows)
+    chunks of EXPORT_CHUNK_SIZE, so a table never has to fit in memory.
+    """
+    with conn.cursor(name=f"export_{sheet_name}") as cur:
+        cur.itersize = EXPORT_CHUNK_SIZE
+        cur.execute(query, params)
+        rows = cur.fetchmany(EXPORT_CHUNK_SIZE)
+        columns = [desc[0] for desc in cur.description]
+        yield columns, rows
+        while rows:
+            rows = cur.fetchmany(EXPORT_CHUNK_SIZE)
+            if rows:
+                yield columns, rows
+    conn.commit()
+
+
+def export_table_to_sheet(conn, spreadsheet, sheet_name, source, full=False):
+    """
+    Tables (a bare table name) are exported incrementally: only rows with an
+    id above the sheet's watermark are appended. The window ends at the max
+    id seen by the previous run, so rows still being committed then are not
+    skipped. Queries, and tables when `full` is set, rewrite the sheet.
+    """
+    started = time.perf_counter()
+    sheet = get_worksheet(spreadsheet, sheet_name)
+    incremental = source.isidentifier()
+    watermark = get_watermark(sheet_name) if incremental else None
+
+    if incremental:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {source}")
+            newest = cur.fetchone()[0]
+        conn.commit()
+
+    if not incremental or full or watermark is None:
+        print(f"Exporting to {sheet_name} (full)")
+        sheet.clear()
+        if incremental:
+            # An interrupted rewrite must be redone in full, not appended to
+            clear_watermark(sheet_name)
+            query, params, next_watermark = f"SELECT * FROM {source} WHERE id <= %s ORDER BY id", (newest,), (newest, newest)
+        else:
+            query, params, next_watermark = source, (), None
+        header_written = False
+    else:
+        last_id, next_id = watermark
+        print(f"Exporting to {sheet_name} (rows {last_id + 1}..{next_id})")
+        query, params = f"SELECT * FROM {source} WHERE id > %s AND id <= %s ORDER BY id", (last_id, next_id)
+        next_watermark = (max(last_id, next_id), newest)
+        header_written = True
+
+    exported = 0
+    for columns, rows in stream_rows(conn, sheet_name, query, params):
+        values = [[to_cell(value) for value in row] for row in rows]
+        if not header_written:
+            values.insert(0, columns)
+            header_written = True
+        if values:
+            sheet.append_rows(values, value_input_option="RAW")
+        exported += len(rows)
+        if incremental and rows and not full and watermark is not None:
+            # Record progress per chunk so a failed run resumes without duplicates
+            set_watermark(sheet_name, rows[-1][columns.index("id")], next_watermark[0])
+
+    if next_watermark is not None:
+        set_watermark(sheet_name, *next_watermark)
+    elapsed = time.perf_counter() - started
+    print(f"Export Completed! {exported} rows in {elapsed:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export analytics tables to Google Sheets")
+    parser.add_argument("--full", action="store_true", help="Rewrite every sheet instead of appending new rows")
+    parser.add_argument("sheets", nargs="*", help=f"Sheets to export (default: all of {', '.join(EXPORTS)})")
+    args = parser.parse_args()
+
+    # Database connection
+    print("Connecting to Database...")
+    DATABASE_URL = os.getenv("DATABASE_URL")
+    conn = psycopg2.connect(DATABASE_URL, sslmode=os.getenv("DB_SSLMODE", "require"))
+    print("CONNECTED!")
+
+    # Google Sheets connection
+    print("Connecting to Google Sheets...")
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    SERVICE_KEY = os.getenv("SERVICE_KEY")
+    creds = ServiceAccountCredentials.from_json_keyfile_name(SERVICE_KEY, scope)
+    client = gspread.authorize(creds)
+    spreadsheet = client.open(SPREADSHEET_NAME)
+    print("CONNECTED!")
+
+    # Fold new events into the rollups first (same as `python -m app.rollups`)
+    create_rollup_tables()
+    refresh_rollups()
+    create_export_watermarks_table()
+
+    # Export each table
+    for sheet_name in args.sheets or EXPORTS:
+        export_table_to_sheet(conn, spreadsheet, sheet_name, EXPORTS[sheet_name], full=args.full)
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+from typing import NamedTuple
+import psycopg2
+from app.analytics_spool import AnalyticsSpool, QUARANTINE_SUFFIX
+
+
+class Click(NamedTuple):
+    n: int
+
+
+class ReplayTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool = AnalyticsSpool(self.directory, {"Click": Click})
+        for first in (1, 3, 5):
+            self.spool.append([Click(first), Click(first + 1)])
+            self.spool.seal()
+        self.written = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_segments_replay_oldest_first_and_are_deleted(self):
+        self.assertEqual(self.spool.replay(self.written.extend), (3, 6))
+        self.assertEqual([e.n for e in self.written], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_rejected_segment_is_quarantined_and_replay_continues(self):
+        def write(events):
+            if events[0].n == 3:
+                raise psycopg2.IntegrityError("violates foreign key constraint")
+            self.written.extend(events)
+
+        self.assertEqual(self.spool.replay(write), (2, 4))
+        self.assertEqual([e.n for e in self.written], [1, 2, 5, 6])
+        remaining = os.listdir(self.directory)
+        self.assertEqual(len(remaining), 1)
+        self.assertTrue(remaining[0].endswith(QUARANTINE_SUFFIX))
+        self.assertEqual(self.spool.stats, {"quarantined": 1, "quarantined_events": 2})
+        self.assertEqual(self.spool.sealed_segments(), [])
+
+    def test_connection_error_stops_replay_in_order(self):
+        def write(events):
+            if events[0].n == 3:
+                raise psycopg2.OperationalError("server closed the connection")
+            self.written.extend(events)
+
+        with self.assertRaises(psycopg2.OperationalError):
+            self.spool.replay(write)
+        self.assertEqual([e.n for e in self.written], [1, 2])
+        self.assertEqual(len(self.spool.sealed_segments()), 2)
+
+        self.spool.replay(self.written.extend)
+        self.assertEqual([e.n for e in self.written], [1, 2, 3, 4, 5, 6])
+
+
+if __name__ == '__main__':
+    unittest.main()
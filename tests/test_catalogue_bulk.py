@@ -0,0 +1,192 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from weaviate.classes.config import DataType
+from app.catalogue import REQUIRED_PRODUCT_FIELDS
+from app.catalogue_bulk import _apply_chunk, parse_op, read_ndjson
+from app.catalogue_identity import catalogue_uuid
+from app.catalogue_sync import FINGERPRINT_PROPERTY, vector_fingerprint
+
+ITEM = {field: "x" for field in REQUIRED_PRODUCT_FIELDS}
+
+
+class ParseOpTestCase(unittest.TestCase):
+
+    def test_full_forms(self):
+        op = parse_op(1, {"op": "insert", "item": ITEM})
+        self.assertEqual((op.op, op.nombre, op.item), ("insert", "x", ITEM))
+        op = parse_op(2, {"op": "update", "where": {"categoria": "Sueño"}, "set": {"precio": 9}})
+        self.assertEqual((op.where, op.changes, op.nombre), ({"categoria": "Sueño"}, {"precio": 9}, None))
+        op = parse_op(3, {"op": "delete", "nombre": "Zinc"}, default_op="insert")
+        self.assertEqual((op.op, op.nombre), ("delete", "Zinc"))
+
+    def test_shorthand_uses_the_method_default(self):
+        self.assertEqual(parse_op(1, ITEM, "insert").item, ITEM)
+        op = parse_op(1, {"nombre": "Zinc", "precio": 9, "inventario": 3}, "update")
+        self.assertEqual((op.nombre, op.changes), ("Zinc", {"precio": 9, "inventario": 3}))
+        self.assertEqual(parse_op(1, {"where": {"categoria": "Sueño"}}, "delete").where, {"categoria": "Sueño"})
+
+    def test_rejections(self):
+        cases = [
+            (["not", "an", "object"], "update", "JSON object"),
+            ({"nombre": "Zinc"}, None, "op must be"),
+            ({"op": "upsert", "nombre": "Zinc"}, None, "op must be"),
+            ({"where": "categoria=Sueño"}, "delete", "where must"),
+            ({"where": {}}, "delete", "where must"),
+            ({"where": {"precio; drop": 1}}, "delete", "where must"),
+            ({"op": "insert"}, None, "insert needs an item"),
+            ({"op": "insert", "item": ["x"]}, None, "insert needs an item"),
+            ({"nombre": "Zinc"}, "insert", "Missing fields"),
+            ({}, "delete", "either nombre or where"),
+            ({"nombre": "Zinc", "where": {"categoria": "a"}}, "delete", "either nombre or where"),
+            ({"op": "update", "nombre": "Zinc"}, None, "fields to set"),
+            ({"op": "update", "nombre": "Zinc", "set": {}}, None, "fields to set"),
+            ({"op": "update", "nombre": "Zinc", "set": [1]}, None, "fields to set"),
+            ({"nombre": "Zinc"}, "update", "fields to set"),
+            ({"op": "update", "nombre": "Zinc", "set": {"nombre": "Zinc 2"}}, None, "can't be updated"),
+            ({"where": {"categoria": "a"}, "nombre": None, FINGERPRINT_PROPERTY: "f"}, "update", "can't be updated"),
+        ]
+        for entry, default_op, message in cases:
+            with self.subTest(entry=entry, default_op=default_op):
+                with self.assertRaisesRegex(ValueError, message):
+                    parse_op(1, entry, default_op)
+
+    def test_read_ndjson(self):
+        lines = [b'{"nombre": "Zinc"}\n', b"\n", b"{broken\n", b'{"nombre": "Hierro"}']
+        parsed = list(read_ndjson(lines))
+        self.assertEqual([line for line, _ in parsed], [1, 3, 4])
+        self.assertEqual(parsed[0][1], {"nombre": "Zinc"})
+        self.assertIsInstance(parsed[1][1], ValueError)
+
+
+def _prop(name, skip=False):
+    return SimpleNamespace(name=name, data_type=DataType.TEXT, vectorizer_config=SimpleNamespace(skip=skip))
+
+
+def _matches(where, uuid, props):
+    if hasattr(where, "filters"):
+        return all(_matches(f, uuid, props) for f in where.filters)
+    if where.target == "_id":
+        return uuid in [str(v) for v in where.value]
+    return props.get(where.target) == where.value
+
+
+class FakeCollection:
+    """In-memory stand-in for the collection calls _apply_chunk makes"""
+
+    name = "BulkTest"
+
+    def __init__(self, objects, failing_deletes=()):
+        # {uuid: (properties, vector)}
+        self.objects = objects
+        self.failing_deletes = set(failing_deletes)
+        self.written = {}
+        self.batch = self
+        self.failed_objects = []
+        self.query = SimpleNamespace(fetch_objects=self.fetch_objects)
+        self.data = SimpleNamespace(delete_many=self.delete_many)
+        properties = [_prop("nombre", skip=True), _prop("categoria"), _prop("descripcion"),
+                      _prop("precio", skip=True), _prop(FINGERPRINT_PROPERTY, skip=True)]
+        self.config = SimpleNamespace(get=lambda: SimpleNamespace(properties=properties))
+
+    def fetch_objects(self, filters, include_vector=False, limit=None):
+        return SimpleNamespace(objects=[
+            SimpleNamespace(uuid=uuid, properties=props, vector={"default": vector})
+            for uuid, (props, vector) in self.objects.items() if _matches(filters, uuid, props)
+        ][:limit])
+
+    def iterator(self, return_properties=None):
+        return [SimpleNamespace(uuid=uuid, properties=props) for uuid, (props, _) in self.objects.items()]
+
+    def fixed_size(self, batch_size):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_object(self, properties, uuid, vector=None):
+        self.written[uuid] = (properties, vector)
+        self.objects[uuid] = (properties, vector or [0.0, 0.0])
+
+    def delete_many(self, where, verbose=False):
+        results = []
+        for uuid in [u for u in self.objects if _matches(where, u, self.objects[u][0])]:
+            failing = uuid in self.failing_deletes
+            if not failing:
+                del self.objects[uuid]
+            results.append(SimpleNamespace(uuid=uuid, successful=not failing, error="disk full" if failing else None))
+        return SimpleNamespace(objects=results)
+
+
+def stored(nombre, **fields):
+    props = {**{field: "x" for field in REQUIRED_PRODUCT_FIELDS}, "nombre": nombre, **fields}
+    props[FINGERPRINT_PROPERTY] = vector_fingerprint(props, ["categoria", "descripcion"])
+    return props
+
+
+@mock.patch("app.catalogue_identity.check_catalogue_version", lambda: None)
+@mock.patch("app.catalogue_bulk.notify_catalogue_change")
+class ApplyChunkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection({
+            catalogue_uuid("Zinc"): (stored("Zinc", categoria="Minerales", precio=10), [0.1, 0.9]),
+            catalogue_uuid("Hierro"): (stored("Hierro", categoria="Minerales", precio=12), [0.2, 0.8]),
+            catalogue_uuid("Melatonina"): (stored("Melatonina", categoria="Sueño", precio=8), [0.7, 0.3]),
+        })
+
+    def apply(self, *entries, default_op=None):
+        ops = [parse_op(line, entry, default_op) for line, entry in enumerate(entries, start=1)]
+        return _apply_chunk(self.collection, ops)
+
+    def test_insert_of_existing_product_is_an_error(self, notify):
+        results = self.apply({"op": "insert", "item": stored("Zinc")})
+        self.assertEqual([(r["status"], r["error"]) for r in results], [("error", "Item already exists")])
+        self.assertEqual(self.collection.written, {})
+        notify.assert_not_called()
+
+    def test_update_of_missing_product_is_not_found(self, notify):
+        results = self.apply({"nombre": "Biotina", "precio": 5}, default_op="update")
+        self.assertEqual([r["status"] for r in results], ["not_found"])
+        self.assertEqual(self.collection.written, {})
+
+    def test_where_update_of_non_vectorized_field_keeps_vectors(self, notify):
+        results = self.apply({"where": {"categoria": "Minerales"}, "precio": 15}, default_op="update")
+        self.assertEqual(sorted(r["nombre"] for r in results), ["Hierro", "Zinc"])
+        self.assertTrue(all(r["status"] == "updated" and r["revectorized"] is False for r in results))
+        written = self.collection.written
+        self.assertEqual(written[catalogue_uuid("Zinc")], ({**stored("Zinc", categoria="Minerales"), "precio": 15}, [0.1, 0.9]))
+        self.assertEqual(written[catalogue_uuid("Hierro")][1], [0.2, 0.8])
+        self.assertNotIn(catalogue_uuid("Melatonina"), written)
+        self.assertEqual(sorted(notify.call_args[0][0]), sorted([catalogue_uuid("Zinc"), catalogue_uuid("Hierro")]))
+
+    def test_vectorized_field_change_is_revectorized(self, notify):
+        [result] = self.apply({"nombre": "Zinc", "descripcion": "nueva"}, default_op="update")
+        self.assertTrue(result["revectorized"])
+        self.assertIsNone(self.collection.written[catalogue_uuid("Zinc")][1])
+
+    def test_operations_apply_in_order(self, notify):
+        results = self.apply(
+            {"op": "delete", "nombre": "Zinc"},
+            {"op": "insert", "item": stored("Zinc", descripcion="otra")},
+            {"op": "update", "nombre": "Melatonina", "set": {"precio": 9}},
+            {"op": "update", "nombre": "Melatonina", "set": {"inventario": 0}},
+        )
+        self.assertEqual([r["status"] for r in results], ["deleted", "inserted", "updated", "updated"])
+        props, _ = self.collection.objects[catalogue_uuid("Melatonina")]
+        self.assertEqual((props["precio"], props["inventario"]), (9, 0))
+        self.assertEqual(self.collection.objects[catalogue_uuid("Zinc")][0]["descripcion"], "otra")
+
+    def test_failed_delete_is_reported(self, notify):
+        self.collection.failing_deletes.add(catalogue_uuid("Hierro"))
+        results = self.apply({"nombre": "Hierro"}, {"nombre": "Zinc"}, default_op="delete")
+        self.assertEqual([(r["status"], r.get("error")) for r in results], [("error", "disk full"), ("deleted", None)])
+        self.assertIn(catalogue_uuid("Hierro"), self.collection.objects)
+        notify.assert_called_once_with([catalogue_uuid("Zinc")])
+
+
+if __name__ == '__main__':
+    unittest.main()
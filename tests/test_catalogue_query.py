@@ -0,0 +1,92 @@
+import json
+import base64
+import unittest
+from unittest import mock
+from app.catalogue_query import (
+    ItemQuery, _run_query, _sort_key, decode_cursor, encode_cursor, parse_item_query,
+)
+
+# (uuid, properties); duplicate prices and names, and products missing them
+PRODUCTS = [
+    ("u1", {"nombre": "Zinc", "precio": 10}),
+    ("u2", {"nombre": "magnesio", "precio": 25.5}),
+    ("u3", {"nombre": "Hierro", "precio": 10}),
+    ("u4", {"nombre": "Biotina"}),
+    ("u5", {"nombre": "Ashwagandha", "precio": 40}),
+    ("u6", {"precio": 10}),
+    ("u7", {"nombre": "Colágeno", "precio": 25.5}),
+]
+
+
+def all_pages(sort, limit):
+    """Follow next cursors from the first page to the last"""
+    seen, cursor = [], None
+    with mock.patch("app.catalogue_query._candidates", return_value=PRODUCTS):
+        while True:
+            page = _run_query(None, ItemQuery(sort=sort, limit=limit, cursor=cursor))
+            seen.append(json.loads(page.body))
+            if page.next_cursor is None:
+                return seen
+            cursor = page.next_cursor
+
+
+class KeysetCursorTestCase(unittest.TestCase):
+
+    def assert_pages_cover_sorted_products(self, sort):
+        expected = sorted(PRODUCTS, key=lambda p: _sort_key(p[0], p[1], sort))
+        for limit in (1, 2, 3, 7, 10):
+            pages = all_pages(sort, limit)
+            self.assertTrue(all(len(page) <= limit for page in pages))
+            self.assertEqual([p for page in pages for p in page], [props for _, props in expected])
+
+    def test_pages_by_name(self):
+        self.assert_pages_cover_sorted_products("nombre")
+
+    def test_pages_by_price_ascending(self):
+        self.assert_pages_cover_sorted_products("precio")
+
+    def test_pages_by_price_descending(self):
+        self.assert_pages_cover_sorted_products("-precio")
+        prices = [p.get("precio") for page in all_pages("-precio", 2) for p in page]
+        self.assertEqual(prices, [40, 25.5, 25.5, 10, 10, 10, None])
+
+    def test_missing_values_sort_last(self):
+        self.assertEqual(all_pages("nombre", 10)[0][-1], {"precio": 10})
+        self.assertEqual(all_pages("precio", 10)[0][-1], {"nombre": "Biotina"})
+
+    def test_cursor_round_trip(self):
+        for sort, key in (("nombre", [False, "zinc", "u1"]), ("nombre", [True, 0, "u6"]),
+                          ("precio", [False, 25.5, "u2"]), ("-precio", [False, -40, "u5"])):
+            self.assertEqual(decode_cursor(encode_cursor(sort, key), sort), key)
+
+    def test_cursor_from_another_sort_is_rejected(self):
+        with self.assertRaises(ValueError):
+            decode_cursor(encode_cursor("precio", [False, 10, "u1"]), "nombre")
+
+    def test_tampered_cursors_are_rejected(self):
+        def raw(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode("utf-8")).decode("ascii")
+
+        cases = [
+            ("nombre", "not base64!"),
+            ("nombre", raw({"sort": "nombre"})),
+            ("nombre", raw(["nombre", [False, "a"]])),
+            ("nombre", raw(["nombre", [False, 3, "u1"]])),
+            ("precio", raw(["precio", [False, "10", "u1"]])),
+            ("precio", raw(["precio", ["no", 10, "u1"]])),
+            ("precio", raw(["precio", [False, 10, 7]])),
+        ]
+        for sort, cursor in cases:
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor, sort)
+
+    def test_parse_item_query_checks_cursor_and_limit(self):
+        self.assertEqual(parse_item_query({"limit": "5", "sort": "-precio"}).limit, 5)
+        for args in ({"limit": "0"}, {"limit": "x"}, {"sort": "stock"}, {"cursor": "bogus"},
+                     {"fields": "nombre,precio;drop"}, {"max_price": "cheap"}):
+            with self.assertRaises(ValueError):
+                parse_item_query(args)
+
+
+if __name__ == '__main__':
+    unittest.main()
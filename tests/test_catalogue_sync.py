@@ -0,0 +1,95 @@
+import unittest
+from types import SimpleNamespace
+from weaviate.classes.config import DataType
+from app.catalogue_identity import catalogue_uuid
+from app.catalogue_sync import FINGERPRINT_PROPERTY, plan_sync, vector_fingerprint
+
+LEGACY_UUID = "6f1c1a9e-3b5d-4c1e-9a57-2f0d8e4b7c11"
+FIELDS = ["categoria", "descripcion"]
+
+
+def _prop(name, skip=False):
+    return SimpleNamespace(name=name, data_type=DataType.TEXT, vectorizer_config=SimpleNamespace(skip=skip))
+
+
+class FakeCollection:
+    """The parts of a Weaviate collection plan_sync reads"""
+
+    name = "PlanSyncTest"
+
+    def __init__(self, objects):
+        # {uuid: (properties, vector)}
+        self.objects = objects
+        properties = [_prop("nombre", skip=True), _prop("categoria"), _prop("descripcion"), _prop("link", skip=True)]
+        self.config = SimpleNamespace(get=lambda: SimpleNamespace(properties=properties))
+
+    def iterator(self, include_vector=False):
+        return [SimpleNamespace(uuid=uuid, properties=props, vector={"default": vector})
+                for uuid, (props, vector) in self.objects.items()]
+
+
+def product(nombre, **fields):
+    return {"nombre": nombre, "categoria": "Sueño", "descripcion": f"{nombre} desc", "link": "a", **fields}
+
+
+def stored(item, **extra):
+    props = {**item, **extra}
+    props[FINGERPRINT_PROPERTY] = vector_fingerprint(props, FIELDS)
+    return props
+
+
+class PlanSyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.same = product("Melatonina")
+        self.price = product("Magnesio")
+        self.text = product("Zinc")
+        self.collection = FakeCollection({
+            catalogue_uuid("Melatonina"): (stored(self.same, image="m.png"), [0.1]),
+            catalogue_uuid("Magnesio"): (stored(self.price, image="g.png"), [0.2]),
+            catalogue_uuid("Zinc"): (stored(self.text, image="z.png"), [0.3]),
+            catalogue_uuid("Gone"): (stored(product("Gone")), [0.4]),
+            LEGACY_UUID: (stored(product("Hierro"), image="h.png"), [0.5]),
+        })
+        self.items = [
+            self.same,
+            {**self.price, "link": "b"},
+            {**self.text, "descripcion": "nueva"},
+            product("Hierro"),
+            product("Nuevo"),
+        ]
+
+    def test_plan(self):
+        plan = plan_sync(self.collection, self.items)
+        self.assertEqual(plan.unchanged, 1)
+        self.assertEqual(set(plan.inserts), {catalogue_uuid("Hierro"), catalogue_uuid("Nuevo")})
+        self.assertEqual(set(plan.updates), {catalogue_uuid("Magnesio"), catalogue_uuid("Zinc")})
+        self.assertEqual(set(plan.deletes), {catalogue_uuid("Gone"), LEGACY_UUID})
+
+    def test_updates_keep_fields_missing_from_the_sheet(self):
+        plan = plan_sync(self.collection, self.items)
+        self.assertEqual(plan.updates[catalogue_uuid("Magnesio")]["image"], "g.png")
+        self.assertEqual(plan.updates[catalogue_uuid("Zinc")]["image"], "z.png")
+        self.assertEqual(plan.updates[catalogue_uuid("Magnesio")]["link"], "b")
+
+    def test_vector_kept_only_when_vectorized_fields_are_unchanged(self):
+        plan = plan_sync(self.collection, self.items)
+        self.assertEqual(plan.vectors[catalogue_uuid("Magnesio")], [0.2])
+        self.assertNotIn(catalogue_uuid("Zinc"), plan.vectors)
+        self.assertNotIn(catalogue_uuid("Nuevo"), plan.vectors)
+
+    def test_legacy_object_moves_to_derived_uuid_with_its_fields(self):
+        plan = plan_sync(self.collection, self.items)
+        moved = plan.inserts[catalogue_uuid("Hierro")]
+        self.assertEqual(moved["image"], "h.png")
+        self.assertEqual(plan.vectors[catalogue_uuid("Hierro")], [0.5])
+        self.assertIn(LEGACY_UUID, plan.deletes)
+
+    def test_keep_missing(self):
+        plan = plan_sync(self.collection, self.items, delete_missing=False)
+        self.assertEqual(plan.deletes, [])
+        self.assertEqual(len(plan.inserts), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import random
+import unittest
+from app.geo import KDTree, haversine_km, valid_coordinates
+
+# (lat, lng, name) around Puerto Rico
+PHARMACIES = [
+    (18.0111, -66.6141, "Ponce"),
+    (18.0519, -66.5069, "Juana Díaz"),
+    (18.4655, -66.1057, "San Juan"),
+    (18.2013, -67.1397, "Mayagüez"),
+    (18.3866, -67.1854, "Aguadilla"),
+]
+
+
+class KDTreeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tree = KDTree(PHARMACIES)
+
+    def test_nearest_is_ordered_by_distance(self):
+        results = self.tree.nearest(18.02, -66.60, k=3)
+        self.assertEqual([name for _, name in results], ["Ponce", "Juana Díaz", "Mayagüez"])
+        self.assertLess(results[0][0], 2)
+
+    def test_k_larger_than_tree(self):
+        self.assertEqual(len(self.tree.nearest(18.2, -66.5, k=10)), len(PHARMACIES))
+        self.assertEqual(KDTree([]).nearest(18.2, -66.5), [])
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        points = [(rng.uniform(17.9, 18.5), rng.uniform(-67.3, -65.6), i) for i in range(500)]
+        tree = KDTree(points)
+        for _ in range(50):
+            lat, lng = rng.uniform(17.9, 18.5), rng.uniform(-67.3, -65.6)
+            expected = sorted(points, key=lambda p: haversine_km(lat, lng, p[0], p[1]))[:4]
+            self.assertEqual([i for _, i in tree.nearest(lat, lng, k=4)], [p[2] for p in expected])
+
+    def test_haversine_km(self):
+        # Ponce to San Juan is roughly 70 km in a straight line
+        self.assertAlmostEqual(haversine_km(18.0111, -66.6141, 18.4655, -66.1057), 73.5, delta=1.5)
+
+    def test_valid_coordinates(self):
+        self.assertTrue(valid_coordinates("18.2", -66.5))
+        self.assertFalse(valid_coordinates(95, 0))
+        self.assertFalse(valid_coordinates("abc", 0))
+        self.assertFalse(valid_coordinates(None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from app.matcher import OptionMatcher, edit_distance
+from utils import normalize_text
+
+MAIN_OPTIONS = [
+    "Catálogo de Productos 💊",
+    "Ayuda Personalizada de Suplementos 💡"
+]
+
+PUEBLOS = ["Ponce", "Juana Díaz", "San Juan", "San Sebastián", "Moca", "Mayagüez"]
+
+
+class OptionMatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.options = OptionMatcher(MAIN_OPTIONS, normalize_text)
+        self.pueblos = OptionMatcher(PUEBLOS, normalize_text)
+
+    def test_button_label_is_exact_match(self):
+        match = self.options.match("Catálogo de Productos 💊")
+        self.assertEqual(match.label, "Catálogo de Productos 💊")
+        self.assertEqual(match.method, "exact")
+
+    def test_accents_case_and_emoji_are_ignored(self):
+        match = self.pueblos.match("MAYAGUEZ")
+        self.assertEqual(match.label, "Mayagüez")
+        self.assertEqual(match.method, "exact")
+
+    def test_pueblo_inside_sentence(self):
+        match = self.pueblos.match("vivo en Juana Diaz")
+        self.assertEqual(match.label, "Juana Díaz")
+        self.assertEqual(match.method, "phrase")
+
+    def test_two_pueblos_in_one_message_are_ambiguous(self):
+        self.assertIsNone(self.pueblos.match("entre ponce y moca"))
+
+    def test_single_typo_in_short_name(self):
+        self.assertEqual(self.pueblos.match("mcoa").label, "Moca")
+        self.assertEqual(self.pueblos.match("pnoce").label, "Ponce")
+
+    def test_typo_in_option(self):
+        match = self.options.match("catalgo de productos")
+        self.assertEqual(match.label, "Catálogo de Productos 💊")
+        self.assertEqual(match.method, "fuzzy")
+
+    def test_free_text_falls_through(self):
+        self.assertIsNone(self.options.match("quiero algo para dormir mejor"))
+        self.assertIsNone(self.pueblos.match("no se"))
+
+    def test_edit_distance_counts_transpositions_once(self):
+        self.assertEqual(edit_distance("pnoce", "ponce"), 1)
+        self.assertEqual(edit_distance("kitten", "sitting"), 3)
+        self.assertEqual(edit_distance("", "abc"), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,13 @@
 from app.client import get_weaviate_client
+from app.persistent_cache import PersistentCache
+from app.matcher import get_matcher
+from app.embeddings import embed_concepts
+from app.catalogue_replica import search_replica
 import unicodedata
 import re
-from datetime import datetime
-from typing import List, Dict, Any, Union
+import time
+import hashlib
+from typing import List, Dict, Any, Optional, Union
 import os
 from dotenv import load_dotenv
 import requests
@@ -12,22 +17,78 @@ load_dotenv(".env.staging")
 HUGGINGFACE_API_TOKEN = os.getenv('HUGGINGFACE_API_TOKEN')
 API_URL = "https://api-inference.huggingface.co/models/joeddav/xlm-roberta-large-xnli"
 headers = {"Authorization": f"Bearer {HUGGINGFACE_API_TOKEN}"}
+CLASSIFIER_TIMEOUT = float(os.getenv("CLASSIFIER_TIMEOUT", "10"))
+
+# Remote classifications keyed on (normalized text, label set), kept across restarts
+classifier_cache = PersistentCache(
+    "classifier",
+    maxsize=int(os.getenv("CLASSIFIER_CACHE_SIZE", "2000")),
+    ttl=float(os.getenv("CLASSIFIER_CACHE_TTL", str(7 * 24 * 3600)))
+)
+classifier_stats = {
+    "local_matches": 0,
+    "exact_matches": 0,
+    "phrase_matches": 0,
+    "fuzzy_matches": 0,
+    "remote_calls": 0,
+    "remote_errors": 0
+}
+
+def _ranked(labels: List[str], best: str) -> Dict[str, Any]:
+    """Classifier-shaped result with `best` ranked first"""
+    others = [label for label in labels if label != best]
+    return {"labels": [best] + others, "scores": [1.0] + [0.0] * len(others)}
+
+def match_known_label(text: str, labels: List[str]) -> Optional[Dict[str, Any]]:
+    """Answer locally when the text is one of the labels, verbatim or nearly so"""
+    match = get_matcher(labels, normalize_text).match(text)
+    if match is None:
+        return None
+    classifier_stats["local_matches"] += 1
+    classifier_stats[f"{match.method}_matches"] += 1
+    return _ranked(labels, match.label)
+
+def classifier_cache_key(text: str, labels: List[str]) -> str:
+    raw = normalize_text(text) + "\x1f" + "\x1f".join(sorted(labels))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
 
 def query_classifier(text: str, labels: List[str]) -> Dict[str, Any]:
     """
-    Query the Hugging Face model through their Inference API
+    Classify text against candidate labels.
+    Option labels and pueblo names are resolved by the local matcher (see
+    app/matcher.py), earlier answers come from the cache, and only genuinely
+    free text reaches the Hugging Face Inference API.
     """
+    local = match_known_label(text, labels)
+    if local:
+        return local
+
+    key = classifier_cache_key(text, labels)
+    cached = classifier_cache.get(key)
+    if cached:
+        return cached
+
     try:
         payload = {
             "inputs": text,
             "parameters": {"candidate_labels": labels},
         }
-        response = requests.post(API_URL, headers=headers, json=payload)
-        return response.json()
+        classifier_stats["remote_calls"] += 1
+        response = requests.post(API_URL, headers=headers, json=payload, timeout=CLASSIFIER_TIMEOUT)
+        result = response.json()
+        if "labels" not in result:
+            # e.g. {"error": "Model ... is currently loading"}
+            raise ValueError(result.get("error", "unexpected classifier response"))
+        classifier_cache.set(key, result)
+        return result
     except Exception as e:
+        classifier_stats["remote_errors"] += 1
         print(f"❌ Error querying classifier: {str(e)}")
         return {"labels": labels, "scores": [1.0/len(labels)] * len(labels)}
 
+def get_classifier_stats() -> Dict[str, Any]:
+    return {**classifier_stats, "cache": classifier_cache.stats()}
+
 def normalize_text(text: str) -> str:
     """Normalize text by removing accents and special characters."""
     if not text:
@@ -37,19 +98,29 @@ def normalize_text(text: str) -> str:
     return text.lower().strip()
 
 def append_history(state: Dict[str, Any], sender: str, message: str) -> None:
-    """Append a message to the conversation history."""
-    history = state.get("history", [])
-    # Limit history to last 100 messages to prevent memory issues
-    if len(history) >= 100:
-        history = history[-99:]
-    
-    history.append({
-        "timestamp": datetime.utcnow().isoformat() + "Z",
-        "sender": sender,
-        "message": message,
-        "stage": state.get("stage", "unknown")
-    })
-    state["history"] = history
+    """
+    Buffer a message of the current turn as (epoch ms, sender, message, stage).
+    The buffer only lives for one request; the unit of work writes it to the
+    chat_messages transcript in a single batch when the turn is flushed.
+    """
+    state.setdefault("history", []).append(
+        (int(time.time() * 1000), sender, message, state.get("stage", "unknown"))
+    )
+
+def product_from_properties(properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a Supplements object's properties to the product dict the frontend expects"""
+    return {
+        "image": properties.get("image"),
+        "name": properties.get("nombre"),
+        "description": properties.get("descripcion"),
+        "price": properties.get("precio"),
+        "category": properties.get("categoria"),
+        "link": properties.get("link"),
+        "usage": properties.get("usage"),
+        "recommended_for": properties.get("recommended_for"),
+        "allergens": properties.get("allergens")
+    }
+
 
 def query_weaviate(concepts: Union[str, List[str]], client_instance: Any) -> List[Dict[str, Any]]:
     """
@@ -71,26 +142,29 @@ def query_weaviate(concepts: Union[str, List[str]], client_instance: Any) -> Lis
             concepts = [concepts]
             
         collection = client_instance.collections.get("Supplements")
-        response = collection.query.near_text(
-            query = concepts,
-            limit = 2
-        )
+        response = None
+        try:
+            # Reuse cached query vectors instead of having Weaviate embed the text again
+            query_vector = embed_concepts(concepts, client_instance)
+            # Answer from the in-memory catalogue when it is up to date
+            products = search_replica(query_vector, client_instance, limit = 2)
+            if products is not None:
+                return [product_from_properties(properties) for properties in products]
+            response = collection.query.near_vector(
+                near_vector = query_vector.tolist(),
+                limit = 2
+            )
+        except Exception as e:
+            print(f"⚠️ near_vector search failed, falling back to near_text: {str(e)}")
+
+        if response is None:
+            response = collection.query.near_text(
+                query = concepts,
+                limit = 2
+            )
 
         if response and response.objects:
-            return [
-                {
-                    "image": obj.properties.get("image"),
-                    "name": obj.properties.get("nombre"),
-                    "description": obj.properties.get("descripcion"),
-                    "price": obj.properties.get("precio"),
-                    "category": obj.properties.get("categoria"),
-                    "link": obj.properties.get("link"),
-                    "usage": obj.properties.get("usage"),
-                    "recommended_for": obj.properties.get("recommended_for"),
-                    "allergens": obj.properties.get("allergens")
-                }
-                for obj in response.objects
-            ]
+            return [product_from_properties(obj.properties) for obj in response.objects]
         
         return [] # No objects found
     
@@ -3,11 +3,11 @@ import pandas as pd
 import os
 from dotenv import load_dotenv
 import json
-import time
+import argparse
 import weaviate
 from weaviate.classes.config import Property, DataType, Configure
 from weaviate.classes.init import AdditionalConfig, Timeout, Auth
-from weaviate.util import generate_uuid5
+from app.catalogue_sync import sync_catalogue
 
 # Load environment variables
 load_dotenv()
@@ -109,33 +109,10 @@ def update_weaviate_schema(data):
         print(f"Collection '{collection_name}' created successfully!")
 
 
-def upload_data_to_weaviate(collection, data, max_retries=5, wait_time=30):
-    for item in data:
-        retries = 0
-        while retries < max_retries:
-            try:
-                print(f"Uploading item: {item['nombre']}")
-                # Generate a UUID based on a key property, e.g., "nombre"
-                object_uuid = generate_uuid5({"nombre": item["nombre"]})
-
-                if collection.data.exists(object_uuid):
-                    print(f"Object '{item['nombre']}' already exists. Skipping...")
-                else:
-                    print(f"Uploading new object: {item['nombre']}")
-                    collection.data.insert(item, uuid=object_uuid)
-                    print(f"Object '{item['nombre']}' uploaded successfully!")
-                break  # Exit retry loop if successful
-            except Exception as e:
-                error_message = str(e)
-                if "model is currently loading" in error_message:
-                    retries += 1
-                    print(f"Model is still loading. Retrying in {wait_time} seconds... (Attempt {retries}/{max_retries})")
-                    time.sleep(wait_time)
-                else:
-                    print(f"An unexpected error occurred: {e}")
-                    break  # Exit retry loop for non-retryable errors
-        else:
-            print(f"Failed to upload '{item['nombre']}' after {max_retries} retries. Skipping...")
+parser = argparse.ArgumentParser(description="Sync the Supplements collection with the Google Sheet")
+parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+parser.add_argument("--keep-missing", action="store_true", help="Don't delete products that are no longer in the sheet")
+args = parser.parse_args()
 
 try:
     # Fetch Google Sheets data
@@ -145,11 +122,9 @@ try:
     # Update schema
     update_weaviate_schema(json_data)
 
-    # Fetch the collection
-    collection = client.collections.get(collection_name)
-
-    # Upload data to Weaviate
-    upload_data_to_weaviate(collection, json_data)
+    # Insert new products, replace changed ones, delete removed ones
+    # (batched; the running app is told which objects changed)
+    sync_catalogue(client, json_data, delete_missing=not args.keep_missing, dry_run=args.dry_run)
 
 except Exception as e:
     print(f"An error occurred: {e}")